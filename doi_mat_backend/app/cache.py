@@ -0,0 +1,155 @@
+# app/cache.py
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+def model_fingerprint(model_path: str, **settings) -> str:
+    """
+    Dấu vân tay của model + cấu hình ảnh hưởng tới kết quả (vd. input_profile, quantize, nms_mode):
+    đường dẫn, kích thước và thời điểm sửa file trọng số. Đổi trọng số hoặc cấu hình → khoá cache khác,
+    kết quả cũ trên đĩa không bị dùng lại sau khi restart.
+    """
+    try:
+        stat = os.stat(model_path)
+        identity = [os.path.abspath(model_path), stat.st_size, stat.st_mtime_ns]
+    except OSError:
+        identity = [model_path]
+    payload = json.dumps([identity, sorted(settings.items())], default=str)
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=6).hexdigest()
+
+
+class DetectionCache:
+    """
+    ✅ Cache kết quả nhận diện theo nội dung ảnh (hash bytes + ngưỡng confidence).
+    - Bộ nhớ có giới hạn (số entry + tổng byte), loại bỏ theo LRU và TTL.
+    - Tầng đĩa tuỳ chọn (`disk_dir`) lưu JSON, dùng lại sau khi bị đẩy khỏi RAM hoặc khi restart.
+    - Đếm hit/miss trong `stats`.
+    - `namespace` (vd. model_fingerprint) được ghép vào mọi khoá → đổi model/cấu hình thì không trúng kết quả cũ.
+    """
+
+    def __init__(self, max_entries: int = 256, max_bytes: int = 16 * 1024 * 1024, ttl_seconds: float = 300,
+                 disk_dir: str = None, max_disk_entries: int = 4096, namespace: str = ""):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl_seconds
+        self.disk_dir = disk_dir
+        self.max_disk_entries = max_disk_entries
+        self.namespace = namespace
+        self.stats = {"hits": 0, "disk_hits": 0, "misses": 0, "evictions": 0, "expired": 0}
+        self._entries = OrderedDict()  # key -> (thời điểm lưu, kích thước, kết quả)
+        self._bytes = 0
+        self._disk_writes = 0
+        self._lock = threading.Lock()
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def make_key(self, image_bytes: bytes, confidence_threshold: float) -> str:
+        # blake2b nhanh hơn sha256 và đủ an toàn để tránh trùng khoá
+        digest = hashlib.blake2b(image_bytes, digest_size=16).hexdigest()
+        key = f"{digest}_{confidence_threshold:.4f}"
+        return f"{self.namespace}_{key}" if self.namespace else key
+
+    def get(self, key: str):
+        """Trả về kết quả đã cache hoặc None."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                stored_at, size, result = entry
+                if now - stored_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.stats["hits"] += 1
+                    return result
+                self._remove(key)
+                self.stats["expired"] += 1
+
+        stored_at, result = self._disk_get(key, now)
+        with self._lock:
+            if result is None:
+                self.stats["misses"] += 1
+                return None
+            self.stats["disk_hits"] += 1
+        # Giữ nguyên thời điểm lưu trên đĩa để TTL không bị kéo dài
+        self._memory_put(key, result, json.dumps(result), stored_at)
+        return result
+
+    def put(self, key: str, result):
+        """Lưu kết quả (bỏ qua kết quả lỗi None)."""
+        if result is None:
+            return
+        payload = json.dumps(result)
+        now = time.time()
+        self._memory_put(key, result, payload, now)
+        self._disk_put(key, payload)
+
+    def summary(self):
+        with self._lock:
+            return {**self.stats, "entries": len(self._entries), "bytes": self._bytes}
+
+    # --- Tầng RAM ---
+    def _memory_put(self, key, result, payload, now):
+        size = len(payload)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (now, size, result)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.stats["evictions"] += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    # --- Tầng đĩa ---
+    def _disk_path(self, key):
+        return os.path.join(self.disk_dir, f"{key}.json")
+
+    def _disk_get(self, key, now):
+        if not self.disk_dir:
+            return None, None
+        path = self._disk_path(key)
+        try:
+            stored_at = os.path.getmtime(path)
+            if now - stored_at > self.ttl:
+                os.remove(path)
+                return None, None
+            with open(path, "r", encoding="utf-8") as f:
+                return stored_at, json.load(f)
+        except (OSError, ValueError):
+            return None, None
+
+    def _disk_put(self, key, payload):
+        if not self.disk_dir:
+            return
+        try:
+            tmp_path = self._disk_path(key) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(payload)
+            os.replace(tmp_path, self._disk_path(key))
+            self._disk_writes += 1
+            # Quét thư mục định kỳ thay vì mỗi lần ghi
+            if self._disk_writes % 64 == 0:
+                self._prune_disk()
+        except OSError as e:
+            print(f"⚠️ Cache disk write error: {e}")
+
+    def _prune_disk(self):
+        """Giữ số file trên đĩa không vượt quá max_disk_entries (xoá file cũ nhất)."""
+        files = [entry for entry in os.scandir(self.disk_dir) if entry.name.endswith(".json")]
+        if len(files) <= self.max_disk_entries:
+            return
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in files[:len(files) - self.max_disk_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
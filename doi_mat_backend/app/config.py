@@ -0,0 +1,74 @@
+# app/config.py
+import os
+
+# Đường dẫn trọng số model (có thể ghi đè bằng biến môi trường)
+MODEL_PATH = os.getenv("MODEL_PATH", "fasterrcnn_mobilenet_weights.pth")
+
+# --- Micro-batching cho /predict và /describe ---
+# Số ảnh tối đa trong 1 lần forward
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "8"))
+# Thời gian chờ tối đa (ms) để gom thêm ảnh vào batch (nên để 5–20 ms)
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "10"))
+
+# --- Executor suy luận (tách model khỏi event loop) ---
+# "thread": luồng trong cùng process, dùng chung 1 model | "process": mỗi process 1 bản model
+INFERENCE_MODE = os.getenv("INFERENCE_MODE", "thread")
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "1"))
+# Chế độ "process": load trọng số 1 lần rồi chia sẻ read-only cho các replica qua shared memory
+INFERENCE_SHARE_WEIGHTS = os.getenv("INFERENCE_SHARE_WEIGHTS", "1") == "1"
+# Số luồng torch cho mỗi worker (0 = chia đều số core cho các worker)
+INFERENCE_THREADS_PER_WORKER = int(os.getenv("INFERENCE_THREADS_PER_WORKER", "0"))
+# Số request tối đa đang chờ + đang chạy; vượt quá → 503
+INFERENCE_MAX_PENDING = int(os.getenv("INFERENCE_MAX_PENDING", "32"))
+# Chế độ "process": request chờ kết quả quá số giây này → replica bị coi là treo, bị dừng và request nhận lỗi (0 = tắt)
+INFERENCE_RESULT_TIMEOUT = float(os.getenv("INFERENCE_RESULT_TIMEOUT", "60"))
+# Lượng tử hoá cho CPU: "none" | "dynamic" (INT8 cho các lớp Linear, xem benchmarks/bench_quantization.py)
+INFERENCE_QUANTIZE = os.getenv("INFERENCE_QUANTIZE", "none")
+# Load model + chạy thử ngay khi FastAPI khởi động thay vì đợi request đầu tiên
+# (MODEL_PATH có thể là file TorchScript từ app/export_model.py để load nhanh hơn)
+MODEL_WARMUP = os.getenv("MODEL_WARMUP", "0") == "1"
+# Kích thước ảnh đưa vào model cho /predict, /describe: "accuracy" (800 px) | "realtime" (320 px).
+# Ảnh JPEG lớn được thu nhỏ ngay lúc giải mã, box trả về theo toạ độ ảnh gốc. Không áp dụng cho model TorchScript
+# (kích thước đầu vào đã cố định lúc export, xem app/export_model.py)
+PREDICT_INPUT_PROFILE = os.getenv("PREDICT_INPUT_PROFILE", "accuracy")
+# NMS thêm sau model: "class_agnostic" (mặc định, box trùng giữa các lớp chỉ giữ 1) | "per_class" | "none"
+INFERENCE_NMS_MODE = os.getenv("INFERENCE_NMS_MODE", "class_agnostic")
+
+# --- Cache kết quả nhận diện theo nội dung ảnh ---
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "256"))
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+# Thư mục cache trên đĩa (để trống = tắt)
+CACHE_DISK_DIR = os.getenv("CACHE_DISK_DIR", "")
+
+# --- Upload video cho /analyze_video ---
+# Dung lượng tối đa khi phải ghi file tạm (MP4 có 'moov' ở cuối file)
+VIDEO_MAX_UPLOAD_BYTES = int(os.getenv("VIDEO_MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+# Số byte đầu tiên đọc để quyết định giải mã trực tiếp (streaming) hay phải ghi file tạm
+VIDEO_SNIFF_BYTES = int(os.getenv("VIDEO_SNIFF_BYTES", str(1024 * 1024)))
+
+# --- Job phân tích video chạy nền (/jobs) ---
+VIDEO_JOB_MAX_CONCURRENT = int(os.getenv("VIDEO_JOB_MAX_CONCURRENT", "2"))
+VIDEO_JOB_MAX_QUEUED = int(os.getenv("VIDEO_JOB_MAX_QUEUED", "16"))
+# Kết quả job được giữ lại bao lâu (giây) sau khi xong
+VIDEO_JOB_RESULT_TTL = float(os.getenv("VIDEO_JOB_RESULT_TTL", "600"))
+
+# --- Lấy mẫu frame khi phân tích video ---
+# "per_second" | "stride" | "keyframes"
+VIDEO_SAMPLING_MODE = os.getenv("VIDEO_SAMPLING_MODE", "per_second")
+VIDEO_SAMPLES_PER_SECOND = float(os.getenv("VIDEO_SAMPLES_PER_SECOND", "1.0"))
+# Dùng cho chế độ "stride": cứ N frame lấy 1
+VIDEO_SAMPLING_STRIDE = int(os.getenv("VIDEO_SAMPLING_STRIDE", "30"))
+# Bỏ qua frame không dùng: "auto" | "grab" | "seek"
+VIDEO_SKIP_STRATEGY = os.getenv("VIDEO_SKIP_STRATEGY", "auto")
+# Số frame chạy chung 1 lần forward (frame của batch sau được giải mã song song)
+VIDEO_BATCH_SIZE = int(os.getenv("VIDEO_BATCH_SIZE", "4"))
+# Ghép track với detection: "greedy" | "hungarian" (cần scipy)
+VIDEO_TRACKER_ASSIGNMENT = os.getenv("VIDEO_TRACKER_ASSIGNMENT", "greedy")
+# Mô hình chuyển động của tracker: "none" | "kalman". Theo benchmarks/bench_motion (1080p, 30 fps), kalman chỉ giữ
+# số đối tượng đếm được sát thực tế (lệch ≤ 11%) ở 1–2 mẫu/s khi vật đi chậm (≤ ~3 px/frame ≈ 90 px/s);
+# từ ~6 px/frame trở lên vẫn đếm thừa 2–3 lần ở mọi mức dưới 10 mẫu/s (ít hơn none) → bật kalman không phải
+# lý do để giảm VIDEO_SAMPLES_PER_SECOND khi video có vật di chuyển nhanh.
+VIDEO_TRACKER_MOTION = os.getenv("VIDEO_TRACKER_MOTION", "none")
+# Kích thước frame đưa vào model khi phân tích video: "accuracy" | "realtime"
+VIDEO_INPUT_PROFILE = os.getenv("VIDEO_INPUT_PROFILE", "accuracy")
@@ -0,0 +1,296 @@
+# app/executor.py
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing import connection
+
+import torch
+import torch.multiprocessing
+
+from doi_mat_core.inference import is_torchscript_file
+from app.services import ObjectDetectionService, BatchingScheduler, InferenceQueueFull, collect_batch
+
+
+def threads_per_worker(num_workers: int, requested: int = 0) -> int:
+    """Chia số core cho các worker để các luồng intra-op của torch không tranh nhau."""
+    if requested > 0:
+        return requested
+    return max(1, (os.cpu_count() or 1) // max(1, num_workers))
+
+
+def load_shared_state_dict(model_path: str):
+    """Đọc trọng số 1 lần ở process cha và đưa vào shared memory để các replica dùng chung (read-only)."""
+    state_dict = torch.load(model_path, map_location="cpu")
+    for tensor in state_dict.values():
+        tensor.share_memory_()
+    return state_dict
+
+
+def _process_worker(replica_id, model_path, state_dict, use_half, quantize, input_profile, nms_mode, warmup,
+                    num_threads, max_batch_size, max_wait, in_queue, results):
+    """
+    Chạy trong process con: 1 replica model, gom batch từ hàng đợi riêng, trả kết quả qua pipe riêng `results`
+    (chỉ replica này ghi → replica khác bị kill giữa chừng không chặn được đường trả kết quả của nó).
+    """
+    torch.set_num_threads(num_threads)
+    try:
+        service = ObjectDetectionService(model_path=model_path, use_half=use_half, state_dict=state_dict,
+                                         quantize=quantize, input_profile=input_profile, nms_mode=nms_mode)
+        if warmup:
+            service.engine.warm_up()
+    except Exception as e:
+        results.send(("error", repr(e), None))
+        return
+    results.send(("ready", os.getpid(), None))
+    while True:
+        batch = collect_batch(in_queue, max_batch_size, max_wait)
+        if batch is None:
+            break
+        try:
+            outputs = service.predict_batch(
+                [image_bytes for _, image_bytes, _ in batch],
+                [threshold for _, _, threshold in batch]
+            )
+            for (request_id, _, _), result in zip(batch, outputs):
+                results.send((request_id, result, None))
+        except Exception as e:
+            for request_id, _, _ in batch:
+                results.send((request_id, None, repr(e)))
+
+
+class ProcessInferenceExecutor:
+    """
+    ✅ Pool N replica model, mỗi replica 1 process con với hàng đợi vào và pipe kết quả riêng.
+    - Trọng số được load 1 lần ở process cha và chia sẻ read-only qua shared memory
+      (`share_weights=False` → mỗi process tự đọc file, dùng để so sánh bộ nhớ).
+    - Request được gửi tới replica đang ít việc nhất (least-loaded).
+    - `max_pending` giới hạn tổng số request đang xử lý.
+    - Replica chết (OOM kill, lỗi import...) → request đang chờ ở replica đó nhận lỗi ngay,
+      replica bị loại khỏi việc chia request; hết replica sống → submit() báo lỗi.
+    - `result_timeout` (giây, 0 = tắt): request chờ quá lâu → coi replica giữ nó là treo, dừng replica
+      và trả lỗi cho mọi request nó đang giữ thay vì chờ mãi.
+    """
+
+    # Chu kỳ kiểm tra process con còn sống / request quá hạn khi chờ kết quả (giây)
+    LIVENESS_INTERVAL = 0.5
+
+    def __init__(self, model_path: str, num_workers: int = 2, max_pending: int = 32,
+                 max_batch_size: int = 8, max_wait_ms: float = 10.0, num_threads: int = 0,
+                 use_half: bool = True, share_weights: bool = True, quantize: str = "none",
+                 input_profile: str = "accuracy", nms_mode: str = "class_agnostic", warmup: bool = False,
+                 result_timeout: float = 60.0):
+        # torch.multiprocessing: tensor shared memory được truyền sang process con qua handle, không copy
+        ctx = torch.multiprocessing.get_context("spawn")
+        self.num_workers = max(1, int(num_workers))
+        self.max_pending = max_pending
+        self.result_timeout = max(0.0, result_timeout)
+        self.stats = {"rejected": 0, "timed_out": 0}
+        self.replica_pids = [None] * self.num_workers
+        self._alive = [True] * self.num_workers
+        self._loads = [0] * self.num_workers
+        self._in_queues = [ctx.Queue() for _ in range(self.num_workers)]
+        # Mỗi replica 1 pipe kết quả riêng: hàng đợi chung có lock ghi dùng chung giữa các process,
+        # replica bị kill lúc đang giữ lock sẽ chặn mọi replica còn lại
+        pipes = [ctx.Pipe(duplex=False) for _ in range(self.num_workers)]
+        self._result_readers = [reader for reader, _ in pipes]
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._closed = False
+
+        # File TorchScript không có state_dict để chia sẻ, mỗi replica tự torch.jit.load (nhanh)
+        share_weights = share_weights and not is_torchscript_file(model_path)
+        state_dict = load_shared_state_dict(model_path) if share_weights else None
+        num_threads = threads_per_worker(self.num_workers, num_threads)
+        self._processes = [
+            ctx.Process(
+                target=_process_worker,
+                args=(i, model_path, state_dict, use_half, quantize, input_profile, nms_mode, warmup, num_threads,
+                      max(1, int(max_batch_size)), max(0.0, max_wait_ms) / 1000.0, self._in_queues[i], pipes[i][1]),
+                name=f"inference-replica-{i}",
+                daemon=True
+            )
+            for i in range(self.num_workers)
+        ]
+        for process in self._processes:
+            process.start()
+        # Chỉ process con giữ đầu ghi → replica chết thì đầu đọc ở đây gặp EOF
+        for _, writer in pipes:
+            writer.close()
+        # Chờ tất cả replica load xong model (replica chết giữa chừng → báo lỗi thay vì chờ mãi)
+        waiting = {reader: i for i, reader in enumerate(self._result_readers)}
+        while waiting:
+            for reader in connection.wait(list(waiting), timeout=self.LIVENESS_INTERVAL):
+                replica_id = waiting.pop(reader)
+                try:
+                    status, detail, _ = reader.recv()
+                except (EOFError, OSError):
+                    self._processes[replica_id].join(self.LIVENESS_INTERVAL)
+                    self._shutdown_workers()
+                    raise RuntimeError(f"Inference replica {replica_id} đã thoát khi khởi tạo "
+                                       f"(exit code {self._processes[replica_id].exitcode})")
+                if status == "error":
+                    self._shutdown_workers()
+                    raise RuntimeError(f"Không khởi tạo được inference replica {replica_id}: {detail}")
+                self.replica_pids[replica_id] = detail
+        # Trọng số trong shared memory (None nếu không chia sẻ): process cha dùng lại cho model phân tích video
+        # (app/main.py) thay vì load thêm 1 bản riêng
+        self.shared_state_dict = state_dict
+        self._collector = threading.Thread(target=self._collect_results, name="inference-results", daemon=True)
+        self._collector.start()
+        print(f"✅ {self.num_workers} inference replica(s) ready | torch threads/replica = {num_threads} "
+              f"| shared weights = {share_weights}"
+              + (" (trừ Linear INT8: mỗi replica 1 bản riêng)" if share_weights and quantize == "dynamic" else ""))
+
+    @property
+    def loads(self):
+        """Số request đang xử lý trên từng replica."""
+        with self._lock:
+            return list(self._loads)
+
+    def submit(self, image_bytes: bytes, confidence_threshold: float = 0.5) -> Future:
+        if self._closed:
+            raise RuntimeError("ProcessInferenceExecutor đã đóng.")
+        future = Future()
+        with self._lock:
+            if self.max_pending > 0 and len(self._pending) >= self.max_pending:
+                self.stats["rejected"] += 1
+                raise InferenceQueueFull("Hàng đợi suy luận đã đầy.")
+            alive = [i for i in range(self.num_workers) if self._alive[i]]
+            if not alive:
+                raise RuntimeError("Không còn inference replica nào đang chạy.")
+            request_id = next(self._ids)
+            replica_id = min(alive, key=self._loads.__getitem__)
+            self._loads[replica_id] += 1
+            deadline = time.monotonic() + self.result_timeout if self.result_timeout > 0 else None
+            self._pending[request_id] = (future, replica_id, deadline)
+        self._in_queues[replica_id].put((request_id, image_bytes, confidence_threshold))
+        return future
+
+    def _collect_results(self):
+        # Dừng theo cờ _closed; chờ trên pipe của các replica còn sống (EOF = replica đã thoát)
+        while not self._closed:
+            readers = {self._result_readers[i]: i for i in range(self.num_workers) if self._alive[i]}
+            for reader in connection.wait(list(readers), timeout=self.LIVENESS_INTERVAL):
+                self._receive(readers[reader])
+            self._check_replicas()
+            self._expire_requests()
+
+    def _receive(self, replica_id):
+        """Đọc 1 kết quả từ pipe của replica và hoàn tất future tương ứng; EOF → replica đã thoát."""
+        try:
+            request_id, result, error = self._result_readers[replica_id].recv()
+        except (EOFError, OSError):
+            self._fail_replica(replica_id, f"Inference replica {replica_id} đã thoát.")
+            return
+        with self._lock:
+            future, _, _ = self._pending.pop(request_id, (None, None, None))
+            if future is not None:
+                self._loads[replica_id] -= 1
+        if future is None or not future.set_running_or_notify_cancel():
+            return
+        if error is not None:
+            future.set_exception(RuntimeError(error))
+        else:
+            future.set_result(result)
+
+    def _check_replicas(self):
+        """Replica đã chết mà pipe chưa báo EOF: nhận nốt kết quả còn trong pipe rồi loại replica."""
+        for replica_id, process in enumerate(self._processes):
+            if not self._alive[replica_id] or process.is_alive() or self._closed:
+                continue
+            reader = self._result_readers[replica_id]
+            while self._alive[replica_id] and reader.poll():
+                self._receive(replica_id)
+            self._fail_replica(replica_id, f"Inference replica {replica_id} đã thoát.")
+
+    def _expire_requests(self):
+        """Request quá result_timeout → replica giữ nó bị coi là treo: dừng process, trả lỗi cho các request của nó."""
+        if self.result_timeout <= 0 or self._closed:
+            return
+        now = time.monotonic()
+        with self._lock:
+            stuck = {owner for _, owner, deadline in self._pending.values() if deadline is not None and deadline < now}
+        for replica_id in stuck:
+            if not self._alive[replica_id]:
+                continue
+            self.stats["timed_out"] += 1
+            self._processes[replica_id].kill()
+            self._fail_replica(replica_id, f"Inference replica {replica_id} không trả kết quả sau "
+                                           f"{self.result_timeout:g}s.")
+
+    def _fail_replica(self, replica_id, reason):
+        """Loại replica khỏi việc chia request và trả lỗi `reason` cho các request nó đang giữ."""
+        with self._lock:
+            if not self._alive[replica_id]:
+                return
+            self._alive[replica_id] = False
+            orphaned = [request_id for request_id, (_, owner, _) in self._pending.items() if owner == replica_id]
+            futures = [self._pending.pop(request_id)[0] for request_id in orphaned]
+            self._loads[replica_id] = 0
+        self._in_queues[replica_id].cancel_join_thread()
+        process = self._processes[replica_id]
+        process.join(self.LIVENESS_INTERVAL)
+        print(f"❌ {reason} (pid {process.pid}, exit code {process.exitcode}) → huỷ {len(futures)} request đang chờ")
+        for future in futures:
+            if future.set_running_or_notify_cancel():
+                future.set_exception(RuntimeError(reason))
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._shutdown_workers()
+        self._collector.join()
+        for reader in self._result_readers:
+            reader.close()
+
+    def _shutdown_workers(self, timeout: float = 10.0):
+        for in_queue in self._in_queues:
+            in_queue.put(None)
+        for process in self._processes:
+            process.join(timeout)
+            if process.is_alive():
+                process.terminate()
+                process.join()
+        # Không còn process nào đọc hàng đợi: dữ liệu chưa gửi (vd. của replica đã chết) bỏ đi,
+        # để lúc thoát không bị treo chờ ghi vào pipe đầy
+        for in_queue in self._in_queues:
+            in_queue.cancel_join_thread()
+
+
+def create_inference_executor(mode: str, model_path: str, num_workers: int = 1, max_pending: int = 32,
+                              max_batch_size: int = 8, max_wait_ms: float = 10.0, num_threads: int = 0,
+                              service_factory=None, share_weights: bool = True, quantize: str = "none",
+                              input_profile: str = "accuracy", nms_mode: str = "class_agnostic",
+                              warmup: bool = False, result_timeout: float = 60.0):
+    """
+    Tạo executor suy luận theo cấu hình:
+    - "thread": các luồng trong process hiện tại dùng chung 1 model (service_factory()).
+    - "process": mỗi process con 1 replica, trọng số dùng chung qua shared memory;
+      `result_timeout`: thời gian chờ kết quả tối đa trước khi coi replica là treo.
+    """
+    if mode == "process":
+        return ProcessInferenceExecutor(
+            model_path, num_workers=num_workers, max_pending=max_pending,
+            max_batch_size=max_batch_size, max_wait_ms=max_wait_ms, num_threads=num_threads,
+            share_weights=share_weights, quantize=quantize, input_profile=input_profile, nms_mode=nms_mode,
+            warmup=warmup, result_timeout=result_timeout
+        )
+    if mode != "thread":
+        raise ValueError(f"INFERENCE_MODE không hợp lệ: {mode}")
+
+    # Số luồng intra-op là cấu hình chung của process: mỗi luồng worker chạy model với
+    # số luồng này, nên chia core cho num_workers để tổng không vượt quá số core.
+    torch.set_num_threads(threads_per_worker(num_workers, num_threads))
+    service = service_factory() if service_factory else ObjectDetectionService(
+        model_path=model_path, quantize=quantize, input_profile=input_profile, nms_mode=nms_mode
+    )
+    if warmup:
+        service.engine.warm_up()
+    return BatchingScheduler(
+        service, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms,
+        num_workers=num_workers, max_pending=max_pending
+    )
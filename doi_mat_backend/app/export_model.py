@@ -0,0 +1,44 @@
+# app/export_model.py
+"""
+Export trọng số .pth thành file TorchScript đã freeze để server khởi động nhanh:
+MODEL_PATH (backend HTTP) hoặc đường dẫn model của udp_server.py trỏ thẳng tới file này.
+--quantize dynamic: lượng tử hoá INT8 trước khi export (chỉ dùng cho CPU).
+Artifact giữ kích thước đầu vào mặc định của model (800/1333): PREDICT_INPUT_PROFILE, VIDEO_INPUT_PROFILE,
+UDP_INPUT_PROFILE không áp dụng cho file TorchScript.
+
+Chạy từ thư mục doi_mat_backend:
+    python -m app.export_model --weights fasterrcnn_mobilenet_weights.pth --output fasterrcnn_mobilenet.ts
+"""
+import argparse
+import time
+
+import torch
+
+from doi_mat_core.inference import InferenceEngine, QUANTIZE_MODES, export_torchscript
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="fasterrcnn_mobilenet_weights.pth")
+    parser.add_argument("--output", default="fasterrcnn_mobilenet.ts")
+    parser.add_argument("--quantize", choices=QUANTIZE_MODES, default="none")
+    parser.add_argument("--device", default="cpu", help="device của artifact (cpu / cuda)")
+    parser.add_argument("--check-image", default="app/img_test/3.jpg", help="ảnh dùng để so kết quả sau export")
+    args = parser.parse_args()
+
+    engine = InferenceEngine(args.weights, use_half=False, device=args.device, quantize=args.quantize)
+    started_at = time.perf_counter()
+    export_torchscript(engine.model, args.output)
+    print(f"✅ Đã export TorchScript → {args.output} ({time.perf_counter() - started_at:.1f}s)")
+
+    # Kiểm tra artifact cho kết quả giống model gốc
+    exported = InferenceEngine(args.output, use_half=False, device=args.device)
+    image = engine.preprocess(open(args.check_image, "rb").read())
+    expected = engine.forward([image])[0]
+    actual = exported.forward([image])[0]
+    same = all(torch.allclose(expected[key].float(), actual[key].float(), atol=1e-4) for key in ("boxes", "scores", "labels"))
+    print(f"{'✅' if same else '⚠️'} Kết quả trên {args.check_image}: {len(actual['boxes'])} box, giống model gốc = {same}")
+
+
+if __name__ == "__main__":
+    main()
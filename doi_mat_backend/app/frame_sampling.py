@@ -0,0 +1,290 @@
+# app/frame_sampling.py
+import os
+import queue
+import stat
+import threading
+
+import cv2
+import numpy as np
+import torch
+
+SAMPLING_MODES = ("per_second", "stride", "keyframes")
+SKIP_STRATEGIES = ("auto", "grab", "seek")
+
+
+def is_seekable_source(video_path: str) -> bool:
+    """File thường thì seek được; FIFO (upload đang stream) chỉ đọc tuần tự."""
+    try:
+        return stat.S_ISREG(os.stat(video_path).st_mode)
+    except OSError:
+        return False
+
+
+def find_keyframes(video_path: str):
+    """
+    Tìm chỉ số (0-based) các keyframe bằng cách đọc packet thô (CAP_PROP_FORMAT = -1):
+    chỉ demux, không giải mã nên rất nhanh. Trả về [] nếu backend không hỗ trợ.
+    """
+    cap = cv2.VideoCapture(video_path, cv2.CAP_FFMPEG)
+    keyframes = []
+    try:
+        if not cap.isOpened() or not cap.set(cv2.CAP_PROP_FORMAT, -1):
+            return []
+        index = 0
+        while cap.grab():
+            if cap.get(cv2.CAP_PROP_LRF_HAS_KEY_FRAME):
+                keyframes.append(index)
+            index += 1
+    finally:
+        cap.release()
+    return keyframes
+
+
+class FrameSampler:
+    """
+    ✅ Chỉ giải mã + chuyển màu những frame cần dùng thay vì cap.read() mọi frame.
+
+    Chế độ lấy mẫu (`mode`):
+    - "per_second": `samples_per_second` frame mỗi giây (mặc định 1, giống hành vi cũ).
+    - "stride": cứ `stride` frame lấy 1.
+    - "keyframes": chỉ lấy các keyframe (cần file seek được; với FIFO thì quay về "per_second").
+
+    Cách bỏ qua frame không dùng (`skip`):
+    - "grab": cap.grab() — vẫn giải mã nhưng bỏ bước chuyển sang BGR và copy ra numpy.
+    - "seek": nhảy bằng CAP_PROP_POS_FRAMES — OpenCV giải mã lại từ keyframe đứng trước,
+      nên chỉ có lợi khi khoảng cách keyframe (GOP) nhỏ hơn bước lấy mẫu.
+    - "auto": "seek" nếu file seek được và (lấy keyframe hoặc GOP < bước lấy mẫu), ngược lại "grab".
+
+    Lặp qua sampler trả về (frame_number, frame_bgr) với frame_number đánh số từ 1
+    như `frame_count` trong process_video_for_quiz.
+    `reuse_frames=True`: OpenCV giải mã mọi frame vào cùng 1 mảng BGR → frame chỉ hợp lệ
+    tới lần lặp kế tiếp (bên dùng phải chuyển/copy ngay, vd. FrameBufferPool).
+    """
+
+    def __init__(self, cap, video_path: str, mode: str = "per_second", samples_per_second: float = 1.0,
+                 stride: int = None, skip: str = "auto", reuse_frames: bool = False):
+        if mode not in SAMPLING_MODES:
+            raise ValueError(f"Chế độ lấy mẫu không hợp lệ: {mode}")
+        if skip not in SKIP_STRATEGIES:
+            raise ValueError(f"Cách bỏ qua frame không hợp lệ: {skip}")
+        self.cap = cap
+        self.reuse_frames = reuse_frames
+        self.fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+        self.total_frames = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+        seekable = is_seekable_source(video_path)
+
+        self.keyframes = None
+        if mode == "keyframes" and not seekable:
+            print("⚠️ Nguồn video không seek được → dùng per_second thay cho keyframes")
+            mode = "per_second"
+        if mode == "keyframes" or (skip == "auto" and seekable):
+            self.keyframes = find_keyframes(video_path)
+        if mode == "keyframes" and not self.keyframes:
+            mode = "per_second"
+        self.mode = mode
+
+        if mode == "stride":
+            self.stride = max(1, int(stride or 1))
+        else:
+            self.stride = max(1, int(self.fps / max(samples_per_second, 1e-6)))
+
+        if skip == "auto":
+            # Seek tới chính keyframe thì không phải giải mã lại các frame phía trước
+            skip = "seek" if seekable and (mode == "keyframes" or self._gop() < self.stride) else "grab"
+        elif skip == "seek" and not seekable:
+            skip = "grab"
+        self.skip = skip
+
+    def _gop(self):
+        """Khoảng cách trung bình giữa các keyframe (số frame)."""
+        if not self.keyframes or len(self.keyframes) < 2:
+            return self.total_frames or float("inf")
+        return float(np.mean(np.diff(self.keyframes)))
+
+    def targets(self):
+        """Chỉ số frame (0-based) cần lấy, tăng dần (None nếu không biết tổng số frame, vd. FIFO)."""
+        if self.mode == "keyframes":
+            return list(self.keyframes)
+        # Giống frame_count % frame_skip == 0 với frame_count đánh số từ 1
+        if self.total_frames <= 0:
+            return None
+        return list(range(self.stride - 1, self.total_frames, self.stride))
+
+    def __iter__(self):
+        if self.skip == "seek":
+            targets = self.targets()
+            if targets is not None:
+                return self._iter_seek(targets)
+        return self._iter_grab()
+
+    def _iter_grab(self):
+        keyframes = set(self.keyframes) if self.mode == "keyframes" else None
+        buffer = None
+        index = -1
+        while self.cap.grab():
+            index += 1
+            if keyframes is not None:
+                if index not in keyframes:
+                    continue
+            elif (index + 1) % self.stride != 0:
+                continue
+            ok, frame = self.cap.retrieve(buffer)
+            if not ok:
+                break
+            if self.reuse_frames:
+                buffer = frame
+            yield index + 1, frame
+
+    def _iter_seek(self, targets):
+        buffer = None
+        position = 0
+        for index in targets:
+            if index != position:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ok, frame = self.cap.read(buffer)
+            if not ok:
+                break
+            if self.reuse_frames:
+                buffer = frame
+            position = index + 1
+            yield index + 1, frame
+
+
+class FrameBuffer:
+    """
+    1 bộ buffer dựng sẵn cho 1 frame: `resized` (BGR đã thu nhỏ, nếu có `target`) và `rgb` (H, W, 3) uint8.
+    `tensor` là view (3, H, W) của `rgb` (không copy) — InferenceEngine nhận thẳng tensor uint8
+    (chuyển float + normalize nằm trong transform của model).
+    """
+
+    def __init__(self, target=None, pin_memory: bool = False):
+        self.target = target
+        self.pin_memory = pin_memory
+        self.resized = None
+        self.rgb = None
+        self.tensor = None
+
+    def _allocate(self, height: int, width: int):
+        storage = torch.empty((height, width, 3), dtype=torch.uint8, pin_memory=self.pin_memory)
+        self.rgb = storage.numpy()
+        self.tensor = storage.permute(2, 0, 1)
+
+    def load(self, frame_bgr):
+        """Thu nhỏ (nếu cần) + BGR → RGB ghi thẳng vào buffer có sẵn, trả về self."""
+        if self.target is not None:
+            width, height = self.target
+            if self.resized is None:
+                self.resized = np.empty((height, width, 3), dtype=np.uint8)
+            frame_bgr = cv2.resize(frame_bgr, self.target, dst=self.resized, interpolation=cv2.INTER_AREA)
+        if self.rgb is None or self.rgb.shape != frame_bgr.shape:
+            self._allocate(*frame_bgr.shape[:2])
+        cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB, dst=self.rgb)
+        return self
+
+
+class FrameBufferPool:
+    """
+    ✅ Frame của 1 video cùng kích thước → dùng lại 1 nhóm FrameBuffer thay vì mỗi frame
+    cấp phát mảng mới cho resize / cvtColor / tensor: bộ nhớ đứng yên với video dài.
+    `size` nên >= số frame cùng lúc đang dùng (với BatchPrefetcher: (depth + 2) * batch_size);
+    hết buffer rảnh thì tạo thêm (không chặn thread giải mã), buffer đó cũng được dùng lại về sau.
+    `pin_memory=True` (GPU): buffer nằm trong pinned memory → copy sang GPU nhanh, không chặn.
+    """
+
+    def __init__(self, size: int, target=None, pin_memory: bool = False):
+        self.target = target
+        self.pin_memory = pin_memory
+        self.allocated = 0
+        self._free = queue.SimpleQueue()
+        for _ in range(max(1, int(size))):
+            self._free.put(self._new_buffer())
+
+    def _new_buffer(self):
+        self.allocated += 1
+        return FrameBuffer(self.target, self.pin_memory)
+
+    def acquire(self) -> FrameBuffer:
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            return self._new_buffer()
+
+    def release(self, buffers):
+        """Trả buffer về pool khi tensor của nó không còn được dùng (sau khi đã có kết quả model)."""
+        for buffer in buffers:
+            self._free.put(buffer)
+
+    def load(self, frame_bgr) -> FrameBuffer:
+        """Dùng làm `transform` của BatchPrefetcher: frame BGR → FrameBuffer đã điền dữ liệu."""
+        return self.acquire().load(frame_bgr)
+
+
+class BatchPrefetcher:
+    """
+    ✅ Thread giải mã chạy trước: gom `batch_size` frame đã lấy mẫu thành 1 batch
+    (kèm bước `transform`, vd. BGR → tensor) trong khi batch trước đang chạy model.
+    Lặp qua prefetcher trả về list [(frame_number, item), ...] theo đúng thứ tự frame.
+    `depth` = số batch được giải mã sẵn tối đa (giới hạn bộ nhớ).
+    """
+
+    _DONE = object()
+
+    def __init__(self, frames, batch_size: int = 4, transform=None, depth: int = 1):
+        self.frames = frames
+        self.batch_size = max(1, int(batch_size))
+        self.transform = transform
+        self._queue = queue.Queue(maxsize=max(1, int(depth)))
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="frame-prefetch", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        """Dừng thread giải mã (kể cả khi bên dùng thoát giữa chừng) và chờ nó kết thúc."""
+        self._stop.set()
+        while self._thread.is_alive():
+            try:
+                self._queue.get(timeout=0.05)
+            except queue.Empty:
+                pass
+        self._thread.join()
+
+    def __iter__(self):
+        while True:
+            item = self._queue.get()
+            if item is self._DONE:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+    def _put(self, item) -> bool:
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _run(self):
+        batch = []
+        try:
+            for frame_number, frame in self.frames:
+                if self._stop.is_set():
+                    return
+                batch.append((frame_number, self.transform(frame) if self.transform else frame))
+                if len(batch) >= self.batch_size:
+                    if not self._put(batch):
+                        return
+                    batch = []
+            if batch and not self._put(batch):
+                return
+            self._put(self._DONE)
+        except Exception as e:
+            self._put(e)
@@ -0,0 +1,113 @@
+# app/jobs.py
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class JobQueueFull(Exception):
+    """Quá nhiều job đang chờ → API trả 503."""
+
+
+class VideoJobManager:
+    """
+    ✅ Chạy phân tích video ở background: POST trả job id ngay, client poll tiến độ.
+    - `max_concurrent` job chạy song song (thread pool), tối đa `max_queued` job chờ.
+    - Job đã xong bị xoá sau `result_ttl` giây.
+    - Tiến độ đọc trực tiếp từ dict `stats` mà process_video_for_quiz cập nhật.
+    """
+
+    def __init__(self, max_concurrent: int = 2, max_queued: int = 16, result_ttl: float = 600):
+        self.max_concurrent = max(1, int(max_concurrent))
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrent, thread_name_prefix="video-job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "expired": 0}
+
+    def submit(self, video_path: str, run) -> str:
+        """
+        Đưa 1 video vào hàng đợi. `run(video_path, stats)` trả về kết quả của job.
+        File video bị xoá khi job kết thúc.
+        """
+        self._expire()
+        with self._lock:
+            queued = sum(1 for job in self._jobs.values() if job["status"] == "queued")
+            if queued >= self.max_queued:
+                self._counters["rejected"] += 1
+                raise JobQueueFull("Quá nhiều video đang chờ xử lý.")
+            job_id = uuid.uuid4().hex
+            self._jobs[job_id] = {
+                "job_id": job_id, "status": "queued", "stats": {}, "result": None, "error": None,
+                "created_at": time.time(), "finished_at": None
+            }
+            self._counters["submitted"] += 1
+        self._pool.submit(self._run_job, job_id, video_path, run)
+        return job_id
+
+    def get(self, job_id: str):
+        """Trạng thái job dạng dict (None nếu không tồn tại hoặc đã hết hạn)."""
+        self._expire()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            stats = job["stats"]
+            total = stats.get("total_frames") or 0
+            position = stats.get("position", 0)
+            return {
+                "job_id": job_id,
+                "status": job["status"],
+                "frames_processed": position,
+                "total_frames": total,
+                "progress": 1.0 if job["status"] == "done" else (min(1.0, position / total) if total > 0 else 0.0),
+                "result": job["result"],
+                "error": job["error"],
+            }
+
+    def summary(self):
+        self._expire()
+        with self._lock:
+            statuses = [job["status"] for job in self._jobs.values()]
+            return {
+                **self._counters,
+                "queue_depth": statuses.count("queued"),
+                "running": statuses.count("running"),
+                "max_concurrent": self.max_concurrent,
+            }
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _run_job(self, job_id, video_path, run):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job["status"] = "running"
+            stats = job["stats"]
+        try:
+            result = run(video_path, stats)
+            status, error = "done", None
+        except Exception as e:
+            print(f"❌ Video job {job_id} failed: {e}")
+            result, status, error = None, "failed", str(e)
+        finally:
+            if os.path.exists(video_path):
+                os.remove(video_path)
+        with self._lock:
+            job.update(status=status, result=result, error=error, finished_at=time.time())
+            self._counters["completed" if status == "done" else "failed"] += 1
+
+    def _expire(self):
+        now = time.time()
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["finished_at"] is not None and now - job["finished_at"] > self.result_ttl
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+            self._counters["expired"] += len(expired)
@@ -1,12 +1,28 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Request
 from fastapi.responses import JSONResponse
-from app.services import ObjectDetectionService
-from app.models import PredictionResponse, DescriptionResponse, QuizResponse
+from app.services import ObjectDetectionService, InferenceQueueFull
+from app.executor import create_inference_executor
+from app.cache import DetectionCache, model_fingerprint
+from app.config import (
+    MODEL_PATH, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS,
+    INFERENCE_MODE, INFERENCE_WORKERS, INFERENCE_THREADS_PER_WORKER, INFERENCE_MAX_PENDING, INFERENCE_RESULT_TIMEOUT,
+    INFERENCE_SHARE_WEIGHTS, INFERENCE_QUANTIZE, INFERENCE_NMS_MODE, MODEL_WARMUP, PREDICT_INPUT_PROFILE, CACHE_MAX_ENTRIES, CACHE_MAX_BYTES, CACHE_TTL_SECONDS, CACHE_DISK_DIR,
+    VIDEO_MAX_UPLOAD_BYTES, VIDEO_SNIFF_BYTES,
+    VIDEO_JOB_MAX_CONCURRENT, VIDEO_JOB_MAX_QUEUED, VIDEO_JOB_RESULT_TTL,
+    VIDEO_SAMPLING_MODE, VIDEO_SAMPLES_PER_SECOND, VIDEO_SAMPLING_STRIDE, VIDEO_SKIP_STRATEGY,
+    VIDEO_BATCH_SIZE, VIDEO_TRACKER_ASSIGNMENT, VIDEO_TRACKER_MOTION, VIDEO_INPUT_PROFILE
+)
+from app.models import (
+    PredictionResponse, DescriptionResponse, QuizResponse, JobCreatedResponse, JobStatusResponse
+)
+from app.jobs import VideoJobManager, JobQueueFull
 from app.video_processor import process_video_for_quiz
+from app.video_stream import FifoVideoFeed, MultipartFileStream, is_streamable_video
+import asyncio
 import mimetypes
 import uuid
 import os
-import shutil
+import time
 
 app = FastAPI(
     title="Đôi Mắt Thông Minh API",
@@ -14,23 +30,146 @@ app = FastAPI(
     version="1.0.0"
 )
 
-MODEL_PATH = "fasterrcnn_mobilenet_weights.pth"
 detection_service = None  # Lazy load
+inference_executor = None
+# Request đầu tiên load model / khởi động replica trong thread riêng; lock để chỉ khởi tạo 1 lần
+model_init_lock = asyncio.Lock()
+
+detection_cache = DetectionCache(
+    max_entries=CACHE_MAX_ENTRIES,
+    max_bytes=CACHE_MAX_BYTES,
+    ttl_seconds=CACHE_TTL_SECONDS,
+    disk_dir=CACHE_DISK_DIR or None,
+    # Đổi trọng số hoặc cấu hình ảnh hưởng tới kết quả → khoá mới, không trả lại detections cũ từ đĩa
+    namespace=model_fingerprint(MODEL_PATH, input_profile=PREDICT_INPUT_PROFILE, quantize=INFERENCE_QUANTIZE,
+                                nms_mode=INFERENCE_NMS_MODE)
+)
+inflight_detections = {}  # key -> Future đang chạy, để request trùng ảnh dùng chung 1 lần suy luận
+
+video_jobs = VideoJobManager(
+    max_concurrent=VIDEO_JOB_MAX_CONCURRENT,
+    max_queued=VIDEO_JOB_MAX_QUEUED,
+    result_ttl=VIDEO_JOB_RESULT_TTL
+)
 
 TEMP_VIDEO_DIR = "temp_videos"
 os.makedirs(TEMP_VIDEO_DIR, exist_ok=True)
 
+# Cách lấy mẫu, batch frame và ghép track dùng chung cho mọi đường phân tích video
+VIDEO_OPTIONS = dict(
+    sampling=VIDEO_SAMPLING_MODE,
+    samples_per_second=VIDEO_SAMPLES_PER_SECOND,
+    stride=VIDEO_SAMPLING_STRIDE,
+    skip=VIDEO_SKIP_STRATEGY,
+    batch_size=VIDEO_BATCH_SIZE,
+    assignment=VIDEO_TRACKER_ASSIGNMENT,
+    motion=VIDEO_TRACKER_MOTION,
+    input_profile=VIDEO_INPUT_PROFILE
+)
+
 def get_detection_service():
-    """Chỉ load model lần đầu tiên khi có request."""
+    """
+    Chỉ load model lần đầu tiên khi có request.
+    INFERENCE_MODE=process: model này chỉ dùng cho phân tích video trong process cha và trỏ thẳng vào
+    trọng số shared memory của các replica (không load thêm 1 bản); vẫn tốn activation khi chạy video
+    và không tính vào INFERENCE_MAX_PENDING (chỉ /jobs/analyze_video bị giới hạn bởi VIDEO_JOB_MAX_CONCURRENT).
+    """
     global detection_service
     if detection_service is None:
-        print("🔄 Loading model to RAM ...")
+        state_dict = get_inference_executor().shared_state_dict if INFERENCE_MODE == "process" else None
+        print("🔄 Loading model to RAM ..." if state_dict is None else "🔄 Dựng model dùng chung trọng số với replica ...")
         detection_service = ObjectDetectionService(
             model_path=MODEL_PATH,
-            use_half=True  # FP16 - giảm RAM nếu có GPU
+            state_dict=state_dict,
+            use_half=True,  # FP16 - giảm RAM nếu có GPU
+            quantize=INFERENCE_QUANTIZE,  # INT8 - nhanh hơn trên CPU
+            input_profile=PREDICT_INPUT_PROFILE,
+            nms_mode=INFERENCE_NMS_MODE
         )
     return detection_service
 
+def get_inference_executor():
+    """Executor suy luận (thread/process pool + micro-batching) dùng chung cho /predict và /describe."""
+    global inference_executor
+    if inference_executor is None:
+        inference_executor = create_inference_executor(
+            INFERENCE_MODE,
+            MODEL_PATH,
+            num_workers=INFERENCE_WORKERS,
+            max_pending=INFERENCE_MAX_PENDING,
+            max_batch_size=BATCH_MAX_SIZE,
+            max_wait_ms=BATCH_MAX_WAIT_MS,
+            num_threads=INFERENCE_THREADS_PER_WORKER,
+            service_factory=get_detection_service,
+            share_weights=INFERENCE_SHARE_WEIGHTS,
+            quantize=INFERENCE_QUANTIZE,
+            input_profile=PREDICT_INPUT_PROFILE,
+            nms_mode=INFERENCE_NMS_MODE,
+            warmup=MODEL_WARMUP,
+            result_timeout=INFERENCE_RESULT_TIMEOUT
+        )
+    return inference_executor
+
+async def load_detection_service():
+    """get_detection_service() cho handler async: lần đầu load model trong thread riêng, không chặn event loop."""
+    if detection_service is not None:
+        return detection_service
+    async with model_init_lock:
+        return await asyncio.to_thread(get_detection_service)
+
+async def load_inference_executor():
+    """get_inference_executor() cho handler async: lần đầu khởi tạo trong thread riêng, không chặn event loop."""
+    if inference_executor is not None:
+        return inference_executor
+    async with model_init_lock:
+        return await asyncio.to_thread(get_inference_executor)
+
+async def run_detection(image_bytes: bytes, confidence_threshold: float = 0.5):
+    """
+    Tra cache theo nội dung ảnh trước; nếu chưa có thì đưa vào executor và chờ kết quả
+    mà không chặn event loop. Quá tải → 503.
+    """
+    key = detection_cache.make_key(image_bytes, confidence_threshold)
+    cached = detection_cache.get(key)
+    if cached is not None:
+        return cached
+
+    # Ảnh giống hệt đang được xử lý (vd. /describe và /predict gửi cùng lúc) → chờ chung
+    inflight = inflight_detections.get(key)
+    if inflight is not None:
+        return await asyncio.shield(inflight)
+
+    executor = await load_inference_executor()
+    try:
+        future = executor.submit(image_bytes, confidence_threshold)
+    except InferenceQueueFull:
+        raise HTTPException(status_code=503, detail="Server is busy, please retry later.")
+    except RuntimeError as e:
+        # Mọi inference replica đã chết
+        raise HTTPException(status_code=503, detail=str(e))
+    wrapped = asyncio.wrap_future(future)
+    inflight_detections[key] = wrapped
+    try:
+        results = await asyncio.shield(wrapped)
+    finally:
+        inflight_detections.pop(key, None)
+    detection_cache.put(key, results)
+    return results
+
+@app.on_event("startup")
+async def warm_up_model():
+    """MODEL_WARMUP=1: load model + chạy thử trước khi nhận request (không chặn event loop)."""
+    if MODEL_WARMUP:
+        started_at = time.perf_counter()
+        await load_inference_executor()
+        print(f"✅ Model sẵn sàng sau {time.perf_counter() - started_at:.2f}s")
+
+@app.on_event("shutdown")
+def shutdown_workers():
+    video_jobs.shutdown()
+    if inference_executor is not None:
+        inference_executor.close()
+
 def is_image_file(file: UploadFile) -> bool:
     if file.content_type and file.content_type.startswith("image/"):
         return True
@@ -44,14 +183,22 @@ def is_image_file(file: UploadFile) -> bool:
 def root():
     return {"message": "Welcome to the Đôi Mắt Thông Minh API!"}
 
+@app.get("/stats")
+def stats():
+    """Thống kê cache, executor suy luận và job video."""
+    return {
+        "cache": detection_cache.summary(),
+        "video_jobs": video_jobs.summary(),
+        "inference": dict(inference_executor.stats) if inference_executor is not None else {}
+    }
+
 @app.post("/describe", response_model=DescriptionResponse)
 async def describe_image(file: UploadFile = File(...)):
     if not is_image_file(file):
         raise HTTPException(status_code=400, detail="File is not an image.")
     try:
-        service = get_detection_service()
         image_bytes = await file.read()
-        results = service.predict_from_image_bytes(image_bytes)
+        results = await run_detection(image_bytes)
         labels = [item['label'] for item in results if item['label'] != '__background__']
 
         if not labels:
@@ -63,6 +210,8 @@ async def describe_image(file: UploadFile = File(...)):
             else:
                 description = "Trong ảnh này có " + ", ".join(unique[:-1]) + f" và một {unique[-1]}."
         return DescriptionResponse(description=description, objects=labels)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -71,44 +220,178 @@ async def predict_image(file: UploadFile = File(...)):
     if not is_image_file(file):
         raise HTTPException(status_code=400, detail="File is not an image.")
     try:
-        service = get_detection_service()
         image_bytes = await file.read()
-        results = service.predict_from_image_bytes(image_bytes)
+        results = await run_detection(image_bytes)
         return PredictionResponse(objects=results)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-def is_video_file(file: UploadFile) -> bool:
-    if file.content_type and file.content_type.startswith("video/"):
+def is_video_upload(content_type, filename) -> bool:
+    if content_type and content_type.startswith("video/"):
         return True
-    if file.filename:
-        mime = mimetypes.guess_type(file.filename)[0]
+    if filename:
+        mime = mimetypes.guess_type(filename)[0]
         if mime and mime.startswith("video/"):
             return True
     return False
 
-@app.post("/analyze_video", response_model=QuizResponse)
-async def analyze_video(file: UploadFile = File(...)):
-    if not is_video_file(file):
+def is_video_file(file: UploadFile) -> bool:
+    return is_video_upload(file.content_type, file.filename)
+
+def log_video_timings(started_at: float, stats: dict):
+    """In thời gian tới lần suy luận/nhận diện đầu tiên tính từ lúc nhận request."""
+    for key, name in (("first_inference_at", "first inference"), ("first_detection_at", "first detection")):
+        if key in stats:
+            print(f"⏱️ Time to {name}: {stats[key] - started_at:.2f}s")
+
+async def read_video_head(request: Request):
+    """
+    Đọc phần đầu của field `file` trong body multipart để kiểm tra loại file và
+    xem video có giải mã tuần tự được không. Trả về (upload, body, head, streamable).
+    """
+    try:
+        upload = MultipartFileStream(request.headers.get("content-type", ""))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="File is not a valid video.")
+
+    body = request.stream()
+    head = b""
+    streamable = None
+    async for data in body:
+        for chunk in upload.feed(data):
+            head += chunk
+        if upload.filename is not None and not is_video_upload(upload.content_type, upload.filename):
+            raise HTTPException(status_code=400, detail="File is not a valid video.")
+        streamable = is_streamable_video(head)
+        if streamable is not None or len(head) >= VIDEO_SNIFF_BYTES:
+            break
+    else:
+        head += b"".join(upload.finalize())
+    if upload.filename is None or not head:
         raise HTTPException(status_code=400, detail="File is not a valid video.")
+    return upload, body, head, streamable
 
+async def spool_video_upload(upload, body, head) -> str:
+    """Ghi phần còn lại của upload ra file tạm (tối đa VIDEO_MAX_UPLOAD_BYTES), trả về đường dẫn."""
     temp_id = str(uuid.uuid4())
-    temp_filename = f"{temp_id}_{file.filename}"
+    temp_filename = f"{temp_id}_{os.path.basename(upload.filename) or 'video'}"
     temp_path = os.path.join(TEMP_VIDEO_DIR, temp_filename)
-
     try:
+        size = len(head)
         with open(temp_path, "wb") as f:
-            shutil.copyfileobj(file.file, f)
+            f.write(head)
+            async for data in body:
+                for chunk in upload.feed(data):
+                    size += len(chunk)
+                    if size > VIDEO_MAX_UPLOAD_BYTES:
+                        raise HTTPException(status_code=413, detail="Video is too large.")
+                    f.write(chunk)
+            for chunk in upload.finalize():
+                f.write(chunk)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return temp_path
 
-        service = get_detection_service()
-        quiz = process_video_for_quiz(
-            video_path=temp_path,
-            model=service.model,
-            voc_classes=service.VOC_CLASSES
-        )
+@app.post("/analyze_video", response_model=QuizResponse)
+async def analyze_video(request: Request):
+    """
+    Nhận video multipart (field `file`) và giải mã ngay trong lúc upload còn đang tới:
+    - MP4 faststart ('moov' trước 'mdat'), webm, mkv... → đưa thẳng vào decoder qua FIFO, không ghi đĩa.
+    - MP4 có 'moov' ở cuối → bắt buộc ghi file tạm (tối đa VIDEO_MAX_UPLOAD_BYTES) rồi mới giải mã.
+    """
+    started_at = time.monotonic()
+    upload, body, head, streamable = await read_video_head(request)
+
+    service = await load_detection_service()
+    stats = {}
+    try:
+        if streamable:
+            quiz = await analyze_video_stream(upload, body, head, service, stats)
+        else:
+            quiz = await analyze_video_spooled(upload, body, head, service, stats)
+        log_video_timings(started_at, stats)
         return QuizResponse(questions=quiz)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+async def analyze_video_stream(upload, body, head, service, stats):
+    """Decoder đọc từ FIFO trong thread riêng, event loop tiếp tục nhận upload và ghi vào FIFO."""
+    feed = FifoVideoFeed(TEMP_VIDEO_DIR)
+    decode_task = asyncio.ensure_future(asyncio.to_thread(
+        process_video_for_quiz,
+        video_path=feed.path,
+        engine=service.engine,
+        voc_classes=service.VOC_CLASSES,
+        stats=stats,
+        **VIDEO_OPTIONS
+    ))
+    decode_task.add_done_callback(lambda _: feed.abort())
+    try:
+        if await asyncio.to_thread(feed.write, head):
+            async for data in body:
+                chunks = upload.feed(data)
+                if chunks and not await asyncio.to_thread(feed.write, b"".join(chunks)):
+                    break  # Decoder đã dừng, không cần ghi tiếp
+            else:
+                chunks = upload.finalize()
+                if chunks:
+                    await asyncio.to_thread(feed.write, b"".join(chunks))
+        # Xoá FIFO + đóng đầu ghi: decoder nhận EOF, kể cả khi nó đang mở lại FIFO lần nữa
+        feed.cleanup()
+        return await decode_task
+    finally:
+        feed.cleanup()
+
+async def analyze_video_spooled(upload, body, head, service, stats):
+    """Video không đọc tuần tự được → ghi file tạm (có giới hạn dung lượng) rồi mới giải mã."""
+    temp_path = await spool_video_upload(upload, body, head)
+    try:
+        # Chạy ở thread riêng để không chặn event loop
+        return await asyncio.to_thread(
+            process_video_for_quiz,
+            video_path=temp_path,
+            engine=service.engine,
+            voc_classes=service.VOC_CLASSES,
+            stats=stats,
+            **VIDEO_OPTIONS
+        )
     finally:
         if os.path.exists(temp_path):
             os.remove(temp_path)
+
+# --- Job API: phân tích video chạy nền, client poll tiến độ ---
+@app.post("/jobs/analyze_video", response_model=JobCreatedResponse, status_code=202)
+async def create_video_job(request: Request):
+    """Nhận video, lưu tạm và trả về job id ngay; việc phân tích chạy ở background."""
+    upload, body, head, _ = await read_video_head(request)
+    temp_path = await spool_video_upload(upload, body, head)
+    service = await load_detection_service()
+
+    def run(video_path, stats):
+        return {"questions": process_video_for_quiz(
+            video_path=video_path,
+            engine=service.engine,
+            voc_classes=service.VOC_CLASSES,
+            stats=stats,
+            **VIDEO_OPTIONS
+        )}
+
+    try:
+        job_id = video_jobs.submit(temp_path, run)
+    except JobQueueFull:
+        os.remove(temp_path)
+        raise HTTPException(status_code=503, detail="Too many videos in queue, please retry later.")
+    return JobCreatedResponse(job_id=job_id, status="queued")
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+def get_video_job(job_id: str):
+    job = video_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired.")
+    return JobStatusResponse(**job)
@@ -20,4 +20,17 @@ class QuizQuestion(BaseModel):
     correct_answer_index: int
 
 class QuizResponse(BaseModel):
-    questions: List[QuizQuestion]
\ No newline at end of file
+    questions: List[QuizQuestion]
+
+class JobCreatedResponse(BaseModel):
+    job_id: str
+    status: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    status: str  # queued | running | done | failed
+    frames_processed: int
+    total_frames: int
+    progress: float
+    result: Optional[QuizResponse] = None
+    error: Optional[str] = None
@@ -1,93 +1,144 @@
 # app/services.py
-import torch
-from torchvision.transforms import ToTensor
-from torchvision.models.detection import fasterrcnn_mobilenet_v3_large_fpn
-from torchvision.models.detection.faster_rcnn import FastRCNNPredictor
-from torchvision.ops import nms
-from PIL import Image
-import io
+from concurrent.futures import Future
+import queue
+import threading
+import time
 
-VOC_CLASSES = [
-    '__background__', 'aeroplane', 'bicycle', 'bird', 'boat', 'bottle',
-    'bus', 'car', 'cat', 'chair', 'cow', 'diningtable', 'dog', 'horse',
-    'motorbike', 'person', 'pottedplant', 'sheep', 'sofa', 'train', 'tvmonitor'
-]
+from doi_mat_core.inference import InferenceEngine, VOC_CLASSES
 
 class ObjectDetectionService:
-    def __init__(self, model_path: str, use_half: bool = True):
+    def __init__(self, model_path: str, use_half: bool = True, state_dict=None, quantize: str = "none",
+                 input_profile: str = "accuracy", nms_mode: str = "class_agnostic"):
         """
-        ✅ Load model 1 lần, cho phép dùng FP16 để giảm RAM nếu có GPU.
+        ✅ Load model 1 lần qua InferenceEngine (dùng chung với server UDP),
+        cho phép dùng FP16 để giảm RAM nếu có GPU.
+        Nếu truyền `state_dict` (vd. tensor trong shared memory) thì dùng trực tiếp thay vì đọc file.
+        `quantize="dynamic"`: INT8 cho CPU, `input_profile`: kích thước đầu vào ("accuracy" | "realtime"),
+        `nms_mode`: NMS sau model ("class_agnostic" | "per_class" | "none"), xem doi_mat_core/postprocess.py.
         """
-        self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
-        self.use_half = use_half and (self.device.type == "cuda")
-        self.model = self._load_model(model_path)
-        self.transform = ToTensor()
+        self.engine = InferenceEngine(model_path, use_half=use_half, state_dict=state_dict, quantize=quantize,
+                                      input_profile=input_profile, nms_mode=nms_mode)
+        self.model = self.engine.model
+        self.device = self.engine.device
+        self.use_half = self.engine.use_half
         self.VOC_CLASSES = VOC_CLASSES
 
-    def _load_model(self, model_path: str):
-        """✅ Load model vào GPU/CPU và chuyển sang FP16 nếu có thể"""
-        num_classes = len(VOC_CLASSES)
-        model = fasterrcnn_mobilenet_v3_large_fpn(weights=None)
-        in_features = model.roi_heads.box_predictor.cls_score.in_features
-        model.roi_heads.box_predictor = FastRCNNPredictor(in_features, num_classes)
-
-        # Load trọng số
-        model.load_state_dict(torch.load(model_path, map_location=self.device))
-        model.to(self.device)
-
-        # ✅ Chuyển sang FP16 nếu có GPU (giảm RAM ~40-50%)
-        if self.use_half:
-            model = model.half()
-
-        model.eval()
-        print(f"✅ Model loaded on {self.device} | FP16 = {self.use_half}")
-        return model
+    def predict_batch(self, images_bytes, confidence_threshold=0.5):
+        """
+        Dự đoán nhiều ảnh trong 1 lần forward `model(images)`.
+        `confidence_threshold` là 1 số hoặc danh sách ngưỡng cho từng ảnh.
+        Ảnh lỗi (không đọc được) → None tại vị trí tương ứng.
+        """
+        results = self.engine.predict_batch(images_bytes, confidence_threshold)
+        for detections in results:
+            for det in detections or ():
+                det["label"] = self.VOC_CLASSES[det["label"]]
+        return results
 
-    @torch.no_grad()  # ✅ Tắt gradient → giảm RAM + tăng tốc
     def predict_from_image_bytes(self, image_bytes: bytes, confidence_threshold: float = 0.5):
+        return self.predict_batch([image_bytes], confidence_threshold)[0]
+
+
+class InferenceQueueFull(Exception):
+    """Hàng đợi suy luận đã đầy → API trả 503 thay vì để request chờ vô hạn."""
+
+
+def collect_batch(work_queue, max_batch_size: int, max_wait: float):
+    """
+    Lấy 1 batch từ hàng đợi (queue.Queue hoặc multiprocessing.Queue):
+    chặn tới khi có phần tử đầu tiên, rồi gom thêm trong cửa sổ `max_wait` giây.
+    Trả về None khi gặp tín hiệu dừng (None).
+    """
+    first = work_queue.get()
+    if first is None:
+        return None
+    batch = [first]
+    deadline = time.monotonic() + max_wait
+    while len(batch) < max_batch_size:
+        remaining = deadline - time.monotonic()
         try:
-            # 1. Load ảnh
-            image = Image.open(io.BytesIO(image_bytes)).convert("RGB")
-            img_tensor = self.transform(image).unsqueeze(0).to(self.device)
-
-            # ✅ Nếu model dùng FP16 thì ảnh cũng phải FP16
-            if self.use_half:
-                img_tensor = img_tensor.half()
-
-            # 2. Dự đoán
-            outputs = self.model(img_tensor)[0]
-
-            boxes = outputs['boxes']
-            scores = outputs['scores']
-            labels = outputs['labels']
-
-            # 3. Lọc confidence
-            keep = scores >= confidence_threshold
-            boxes = boxes[keep]
-            scores = scores[keep]
-            labels = labels[keep]
-
-            if len(boxes) == 0:
-                return []
-
-            # 4. Non-Max Suppression (NMS)
-            keep_idx = nms(boxes, scores, iou_threshold=0.5)
-            boxes = boxes[keep_idx].tolist()
-            scores = scores[keep_idx].tolist()
-            labels = labels[keep_idx].tolist()
-
-            # 5. Format kết quả
-            results = [
-                {
-                    "box": boxes[i],
-                    "label": self.VOC_CLASSES[labels[i]],
-                    "score": float(scores[i])
-                }
-                for i in range(len(boxes))
-            ]
-
-            return results
-
-        except Exception as e:
-            print(f"❌ Prediction error: {e}")
-            return None
+            item = work_queue.get(timeout=remaining) if remaining > 0 else work_queue.get_nowait()
+        except queue.Empty:
+            break
+        if item is None:
+            # Giữ lại tín hiệu dừng cho vòng lặp sau
+            work_queue.put(None)
+            break
+        batch.append(item)
+    return batch
+
+
+class BatchingScheduler:
+    """
+    ✅ Micro-batching: gom ảnh từ /predict và /describe vào hàng đợi,
+    chờ tối đa `max_wait_ms` hoặc đủ `max_batch_size` ảnh rồi chạy 1 lần model(images),
+    sau đó trả kết quả về đúng Future của từng request.
+
+    `num_workers` luồng cùng lấy batch từ 1 hàng đợi; `max_pending` giới hạn số ảnh
+    đang chờ + đang chạy (0 = không giới hạn), vượt quá thì submit() ném InferenceQueueFull.
+    """
+
+    def __init__(self, service: ObjectDetectionService, max_batch_size: int = 8, max_wait_ms: float = 10.0,
+                 num_workers: int = 1, max_pending: int = 0):
+        self.service = service
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.stats = {"batches": 0, "images": 0, "rejected": 0}
+        self._queue = queue.Queue()
+        self._slots = threading.BoundedSemaphore(max_pending) if max_pending > 0 else None
+        self._stats_lock = threading.Lock()
+        self._closed = False
+        self._workers = [
+            threading.Thread(target=self._run, name=f"batching-worker-{i}", daemon=True)
+            for i in range(max(1, int(num_workers)))
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, image_bytes: bytes, confidence_threshold: float = 0.5) -> Future:
+        """Đưa 1 ảnh vào hàng đợi, trả về Future chứa kết quả như predict_from_image_bytes."""
+        if self._closed:
+            raise RuntimeError("BatchingScheduler đã đóng.")
+        if self._slots is not None:
+            if not self._slots.acquire(blocking=False):
+                with self._stats_lock:
+                    self.stats["rejected"] += 1
+                raise InferenceQueueFull("Hàng đợi suy luận đã đầy.")
+        future = Future()
+        if self._slots is not None:
+            future.add_done_callback(lambda _: self._slots.release())
+        self._queue.put((image_bytes, confidence_threshold, future))
+        return future
+
+    def close(self):
+        """Dừng các worker sau khi xử lý hết các ảnh đang chờ."""
+        if not self._closed:
+            self._closed = True
+            for _ in self._workers:
+                self._queue.put(None)
+            for worker in self._workers:
+                worker.join()
+
+    def _run(self):
+        while True:
+            batch = collect_batch(self._queue, self.max_batch_size, self.max_wait)
+            if batch is None:
+                break
+            # Bỏ qua các request đã bị huỷ
+            batch = [item for item in batch if item[2].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            try:
+                results = self.service.predict_batch(
+                    [image_bytes for image_bytes, _, _ in batch],
+                    [threshold for _, threshold, _ in batch]
+                )
+            except Exception as e:
+                for _, _, future in batch:
+                    future.set_exception(e)
+                continue
+            with self._stats_lock:
+                self.stats["batches"] += 1
+                self.stats["images"] += len(batch)
+            for (_, _, future), result in zip(batch, results):
+                future.set_result(result)
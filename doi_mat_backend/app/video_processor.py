@@ -1,113 +1,12 @@
 # app/video_processor.py
 import cv2
-import numpy as np
-import torch
-from torchvision.transforms import ToTensor
 from collections import defaultdict
 import random
+import time
 
-# --- DÁN TOÀN BỘ LỚP OBJECT TRACKER CỦA BẠN VÀO ĐÂY ---
-class ObjectTracker:
-    def __init__(self, max_disappeared=10, iou_threshold=0.5, max_lost_age=50):
-        self.next_object_id = 0
-        self.objects = {}  
-        self.disappeared = {}
-        self.lost_objects = {}
-        self.max_disappeared = max_disappeared
-        self.max_lost_age = max_lost_age
-        self.iou_threshold = iou_threshold
+from doi_mat_core.tracking import ObjectTracker
 
-    def _calculate_iou(self, boxA, boxB):
-        xA = max(boxA[0], boxB[0]); yA = max(boxA[1], boxB[1])
-        xB = min(boxA[2], boxB[2]); yB = min(boxA[3], boxB[3])
-        inter_area = max(0, xB - xA) * max(0, yB - yA)
-        if inter_area == 0: return 0
-        boxA_area = (boxA[2] - boxA[0]) * (boxA[3] - boxA[1])
-        boxB_area = (boxB[2] - boxB[0]) * (boxB[3] - boxB[1])
-        return inter_area / float(boxA_area + boxB_area - inter_area)
-
-    def register(self, box, label, frame_count):
-        self.objects[self.next_object_id] = {
-            'box': box, 'label': label, 'first_seen': frame_count, 'last_seen': frame_count
-        }
-        self.disappeared[self.next_object_id] = 0
-        self.next_object_id += 1
-
-    def deregister(self, object_id, frame_count):
-        obj_data = self.objects[object_id]
-        self.lost_objects[object_id] = {
-            'label': obj_data['label'], 'last_box': obj_data['box'],
-            'last_pos': ((obj_data['box'][0] + obj_data['box'][2]) / 2, (obj_data['box'][1] + obj_data['box'][3]) / 2),
-            'lost_frame': frame_count, 'first_seen': obj_data['first_seen'], 'last_seen': obj_data['last_seen']
-        }
-        del self.objects[object_id]
-        del self.disappeared[object_id]
-
-    def update(self, detections, frame_count):
-        if len(detections) == 0:
-            for object_id in list(self.disappeared.keys()):
-                self.disappeared[object_id] += 1
-                if self.disappeared[object_id] > self.max_disappeared:
-                    self.deregister(object_id, frame_count)
-            return self.objects
-
-        if len(self.objects) == 0:
-            for box, label, _ in detections:
-                self.register(box, label, frame_count)
-        else:
-            # ... (copy toàn bộ phần còn lại của hàm update từ script của bạn) ...
-            current_object_ids = list(self.objects.keys())
-            current_objects = [self.objects[id]['box'] for id in current_object_ids]
-            iou_matrix = np.zeros((len(current_objects), len(detections)))
-            for i, obj_box in enumerate(current_objects):
-                for j, (det_box, _, _) in enumerate(detections):
-                    iou_matrix[i, j] = self._calculate_iou(obj_box, det_box)
-
-            rows = iou_matrix.max(axis=1).argsort()[::-1]
-            cols = iou_matrix.argmax(axis=1)[rows]
-            used_row_idxs = set(); used_col_idxs = set()
-
-            for (row, col) in zip(rows, cols):
-                if row in used_row_idxs or col in used_col_idxs: 
-                    continue
-                if iou_matrix[row, col] > self.iou_threshold:
-                    object_id = current_object_ids[row]
-                    box, label, _ = detections[col]
-                    self.objects[object_id].update({'box': box, 'label': label, 'last_seen': frame_count})
-                    self.disappeared[object_id] = 0
-                    used_row_idxs.add(row); used_col_idxs.add(col)
-            
-            unused_row_idxs = set(range(0, iou_matrix.shape[0])).difference(used_row_idxs)
-            for row in unused_row_idxs:
-                object_id = current_object_ids[row]
-                self.disappeared[object_id] += 1
-                if self.disappeared[object_id] > self.max_disappeared:
-                    self.deregister(object_id, frame_count)
-
-            unused_col_idxs = set(range(0, iou_matrix.shape[1])).difference(used_col_idxs)
-            if unused_col_idxs:
-                new_detections = [detections[i] for i in unused_col_idxs]
-                self.lost_objects = {oid: data for oid, data in self.lost_objects.items() if frame_count - data['lost_frame'] <= self.max_lost_age}
-                matched_lost_ids = set()
-                for det_box, det_label, _ in new_detections:
-                    best_match_id = None; min_dist = float('inf')
-                    det_cx, det_cy = (det_box[0]+det_box[2])/2, (det_box[1]+det_box[3])/2
-                    det_w, det_h = det_box[2]-det_box[0], det_box[3]-det_box[1]
-                    for lost_id, lost_data in self.lost_objects.items():
-                        if lost_id in matched_lost_ids or lost_data['label'] != det_label: continue
-                        lost_cx, lost_cy = lost_data['last_pos']; lost_box = lost_data['last_box']
-                        lost_w, lost_h = lost_box[2]-lost_box[0], lost_box[3]-lost_box[1]
-                        dist = np.sqrt((det_cx - lost_cx)**2 + (det_cy - lost_cy)**2)
-                        size_similarity = 1 - abs(det_w - lost_w)/(det_w + lost_w + 1e-6)
-                        if dist < 100 and size_similarity > 0.5 and dist < min_dist:
-                            min_dist = dist; best_match_id = lost_id
-                    
-                    if best_match_id is not None:
-                        self.objects[best_match_id] = {'box': det_box, 'label': det_label, 'first_seen': self.lost_objects[best_match_id]['first_seen'], 'last_seen': frame_count}
-                        self.disappeared[best_match_id] = 0; matched_lost_ids.add(best_match_id); del self.lost_objects[best_match_id]
-                    else:
-                        self.register(det_box, det_label, frame_count)
-        return self.objects
+from app.frame_sampling import BatchPrefetcher, FrameBufferPool, FrameSampler
 
 
 # --- HÀM TẠO 4 CÂU HỎI (ĐÃ CẢI TIẾN) ---
@@ -211,32 +110,69 @@ def create_quiz_from_counts(final_counts):
 
     return questions
 # --- HÀM XỬ LÝ VIDEO CHÍNH ---
-def process_video_for_quiz(video_path, model, voc_classes):
+def process_video_for_quiz(video_path, engine, voc_classes, stats=None, sampling="per_second",
+                           samples_per_second=1.0, stride=None, skip="auto", batch_size=4,
+                           assignment="greedy", motion="none", input_profile=None):
+    """
+    `engine`: InferenceEngine (doi_mat_core/inference.py) — cùng device/FP16, ngưỡng + NMS với /predict.
+    `stats` (tuỳ chọn): dict được ghi thêm các mốc thời gian (time.monotonic())
+    'first_inference_at', 'first_detection_at', số frame đã chạy model 'frames',
+    số lần forward 'batches', và tiến độ 'position' / 'total_frames'
+    (total = 0 nếu không biết, vd. khi đọc từ FIFO).
+    `sampling`, `samples_per_second`, `stride`, `skip`: cách chọn frame, xem FrameSampler.
+    `batch_size`: số frame chạy chung 1 lần forward; frame của batch sau được giải mã song song.
+    `assignment`: cách ghép track với detection ("greedy" | "hungarian"), xem ObjectTracker.
+    `motion`: "kalman" để dự đoán vị trí track giữa các frame lấy mẫu thưa, xem ObjectTracker.
+    `input_profile`: kích thước frame đưa vào model ("accuracy" | "realtime"), mặc định của engine.
+    """
+    if stats is None: stats = {}
+    stats['frames'] = 0; stats['batches'] = 0
     cap = cv2.VideoCapture(video_path)
     if not cap.isOpened(): raise Exception(f"Không thể mở video tại: {video_path}")
     fps = cap.get(cv2.CAP_PROP_FPS)
-    tracker = ObjectTracker(max_disappeared=20, iou_threshold=0.4, max_lost_age=50) 
-    frame_count = 0; confidence_threshold = 0.5
-    frame_skip = max(1, int(fps)) # Xử lý 1 frame mỗi giây
-    print(f"Bắt đầu xử lý video: {video_path}")
-
-    while True:
-        ret, frame = cap.read()
-        if not ret: break
-        frame_count += 1
-        if frame_count % frame_skip != 0: continue
-
-        rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-        img_tensor = ToTensor()(rgb_frame).unsqueeze(0).to('cpu')
-        with torch.no_grad(): predictions = model(img_tensor)
-        
-        boxes = predictions[0]['boxes']; scores = predictions[0]['scores']; labels = predictions[0]['labels']
-        keep = scores >= confidence_threshold
-        boxes = boxes[keep]; scores = scores[keep]; labels = labels[keep]
-        detections = [(boxes[i].cpu().numpy(), labels[i].item(), scores[i].item()) for i in range(len(boxes))]
-        tracker.update(detections, frame_count)
-
-    cap.release(); print("Hoàn thành xử lý video.")
+    stats['total_frames'] = max(0, int(cap.get(cv2.CAP_PROP_FRAME_COUNT)))
+    tracker = ObjectTracker(max_disappeared=20, iou_threshold=0.4, max_lost_age=50, assignment=assignment,
+                            motion=motion)
+    confidence_threshold = 0.5
+    # Chỉ giải mã frame được lấy mẫu (mặc định 1 frame mỗi giây), luôn vào cùng 1 mảng BGR
+    sampler = FrameSampler(cap, video_path, mode=sampling, samples_per_second=samples_per_second,
+                           stride=stride, skip=skip, reuse_frames=True)
+    print(f"Bắt đầu xử lý video: {video_path} (sampling={sampler.mode}, skip={sampler.skip}, "
+          f"stride={sampler.stride}, batch={batch_size})")
+
+    # Frame cùng kích thước → thu nhỏ sẵn về kích thước model sẽ dùng, box nhân lại `scale` sau khi dự đoán
+    frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    target = engine.target_size(*frame_size, input_profile) if min(frame_size) > 0 else None
+    scale = (frame_size[0] / target[0], frame_size[1] / target[1]) if target else None
+    # Buffer resize / RGB / tensor dựng sẵn và dùng lại: batch đang chạy + batch chờ + batch đang giải mã
+    buffers = FrameBufferPool(3 * batch_size, target=target, pin_memory=engine.device.type == "cuda")
+
+    try:
+        # Thread giải mã chuẩn bị batch tiếp theo trong lúc model chạy batch hiện tại
+        with BatchPrefetcher(sampler, batch_size=batch_size, transform=buffers.load, depth=1) as batches:
+            for batch in batches:
+                predictions = engine.forward([buffer.tensor for _, buffer in batch], input_profile)
+                # Lọc + NMS cho cả batch trên device, 1 lần chuyển về CPU
+                batch_detections = engine.postprocess_batch(predictions, confidence_threshold, [scale] * len(batch))
+                stats['batches'] += 1
+                stats.setdefault('first_inference_at', time.monotonic())
+
+                # Cập nhật tracker theo đúng thứ tự frame
+                for (frame_count, _), frame_detections in zip(batch, batch_detections):
+                    # Box của từng detection là view (không copy) vào mảng cột của frame
+                    detections = list(zip(frame_detections.boxes, frame_detections.labels.tolist(),
+                                          frame_detections.scores.tolist()))
+                    stats['frames'] += 1
+                    stats['position'] = frame_count
+                    if detections: stats.setdefault('first_detection_at', time.monotonic())
+                    tracker.update(detections, frame_count)
+                # Kết quả đã về CPU → tensor của batch không còn được đọc, trả buffer về pool
+                buffers.release(buffer for _, buffer in batch)
+    finally:
+        cap.release()
+    print("Hoàn thành xử lý video.")
+    # Frame cuối thường không được lấy mẫu → đánh dấu đã đọc hết video
+    if stats['total_frames']: stats['position'] = stats['total_frames']
 
     # Thống kê
     all_objects = {**tracker.objects, **tracker.lost_objects}
@@ -0,0 +1,178 @@
+# app/video_stream.py
+import errno
+import os
+import struct
+import time
+import uuid
+
+from python_multipart import MultipartParser
+from python_multipart.multipart import parse_options_header
+
+
+def is_streamable_video(header: bytes):
+    """
+    Kiểm tra video có giải mã được khi đọc tuần tự (không seek) hay không.
+    - MP4/MOV: chỉ được nếu box 'moov' nằm trước 'mdat' (faststart).
+    - Container khác (webm, mkv, ts, ...): coi là đọc tuần tự được.
+    Trả về None nếu chưa đủ dữ liệu để kết luận.
+    """
+    if len(header) < 8:
+        return None
+    if header[4:8] != b"ftyp":
+        return True
+    offset = 0
+    while offset + 8 <= len(header):
+        size, box_type = struct.unpack(">I4s", header[offset:offset + 8])
+        if box_type == b"moov":
+            return True
+        if box_type == b"mdat":
+            return False
+        if size == 1:
+            if offset + 16 > len(header):
+                return None
+            size = struct.unpack(">Q", header[offset + 8:offset + 16])[0]
+        if size < 8:
+            # size = 0 (box kéo tới hết file) hoặc header hỏng
+            return False
+        offset += size
+    return None
+
+
+class FifoVideoFeed:
+    """
+    ✅ Đưa dữ liệu upload vào decoder qua named pipe (FIFO) ngay khi nhận được,
+    không ghi file tạm ra đĩa. Ghi bị chặn khi decoder chưa đọc kịp (backpressure).
+    Hàm write là blocking → gọi qua thread (asyncio.to_thread).
+    """
+
+    def __init__(self, directory: str, poll_interval: float = 0.01):
+        self.path = os.path.join(directory, f"{uuid.uuid4()}.fifo")
+        os.mkfifo(self.path)
+        self.bytes_written = 0
+        self._fd = None
+        self._aborted = False
+        self._poll_interval = poll_interval
+
+    def write(self, chunk: bytes) -> bool:
+        """Ghi 1 chunk; trả về False nếu decoder đã dừng (đóng đầu đọc hoặc abort)."""
+        if self._fd is None and not self._open_writer():
+            return False
+        try:
+            view = memoryview(chunk)
+            while view:
+                written = os.write(self._fd, view)
+                view = view[written:]
+        except BrokenPipeError:
+            return False
+        self.bytes_written += len(chunk)
+        return True
+
+    def _open_writer(self) -> bool:
+        # Mở không chặn và thử lại cho tới khi decoder mở đầu đọc,
+        # để abort() luôn dừng được writer (open() blocking có thể chờ mãi).
+        while not self._aborted:
+            try:
+                self._fd = os.open(self.path, os.O_WRONLY | os.O_NONBLOCK)
+            except OSError as e:
+                if e.errno != errno.ENXIO:
+                    raise
+                time.sleep(self._poll_interval)
+                continue
+            os.set_blocking(self._fd, True)
+            return True
+        return False
+
+    def close(self):
+        """Đóng đầu ghi → decoder nhận EOF."""
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def abort(self):
+        """Decoder đã dừng (xong hoặc lỗi) → writer không chờ/ghi thêm nữa."""
+        self._aborted = True
+
+    def cleanup(self):
+        """Xoá FIFO; nếu decoder vẫn đang chờ open() thì cho nó nhận EOF ngay."""
+        if not os.path.exists(self.path):
+            self.close()
+            return
+        if self._fd is None:
+            # O_RDWR trên FIFO không bao giờ chặn: mở để gỡ chặn reader đang chờ,
+            # xoá đường dẫn trước khi đóng để không reader nào mở được sau đó.
+            self._fd = os.open(self.path, os.O_RDWR | os.O_NONBLOCK)
+        os.remove(self.path)
+        self.close()
+
+
+class MultipartFileStream:
+    """
+    Parse multipart/form-data theo từng chunk của request, lấy dữ liệu của 1 field file
+    mà không cần chờ nhận hết body (khác với UploadFile của FastAPI).
+    """
+
+    def __init__(self, content_type: str, field_name: str = "file"):
+        _, params = parse_options_header(content_type)
+        boundary = params.get(b"boundary")
+        if not boundary:
+            raise ValueError("Missing boundary in multipart.")
+        self.field_name = field_name
+        self.filename = None
+        self.content_type = None
+        self._headers = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._in_target = False
+        self._chunks = []
+        self._finalized = False
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._on_part_begin,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_headers_finished": self._on_headers_finished,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def feed(self, data: bytes):
+        """Đưa 1 chunk body vào parser, trả về danh sách chunk dữ liệu của file."""
+        self._parser.write(data)
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+    def finalize(self):
+        if not self._finalized:
+            self._finalized = True
+            self._parser.finalize()
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+    def _on_part_begin(self):
+        self._headers = {}
+
+    def _on_header_field(self, data, start, end):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data, start, end):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = b""
+        self._header_value = b""
+
+    def _on_headers_finished(self):
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("latin-1")
+        self._in_target = name == self.field_name and self.filename is None
+        if self._in_target:
+            self.filename = options.get(b"filename", b"").decode("utf-8", "replace")
+            self.content_type = self._headers.get(b"content-type", b"").decode("latin-1") or None
+
+    def _on_part_data(self, data, start, end):
+        if self._in_target:
+            self._chunks.append(bytes(data[start:end]))
+
+    def _on_part_end(self):
+        self._in_target = False
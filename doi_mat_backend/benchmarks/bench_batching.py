@@ -0,0 +1,81 @@
+# benchmarks/bench_batching.py
+"""
+Đo throughput của BatchingScheduler theo cửa sổ gom batch (max_wait_ms) trên CPU.
+
+Chạy từ thư mục doi_mat_backend:
+    python -m benchmarks.bench_batching --weights fasterrcnn_mobilenet_weights.pth
+"""
+import argparse
+import statistics
+import threading
+import time
+
+import torch
+
+from app.services import ObjectDetectionService, BatchingScheduler
+
+DEFAULT_IMAGES = ["app/img_test/2.jpg", "app/img_test/3.jpg"]
+
+
+def run_load(scheduler, images, clients, requests_per_client):
+    """Mỗi client gửi tuần tự `requests_per_client` ảnh; trả về (thời gian, danh sách latency)."""
+    latencies = []
+    lock = threading.Lock()
+
+    def client(idx):
+        for i in range(requests_per_client):
+            image_bytes = images[(idx + i) % len(images)]
+            start = time.perf_counter()
+            scheduler.submit(image_bytes).result()
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return time.perf_counter() - start, latencies
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="fasterrcnn_mobilenet_weights.pth")
+    parser.add_argument("--images", nargs="+", default=DEFAULT_IMAGES)
+    parser.add_argument("--windows", nargs="+", type=float, default=[0, 5, 10, 20])
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=4, help="số request mỗi client")
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = mặc định)")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    images = [open(path, "rb").read() for path in args.images]
+    service = ObjectDetectionService(model_path=args.weights, use_half=False)
+
+    # Warm-up để không tính thời gian khởi tạo
+    service.predict_batch(images)
+
+    print(f"device={service.device} torch_threads={torch.get_num_threads()} "
+          f"clients={args.clients} requests/client={args.requests} max_batch={args.max_batch_size}")
+    print(f"{'window_ms':>10} {'img/s':>8} {'avg_batch':>10} {'p50_ms':>8} {'p99_ms':>8}")
+    for window in args.windows:
+        scheduler = BatchingScheduler(service, max_batch_size=args.max_batch_size, max_wait_ms=window)
+        elapsed, latencies = run_load(scheduler, images, args.clients, args.requests)
+        scheduler.close()
+        stats = scheduler.stats
+        print(f"{window:>10.1f} {len(latencies) / elapsed:>8.2f} "
+              f"{stats['images'] / max(1, stats['batches']):>10.2f} "
+              f"{statistics.median(latencies) * 1000:>8.0f} {percentile(latencies, 0.99) * 1000:>8.0f}")
+
+
+if __name__ == "__main__":
+    main()
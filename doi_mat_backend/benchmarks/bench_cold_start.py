@@ -0,0 +1,82 @@
+# benchmarks/bench_cold_start.py
+"""
+Đo thời gian khởi động lạnh (mỗi lần đo là 1 process Python mới) cho từng file model:
+- import_s: import torch/torchvision + doi_mat_core.inference.
+- load_s: tạo InferenceEngine (dựng model + load_state_dict với .pth, torch.jit.load với TorchScript).
+- first_ms / second_ms: request đầu tiên và thứ hai khi KHÔNG warm-up.
+- warm_first_ms: request đầu tiên sau engine.warm_up() (MODEL_WARMUP=1), `warmup_s` là thời gian warm-up.
+Nếu không truyền --artifact, file TorchScript được export tạm từ --weights.
+
+Chạy từ thư mục doi_mat_backend:
+    python -m benchmarks.bench_cold_start --weights fasterrcnn_mobilenet_weights.pth --repeats 3
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+CHILD = r"""
+import json, sys, time
+started_at = time.perf_counter()
+from doi_mat_core.inference import InferenceEngine
+imported_at = time.perf_counter()
+engine = InferenceEngine(sys.argv[1], use_half=False)
+loaded_at = time.perf_counter()
+if sys.argv[3] == "1":
+    engine.warm_up()
+warmed_at = time.perf_counter()
+image = open(sys.argv[2], "rb").read()
+timings = []
+for _ in range(2):
+    t = time.perf_counter()
+    engine.predict_batch([image])
+    timings.append(1000 * (time.perf_counter() - t))
+print("RESULT " + json.dumps({
+    "import_s": imported_at - started_at, "load_s": loaded_at - imported_at,
+    "warmup_s": warmed_at - loaded_at, "first_ms": timings[0], "second_ms": timings[1],
+}))
+"""
+
+
+def run_child(model_path, image, warmup):
+    output = subprocess.run(
+        [sys.executable, "-c", CHILD, model_path, image, "1" if warmup else "0"],
+        capture_output=True, text=True, check=True, env={**os.environ, "PYTHONPATH": os.getcwd()}
+    ).stdout
+    line = next(line for line in output.splitlines() if line.startswith("RESULT "))
+    return json.loads(line[len("RESULT "):])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="fasterrcnn_mobilenet_weights.pth")
+    parser.add_argument("--artifact", default="", help="file TorchScript (mặc định: export tạm từ --weights)")
+    parser.add_argument("--image", default="app/img_test/3.jpg")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    artifact = args.artifact
+    temp_dir = None
+    if not artifact:
+        temp_dir = tempfile.TemporaryDirectory()
+        artifact = os.path.join(temp_dir.name, "model.ts")
+        subprocess.run([sys.executable, "-m", "app.export_model", "--weights", args.weights, "--output", artifact,
+                        "--check-image", args.image], capture_output=True, check=True)
+
+    print(f"{'model':>12} {'import_s':>9} {'load_s':>7} {'first_ms':>9} {'second_ms':>10} {'warmup_s':>9} {'warm_first_ms':>14}")
+    for name, path in (("state_dict", args.weights), ("torchscript", artifact)):
+        cold = [run_child(path, args.image, warmup=False) for _ in range(args.repeats)]
+        warm = [run_child(path, args.image, warmup=True) for _ in range(args.repeats)]
+        mean = lambda runs, key: float(np.mean([run[key] for run in runs]))
+        print(f"{name:>12} {mean(cold, 'import_s'):>9.2f} {mean(cold, 'load_s'):>7.2f} {mean(cold, 'first_ms'):>9.0f} "
+              f"{mean(cold, 'second_ms'):>10.0f} {mean(warm, 'warmup_s'):>9.2f} {mean(warm, 'first_ms'):>14.0f}")
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# benchmarks/bench_decode.py
+"""
+So sánh đường giải mã ảnh upload → tensor đã normalize (trước bước resize của model) theo từng giai đoạn:
+- old: BytesIO → PIL decode → convert RGB → ToTensor (float / 255) → normalize (mean/std).
+- new: torch.frombuffer (view, không copy) → decode_jpeg (uint8 CHW) → normalize gộp (Uint8RCNNTransform).
+Cột `ms`: thời gian trung bình mỗi giai đoạn; `alloc_mb`: số MB giai đoạn đó cấp phát mới
+(kích thước buffer kết quả, 0 nếu chỉ là view). Dòng `total` là tổng; `max_diff` là chênh lệch lớn nhất
+giữa 2 tensor cuối.
+
+Chạy từ thư mục doi_mat_backend:
+    python -m benchmarks.bench_decode --images app/img_test/*.jpg --repeats 20
+"""
+import argparse
+import glob
+import io
+import time
+from collections import defaultdict
+
+import numpy as np
+import torch
+from PIL import Image
+from torchvision.io import ImageReadMode, decode_jpeg
+from torchvision.transforms import ToTensor
+
+from doi_mat_core.inference import InferenceEngine, _read_only_uint8
+
+
+def nbytes(obj):
+    if isinstance(obj, torch.Tensor):
+        return obj.untyped_storage().nbytes()
+    if isinstance(obj, Image.Image):
+        return obj.width * obj.height * len(obj.getbands())
+    return 0
+
+
+def run_stages(stages, value, timings, allocs):
+    """Chạy lần lượt các giai đoạn, cộng dồn thời gian (ms) và số byte cấp phát mới (0 nếu giai đoạn chỉ tạo view)."""
+    for name, stage, is_view in stages:
+        started_at = time.perf_counter()
+        result = stage(value)
+        timings[name].append(1000 * (time.perf_counter() - started_at))
+        allocs[name] = 0 if is_view else nbytes(result)
+        value = result
+    return value
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="fasterrcnn_mobilenet_weights.pth")
+    parser.add_argument("--images", nargs="+", default=sorted(glob.glob("app/img_test/*.jpg")))
+    parser.add_argument("--repeats", type=int, default=20)
+    args = parser.parse_args()
+
+    engine = InferenceEngine(args.weights, use_half=False, device="cpu")
+    reference_transform = engine.model.transform
+    fused_transform = engine._models[engine.input_profile].transform
+    to_tensor = ToTensor()
+    old_stages = [
+        ("pil_decode", lambda data: Image.open(io.BytesIO(data)).convert("RGB"), False),
+        ("to_tensor", to_tensor, False),
+        ("normalize", reference_transform.normalize, False),
+    ]
+    new_stages = [
+        ("frombuffer", _read_only_uint8, True),
+        ("decode_jpeg", lambda buffer: decode_jpeg(buffer, mode=ImageReadMode.RGB), False),
+        ("fused_normalize", fused_transform.normalize, False),
+    ]
+
+    print(f"images={len(args.images)} repeats={args.repeats} torch_threads={torch.get_num_threads()}")
+    for name, stages in (("old", old_stages), ("new", new_stages)):
+        timings = defaultdict(list); allocs = {}; diffs = []
+        for path in args.images:
+            data = open(path, "rb").read()
+            for _ in range(args.repeats):
+                result = run_stages(stages, data, timings, allocs)
+            reference = run_stages(old_stages, data, defaultdict(list), {})
+            diffs.append((result - reference).abs().max().item())
+        print(f"\n[{name}] max_diff={max(diffs):.2e}")
+        print(f"{'stage':>16} {'ms':>8} {'alloc_mb':>9}")
+        for stage, _, _ in stages:
+            print(f"{stage:>16} {np.mean(timings[stage]):>8.2f} {allocs[stage] / 1024 / 1024:>9.2f}")
+        total_ms = sum(np.mean(timings[stage]) for stage, _, _ in stages)
+        print(f"{'total':>16} {total_ms:>8.2f} {sum(allocs.values()) / 1024 / 1024:>9.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/bench_frame_buffers.py
+"""
+So sánh bước chuẩn bị frame video trước khi vào model (giải mã → thu nhỏ → BGR→RGB → tensor):
+- alloc: mỗi frame cấp phát mới (cap.read, cv2.resize, cv2.cvtColor, ToTensor float) như trước.
+- pool: FrameSampler(reuse_frames=True) + FrameBufferPool — ghi vào buffer dựng sẵn, tensor uint8 là view.
+Video được đọc lại `--loops` lần (lấy mọi frame, stride = 1) để giả lập video dài.
+Cột `ms/frame`: thời gian chuẩn bị trung bình; `numpy_peak_mb`: đỉnh bộ nhớ NumPy/OpenCV cấp phát
+(tracemalloc); `rss_growth_mb`: RSS tăng thêm trong lúc chạy; `buffers`: số FrameBuffer pool đã tạo.
+
+Chạy từ thư mục doi_mat_backend:
+    python -m benchmarks.bench_frame_buffers --weights fasterrcnn_mobilenet_weights.pth --video app/video_test/4.mp4 --loops 5 --profile realtime
+"""
+import argparse
+import resource
+import time
+import tracemalloc
+
+import cv2
+import torch
+from torchvision.transforms import ToTensor
+
+from app.frame_sampling import BatchPrefetcher, FrameBufferPool, FrameSampler
+from doi_mat_core.inference import INPUT_SIZES, InferenceEngine
+
+
+def rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run(video, loops, batch_size, target, pooled):
+    """Trả về (số frame, ms/frame, numpy_peak_mb, rss_growth_mb, buffers)."""
+    to_tensor = ToTensor()
+    pool = FrameBufferPool(3 * batch_size, target=target) if pooled else None
+
+    def allocate(frame):
+        if target is not None:
+            frame = cv2.resize(frame, target, interpolation=cv2.INTER_AREA)
+        return to_tensor(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+    rss_before = rss_mb()
+    tracemalloc.start()
+    frames = 0
+    started_at = time.perf_counter()
+    for _ in range(loops):
+        cap = cv2.VideoCapture(video)
+        sampler = FrameSampler(cap, video, mode="stride", stride=1, skip="grab", reuse_frames=pooled)
+        with BatchPrefetcher(sampler, batch_size=batch_size, transform=pool.load if pooled else allocate) as batches:
+            for batch in batches:
+                frames += len(batch)
+                if pooled:
+                    pool.release(buffer for _, buffer in batch)
+        cap.release()
+    elapsed = time.perf_counter() - started_at
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return (frames, 1000 * elapsed / max(frames, 1), peak / 1024 / 1024, rss_mb() - rss_before,
+            pool.allocated if pooled else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="fasterrcnn_mobilenet_weights.pth")
+    parser.add_argument("--video", default="app/video_test/4.mp4")
+    parser.add_argument("--loops", type=int, default=5)
+    parser.add_argument("--batch-size", type=int, default=4)
+    parser.add_argument("--profile", choices=sorted(INPUT_SIZES), default="realtime")
+    args = parser.parse_args()
+
+    cap = cv2.VideoCapture(args.video)
+    frame_size = (int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    cap.release()
+    engine = InferenceEngine(args.weights, use_half=False, device="cpu", input_profile=args.profile)
+    target = engine.target_size(*frame_size, args.profile)
+    print(f"video={args.video} frame={frame_size} target={target} loops={args.loops} "
+          f"torch_threads={torch.get_num_threads()}")
+    print(f"{'mode':>6} {'frames':>7} {'ms/frame':>9} {'numpy_peak_mb':>14} {'rss_growth_mb':>14} {'buffers':>8}")
+    # pool chạy trước để RSS tăng thêm của alloc không che mất số của pool
+    for name, pooled in (("pool", True), ("alloc", False)):
+        frames, ms, peak, growth, buffers = run(args.video, args.loops, args.batch_size, target, pooled)
+        print(f"{name:>6} {frames:>7} {ms:>9.2f} {peak:>14.2f} {growth:>14.1f} {buffers:>8}")
+
+
+if __name__ == "__main__":
+    main()
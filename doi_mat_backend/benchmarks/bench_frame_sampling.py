@@ -0,0 +1,76 @@
+# benchmarks/bench_frame_sampling.py
+"""
+Đo thời gian giải mã + lấy mẫu frame (không chạy model) theo từng video:
+- read_all: cap.read() mọi frame rồi bỏ qua theo frame_count % frame_skip (cách cũ).
+- grab / seek / auto: FrameSampler với các cách bỏ qua frame khác nhau.
+- keyframes: chỉ lấy các keyframe.
+
+Chạy từ thư mục doi_mat_backend:
+    python -m benchmarks.bench_frame_sampling --videos app/video_test/*.mp4
+"""
+import argparse
+import glob
+import time
+
+import cv2
+
+from app.frame_sampling import FrameSampler
+
+
+def run_read_all(video_path, samples_per_second):
+    cap = cv2.VideoCapture(video_path)
+    fps = cap.get(cv2.CAP_PROP_FPS)
+    frame_skip = max(1, int(fps / samples_per_second))
+    frame_count = 0
+    sampled = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_count += 1
+        if frame_count % frame_skip != 0:
+            continue
+        sampled.append(frame_count)
+    cap.release()
+    return sampled, "-"
+
+
+def run_sampler(video_path, samples_per_second, mode, skip):
+    cap = cv2.VideoCapture(video_path)
+    sampler = FrameSampler(cap, video_path, mode=mode, samples_per_second=samples_per_second, skip=skip)
+    sampled = [frame_number for frame_number, _ in sampler]
+    cap.release()
+    return sampled, sampler.skip
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--videos", nargs="+", default=sorted(glob.glob("app/video_test/*.mp4")))
+    parser.add_argument("--samples-per-second", type=float, default=1.0)
+    args = parser.parse_args()
+
+    runs = (
+        ("read_all", lambda path: run_read_all(path, args.samples_per_second)),
+        ("grab", lambda path: run_sampler(path, args.samples_per_second, "per_second", "grab")),
+        ("seek", lambda path: run_sampler(path, args.samples_per_second, "per_second", "seek")),
+        ("auto", lambda path: run_sampler(path, args.samples_per_second, "per_second", "auto")),
+        ("keyframes", lambda path: run_sampler(path, args.samples_per_second, "keyframes", "auto")),
+    )
+    print(f"{'video':>28} {'frames':>7} {'mode':>10} {'skip':>5} {'time_s':>8} {'samples':>8} {'same':>5}")
+    for video_path in args.videos:
+        cap = cv2.VideoCapture(video_path)
+        total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        cap.release()
+        baseline = None
+        for name, run in runs:
+            started_at = time.perf_counter()
+            sampled, skip = run(video_path)
+            elapsed = time.perf_counter() - started_at
+            if baseline is None:
+                baseline = sampled
+            same = "-" if name == "keyframes" else ("yes" if sampled == baseline else "no")
+            print(f"{video_path[-28:]:>28} {total:>7} {name:>10} {skip:>5} {elapsed:>8.2f} {len(sampled):>8} {same:>5}")
+
+
+if __name__ == "__main__":
+    main()
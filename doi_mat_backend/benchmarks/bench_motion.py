@@ -0,0 +1,93 @@
+# benchmarks/bench_motion.py
+"""
+Độ chính xác đếm đối tượng theo mật độ lấy mẫu, có và không có mô hình chuyển động (không cần model).
+Cảnh giả lập 30 fps: --objects đối tượng di chuyển nhanh (nảy lại ở mép khung hình) suốt --seconds giây.
+Với mỗi số frame lấy mẫu mỗi giây, tracker chỉ nhận detection của các frame đó; số đối tượng đếm được
+lọc giống process_video_for_quiz (tồn tại ít nhất 1 giây) rồi so với số đối tượng thật.
+`forwards` = số lần chạy model tương ứng trên video thật; `ids` = số id track đã tạo (lý tưởng = truth,
+lớn hơn = track bị cắt vụn — số đếm sau lọc 1 giây có thể che mất điều này). Số liệu là trung bình trên --seeds cảnh.
+
+Kết quả đo (5 seed, 1080p; thật = 8 hoặc 20):
+- ≤ 3 px/frame: kalman đếm sát thực tế (8.0–8.6 / 20.0–22.2, ids gần bằng) ở 0.5–2 mẫu/s;
+  none đếm thừa tới 6 lần và cắt vụn track (ids 37–490).
+- 4 px/frame: kalman lệch 15–35% ở 0.5–2 mẫu/s (9.2–10.4 / 23.2–26.8), đúng từ 5 mẫu/s.
+- ≥ 6 px/frame: cả 2 đều đếm thừa dưới 10 mẫu/s (8 vật, 8 px/frame: kalman 22.6 ở 1 mẫu/s, 25.4 ở 2 mẫu/s,
+  none 16.4 / 37.2 với ids 142 / 264); ở 10 mẫu/s kalman 8.4 (ids 10.4), none 10.6 (ids 55.4).
+- 1 vật, 8 px/frame, 10 mẫu/s: kalman 1.2 (ids 1.4), none 0.8 (ids 14.8).
+→ Kalman chỉ cho phép giảm VIDEO_SAMPLES_PER_SECOND khi vật di chuyển chậm.
+
+Chạy từ thư mục doi_mat_backend:
+    python -m benchmarks.bench_motion --objects 8 --speed 3
+    python -m benchmarks.bench_motion --objects 8 --speed 8
+"""
+import argparse
+
+import numpy as np
+
+from doi_mat_core.tracking import ObjectTracker
+
+FPS = 30
+WIDTH, HEIGHT = 1920, 1080
+
+
+def make_trajectories(num_objects, num_frames, speed, seed=0):
+    """Box (num_frames, num_objects, 4) và nhãn của từng đối tượng."""
+    rng = np.random.default_rng(seed)
+    sizes = rng.uniform(60, 140, size=(num_objects, 2))
+    position = rng.uniform([0, 0], [WIDTH, HEIGHT], size=(num_objects, 2)) - sizes
+    position = np.clip(position, 0, None)
+    angle = rng.uniform(0, 2 * np.pi, size=num_objects)
+    velocity = speed * np.stack([np.cos(angle), np.sin(angle)], axis=1)
+    labels = rng.integers(1, 21, size=num_objects)
+    boxes = np.zeros((num_frames, num_objects, 4), dtype=np.float32)
+    limit = np.array([WIDTH, HEIGHT]) - sizes
+    for frame in range(num_frames):
+        position += velocity
+        bounce = (position < 0) | (position > limit)
+        velocity[bounce] *= -1
+        position = np.clip(position, 0, limit)
+        boxes[frame] = np.concatenate([position, position + sizes], axis=1)
+    return boxes, labels
+
+
+def count_objects(boxes, labels, samples_per_second, motion, seed=0):
+    rng = np.random.default_rng(seed)
+    stride = max(1, int(FPS / samples_per_second))
+    tracker = ObjectTracker(max_disappeared=20, iou_threshold=0.4, max_lost_age=50, motion=motion)
+    forwards = 0
+    for frame in range(stride - 1, len(boxes), stride):
+        forwards += 1
+        jitter = rng.normal(0, 2, size=boxes[frame].shape).astype(np.float32)
+        detections = [(boxes[frame, i] + jitter[i], int(labels[i]), 0.9) for i in range(len(labels))]
+        tracker.update(detections, frame + 1)
+    all_objects = {**tracker.objects, **tracker.lost_objects}
+    counted = sum(1 for data in all_objects.values() if data['last_seen'] - data['first_seen'] >= FPS)
+    return counted, tracker.next_object_id, forwards
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--objects", type=int, default=8)
+    parser.add_argument("--seconds", type=int, default=20)
+    parser.add_argument("--speed", type=float, default=8.0, help="tốc độ di chuyển (px/frame)")
+    parser.add_argument("--samples-per-second", type=float, nargs="+", default=[0.5, 1, 2, 5, 10])
+    parser.add_argument("--seeds", type=int, default=5, help="số cảnh ngẫu nhiên để lấy trung bình")
+    args = parser.parse_args()
+
+    scenes = [make_trajectories(args.objects, args.seconds * FPS, args.speed, seed) for seed in range(args.seeds)]
+    print(f"objects={args.objects} seconds={args.seconds} speed={args.speed}px/frame seeds={args.seeds}")
+    print(f"{'samples/s':>10} {'forwards':>9} {'none':>6} {'ids':>7} {'kalman':>7} {'ids':>7} {'truth':>6}")
+    for samples_per_second in args.samples_per_second:
+        counts, ids = {}, {}
+        for motion in ("none", "kalman"):
+            results = [count_objects(boxes, labels, samples_per_second, motion, seed)
+                       for seed, (boxes, labels) in enumerate(scenes)]
+            counts[motion] = np.mean([counted for counted, _, _ in results])
+            ids[motion] = np.mean([created for _, created, _ in results])
+            forwards = results[0][2]
+        print(f"{samples_per_second:>10} {forwards:>9} {counts['none']:>6.1f} {ids['none']:>7.1f} "
+              f"{counts['kalman']:>7.1f} {ids['kalman']:>7.1f} {args.objects:>6}")
+
+
+if __name__ == "__main__":
+    main()
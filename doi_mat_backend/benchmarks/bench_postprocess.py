@@ -0,0 +1,83 @@
+# benchmarks/bench_postprocess.py
+"""
+Đo hậu xử lý output model (lọc confidence → NMS → box/label/score cho từng ảnh):
+- per_image: cách cũ — mỗi ảnh 1 lần nms + .cpu() riêng, kết quả thành list dict.
+- batched: doi_mat_core.postprocess.postprocess_batch — tensor ops, 1 lần chuyển về CPU cho cả batch, dạng cột
+  (`+dicts`: thêm Detections.to_dicts() như /predict trả JSON).
+Output giả lập: mỗi ảnh `--detections` box ngẫu nhiên (model trả tối đa 100), score đều trên [0, 1].
+
+Chạy từ thư mục doi_mat_backend:
+    python -m benchmarks.bench_postprocess --batch-size 8 --detections 100 --device cpu
+"""
+import argparse
+import time
+
+import numpy as np
+import torch
+from torchvision.ops import nms
+
+from doi_mat_core.postprocess import NMS_MODES, postprocess_batch
+
+
+def fake_outputs(batch_size, detections, device, generator):
+    outputs = []
+    for _ in range(batch_size):
+        corner = torch.rand(detections, 2, generator=generator) * 600
+        size = torch.rand(detections, 2, generator=generator) * 150 + 10
+        outputs.append({
+            "boxes": torch.cat([corner, corner + size], dim=1).to(device),
+            "scores": torch.rand(detections, generator=generator).to(device),
+            "labels": torch.randint(1, 21, (detections,), generator=generator).to(device),
+        })
+    return outputs
+
+
+def per_image(outputs, threshold, iou_threshold, scale):
+    results = []
+    for output in outputs:
+        keep = output["scores"] >= threshold
+        boxes, scores, labels = output["boxes"][keep], output["scores"][keep], output["labels"][keep]
+        if len(boxes) > 0:
+            keep = nms(boxes.float(), scores.float(), iou_threshold)
+            boxes, scores, labels = boxes[keep], scores[keep], labels[keep]
+        boxes = boxes.float().cpu().numpy() * np.array([scale[0], scale[1], scale[0], scale[1]], dtype=np.float32)
+        results.append([{"box": box, "label": label, "score": float(score)}
+                        for box, label, score in zip(boxes.tolist(), labels.tolist(), scores.tolist())])
+    return results
+
+
+def timed(function, repeats):
+    function()  # warm-up
+    started_at = time.perf_counter()
+    for _ in range(repeats):
+        function()
+    return 1000 * (time.perf_counter() - started_at) / repeats
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--detections", type=int, default=100)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--repeats", type=int, default=200)
+    args = parser.parse_args()
+
+    outputs = fake_outputs(args.batch_size, args.detections, args.device, torch.Generator().manual_seed(0))
+    scale = (1.5, 1.5)
+    scales = [scale] * len(outputs)
+    print(f"device={args.device} batch={args.batch_size} detections/image={args.detections} "
+          f"torch_threads={torch.get_num_threads()}")
+    print(f"{'variant':>28} {'ms/batch':>9} {'kept':>6}")
+    kept = sum(len(result) for result in per_image(outputs, args.threshold, 0.5, scale))
+    print(f"{'per_image':>28} {timed(lambda: per_image(outputs, args.threshold, 0.5, scale), args.repeats):>9.3f} {kept:>6}")
+    for mode in NMS_MODES:
+        run = lambda: postprocess_batch(outputs, args.threshold, 0.5, mode, scales)
+        kept = sum(len(result) for result in run())
+        print(f"{'batched ' + mode:>28} {timed(run, args.repeats):>9.3f} {kept:>6}")
+    run = lambda: [result.to_dicts() for result in postprocess_batch(outputs, args.threshold, 0.5, NMS_MODES[0], scales)]
+    print(f"{'batched ' + NMS_MODES[0] + '+dicts':>28} {timed(run, args.repeats):>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+# benchmarks/bench_quantization.py
+"""
+So sánh độ chính xác và độ trễ giữa FP32 và INT8 động (INFERENCE_QUANTIZE=dynamic) trên CPU.
+- Có --voc-root: tập VOC giữ lại (mặc định image_set "val", model được train trên "train"),
+  đọc bằng app/train_test/voc_dataset.VOCDataset, tính mAP@0.5 của từng chế độ so với nhãn thật.
+- Không có: chạy trên --images, chỉ so sánh INT8 với FP32.
+Cột `agree`: tỉ lệ detection của FP32 được INT8 tìm lại (cùng nhãn, IoU >= 0.5);
+`score_diff`: chênh lệch score trung bình của các cặp đó; `size_mb`: kích thước state_dict.
+
+Chạy từ thư mục doi_mat_backend:
+    python -m benchmarks.bench_quantization --weights fasterrcnn_mobilenet_weights.pth --voc-root ./VOC2012 --limit 200
+"""
+import argparse
+import glob
+import io
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from doi_mat_core.inference import InferenceEngine, QUANTIZE_MODES
+from doi_mat_core.tracking import iou_matrix
+
+
+def load_samples(args):
+    """Danh sách (ảnh PIL RGB, nhãn thật hoặc None)."""
+    if args.voc_root:
+        from app.train_test.voc_dataset import VOCDataset
+        dataset = VOCDataset(root=args.voc_root, year=args.year, image_set=args.image_set, download=False,
+                             transform=None)
+        count = min(len(dataset), args.limit)
+        return [dataset[i] for i in range(count)]
+    return [(Image.open(path).convert("RGB"), None) for path in args.images[:args.limit]]
+
+
+def model_size_mb(model):
+    buffer = io.BytesIO()
+    torch.save(model.state_dict(), buffer)
+    return buffer.tell() / 1024 / 1024
+
+
+def average_precision(detections, targets, label):
+    """AP@0.5 (VOC, nội suy mọi điểm) cho 1 lớp trên toàn bộ ảnh."""
+    scored = []  # (score, đúng/sai)
+    num_truth = 0
+    for dets, target in zip(detections, targets):
+        truth = target['boxes'].numpy()[target['labels'].numpy() == label]
+        num_truth += len(truth)
+        dets = sorted((det for det in dets if det['label'] == label), key=lambda det: -det['score'])
+        if not dets:
+            continue
+        ious = iou_matrix(np.array([det['box'] for det in dets]), truth) if len(truth) else None
+        matched = set()
+        for i, det in enumerate(dets):
+            hit = False
+            if ious is not None:
+                j = int(ious[i].argmax())
+                if ious[i, j] >= 0.5 and j not in matched:
+                    matched.add(j)
+                    hit = True
+            scored.append((det['score'], hit))
+    if num_truth == 0:
+        return None
+    scored.sort(key=lambda item: -item[0])
+    hits = np.array([hit for _, hit in scored], dtype=np.float64)
+    tp = np.cumsum(hits); fp = np.cumsum(1 - hits)
+    recall = np.concatenate([[0], tp / num_truth, [1]])
+    precision = np.concatenate([[0], tp / np.maximum(tp + fp, 1e-9), [0]])
+    precision = np.maximum.accumulate(precision[::-1])[::-1]
+    changed = np.flatnonzero(recall[1:] != recall[:-1])
+    return float(np.sum((recall[changed + 1] - recall[changed]) * precision[changed + 1]))
+
+
+def mean_average_precision(detections, targets, num_classes):
+    aps = [average_precision(detections, targets, label) for label in range(1, num_classes)]
+    aps = [ap for ap in aps if ap is not None]
+    return float(np.mean(aps)) if aps else float("nan")
+
+
+def agreement(reference, candidate):
+    """Tỉ lệ detection của `reference` được `candidate` tìm lại và chênh lệch score trung bình."""
+    total = 0; found = 0; diffs = []
+    for ref_dets, cand_dets in zip(reference, candidate):
+        total += len(ref_dets)
+        if not ref_dets or not cand_dets:
+            continue
+        ious = iou_matrix(np.array([det['box'] for det in ref_dets]), np.array([det['box'] for det in cand_dets]))
+        for i, det in enumerate(ref_dets):
+            same_label = np.array([cand['label'] == det['label'] for cand in cand_dets])
+            row = np.where(same_label, ious[i], 0)
+            j = int(row.argmax())
+            if row[j] >= 0.5:
+                found += 1
+                diffs.append(abs(det['score'] - cand_dets[j]['score']))
+    return (found / total if total else float("nan")), (float(np.mean(diffs)) if diffs else float("nan"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="fasterrcnn_mobilenet_weights.pth")
+    parser.add_argument("--voc-root", default="")
+    parser.add_argument("--year", default="2012")
+    parser.add_argument("--image-set", default="val")
+    parser.add_argument("--images", nargs="+", default=sorted(glob.glob("app/img_test/*.jpg")))
+    parser.add_argument("--limit", type=int, default=100)
+    parser.add_argument("--threshold", type=float, default=0.5)
+    parser.add_argument("--threads", type=int, default=0, help="torch intra-op threads (0 = mặc định)")
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    samples = load_samples(args)
+    targets = [target for _, target in samples]
+    print(f"images={len(samples)} torch_threads={torch.get_num_threads()} "
+          f"quantized_engine={torch.backends.quantized.engine}")
+
+    results = {}
+    for mode in QUANTIZE_MODES:
+        engine = InferenceEngine(args.weights, use_half=False, device="cpu", quantize=mode)
+        tensors = [engine.to_tensor(image) for image, _ in samples]
+        engine.forward(tensors[:1])  # warm-up
+        latencies = []; detections = []
+        for tensor in tensors:
+            started_at = time.perf_counter()
+            detections.append(engine.predict_tensors([tensor], args.threshold)[0])
+            latencies.append(1000 * (time.perf_counter() - started_at))
+        results[mode] = (model_size_mb(engine.model), latencies, detections)
+
+    reference = results["none"][2]
+    print(f"{'mode':>8} {'size_mb':>8} {'avg_ms':>8} {'p50_ms':>8} {'p95_ms':>8} {'mAP@0.5':>8} {'agree':>6} {'score_diff':>11}")
+    for mode, (size, latencies, detections) in results.items():
+        mean_ap = mean_average_precision(detections, targets, len(engine.classes)) if args.voc_root else float("nan")
+        agree, score_diff = agreement(reference, detections)
+        print(f"{mode:>8} {size:>8.1f} {np.mean(latencies):>8.1f} {np.percentile(latencies, 50):>8.1f} "
+              f"{np.percentile(latencies, 95):>8.1f} {mean_ap:>8.3f} {agree:>6.1%} {score_diff:>11.4f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+# benchmarks/bench_replicas.py
+"""
+Đo bộ nhớ mỗi replica và throughput khi tăng số process của ProcessInferenceExecutor,
+so sánh trọng số dùng chung (shared memory) với mỗi process tự load trọng số.
+
+Chạy từ thư mục doi_mat_backend (chỉ trên Linux, đọc /proc/<pid>/smaps_rollup):
+    python -m benchmarks.bench_replicas --weights fasterrcnn_mobilenet_weights.pth --replicas 1 2 4
+"""
+import argparse
+import threading
+import time
+
+from app.executor import ProcessInferenceExecutor
+
+DEFAULT_IMAGES = ["app/img_test/2.jpg", "app/img_test/3.jpg"]
+
+
+def memory_mb(pid):
+    """Trả về (RSS, PSS, Private) của process tính bằng MB."""
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(":") and parts[1].isdigit():
+                values[parts[0][:-1]] = int(parts[1]) / 1024
+    private = values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)
+    return values.get("Rss", 0), values.get("Pss", 0), private
+
+
+def measure_throughput(executor, images, clients, requests_per_client):
+    def client(idx):
+        for i in range(requests_per_client):
+            executor.submit(images[(idx + i) % len(images)]).result()
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return clients * requests_per_client / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="fasterrcnn_mobilenet_weights.pth")
+    parser.add_argument("--images", nargs="+", default=DEFAULT_IMAGES)
+    parser.add_argument("--replicas", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--requests", type=int, default=4, help="số request mỗi client")
+    parser.add_argument("--threads", type=int, default=0, help="torch threads mỗi replica (0 = chia đều core)")
+    args = parser.parse_args()
+
+    images = [open(path, "rb").read() for path in args.images]
+    # idle_*: ngay sau khi load model; rss/pss/private: sau khi chạy tải (gồm cả bộ nhớ activation)
+    print(f"{'replicas':>8} {'shared':>7} {'idle_pss':>9} {'idle_priv':>10} "
+          f"{'rss_mb':>8} {'pss_mb':>8} {'private_mb':>11} {'img/s':>8}")
+    for share_weights in (True, False):
+        for replicas in args.replicas:
+            executor = ProcessInferenceExecutor(
+                args.weights, num_workers=replicas, max_pending=0,
+                num_threads=args.threads, use_half=False, share_weights=share_weights
+            )
+            idle = [memory_mb(pid) for pid in executor.replica_pids]
+            # Warm-up mỗi replica trước khi đo
+            for future in [executor.submit(images[0]) for _ in range(replicas)]:
+                future.result()
+            throughput = measure_throughput(executor, images, args.clients, args.requests)
+            usage = [memory_mb(pid) for pid in executor.replica_pids]
+            executor.close()
+            rss, pss, private = (sum(u[k] for u in usage) / len(usage) for k in range(3))
+            idle_pss, idle_private = (sum(u[k] for u in idle) / len(idle) for k in (1, 2))
+            print(f"{replicas:>8} {str(share_weights):>7} {idle_pss:>9.0f} {idle_private:>10.0f} "
+                  f"{rss:>8.0f} {pss:>8.0f} {private:>11.0f} {throughput:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+# benchmarks/bench_tracker.py
+"""
+Micro-benchmark ObjectTracker.update theo số track/detection mỗi frame (không cần model).
+Cảnh giả lập: --objects đối tượng di chuyển có nhiễu, thỉnh thoảng bị miss; với --churn mỗi frame
+một phần đối tượng rời khung hình và được thay bằng đối tượng mới (nhiều track mất dấu → kiểm tra re-ID).
+- loop: IoU tính bằng vòng lặp Python qua _calculate_iou (cách cũ).
+- greedy: IoU vectorized + ghép cặp greedy (mặc định), phải cho kết quả giống hệt "loop".
+- hungarian: IoU vectorized + ghép cặp tối ưu (cần scipy).
+
+Chạy từ thư mục doi_mat_backend:
+    python -m benchmarks.bench_tracker --objects 5 20 50 100
+"""
+import argparse
+import time
+
+import numpy as np
+
+import doi_mat_core.tracking as tracking
+from doi_mat_core.tracking import ObjectTracker
+
+
+def loop_iou_matrix(boxes_a, boxes_b):
+    """Cách tính cũ: gọi _calculate_iou cho từng cặp."""
+    tracker = ObjectTracker()
+    matrix = np.zeros((len(boxes_a), len(boxes_b)))
+    for i, box_a in enumerate(boxes_a):
+        for j, box_b in enumerate(boxes_b):
+            matrix[i, j] = tracker._calculate_iou(box_a, box_b)
+    return matrix
+
+
+def make_scene(num_objects, num_frames, seed=0, churn=0.0):
+    """Danh sách detections cho từng frame: (box, label, score)."""
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(0, 1500, size=(num_objects, 2))
+    velocities = rng.normal(0, 4, size=(num_objects, 2))
+    sizes = rng.uniform(30, 120, size=(num_objects, 2))
+    labels = rng.integers(1, 21, size=num_objects)
+    frames = []
+    for _ in range(num_frames):
+        replaced = rng.random(num_objects) < churn
+        positions[replaced] = rng.uniform(0, 1500, size=(int(replaced.sum()), 2))
+        positions += velocities + rng.normal(0, 1.5, size=positions.shape)
+        visible = rng.random(num_objects) > 0.1
+        detections = [
+            (np.array([*positions[i], *(positions[i] + sizes[i])], dtype=np.float32), int(labels[i]), 0.9)
+            for i in range(num_objects) if visible[i]
+        ]
+        rng.shuffle(detections)
+        frames.append(detections)
+    return frames
+
+
+def run(frames, assignment, iou_function):
+    tracking.iou_matrix = iou_function
+    tracker = ObjectTracker(max_disappeared=20, iou_threshold=0.4, max_lost_age=50, assignment=assignment)
+    started_at = time.perf_counter()
+    for frame_count, detections in enumerate(frames, start=1):
+        tracker.update(detections, frame_count)
+    elapsed = time.perf_counter() - started_at
+    return tracker, elapsed
+
+
+def snapshot(tracker):
+    objects = {oid: (data['label'], data['first_seen'], data['last_seen']) for oid, data in tracker.objects.items()}
+    lost = {oid: (data['label'], data['first_seen'], data['last_seen']) for oid, data in tracker.lost_objects.items()}
+    return objects, lost, tracker.next_object_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--objects", type=int, nargs="+", default=[5, 20, 50, 100])
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--churn", type=float, default=0.0, help="tỉ lệ đối tượng bị thay mới mỗi frame")
+    args = parser.parse_args()
+
+    vectorized = tracking.iou_matrix
+    runs = (("loop", "greedy", loop_iou_matrix), ("greedy", "greedy", vectorized), ("hungarian", "hungarian", vectorized))
+    print(f"{'objects':>8} {'mode':>10} {'us/update':>10} {'tracks':>7} {'lost':>6} {'same':>5}")
+    for num_objects in args.objects:
+        frames = make_scene(num_objects, args.frames, churn=args.churn)
+        baseline = None
+        for name, assignment, iou_function in runs:
+            tracker, elapsed = run(frames, assignment, iou_function)
+            result = snapshot(tracker)
+            if baseline is None:
+                baseline = result
+            same = "yes" if result == baseline else "no"
+            print(f"{num_objects:>8} {name:>10} {1e6 * elapsed / len(frames):>10.1f} {tracker.next_object_id:>7} {len(tracker.lost_objects):>6} {same:>5}")
+    tracking.iou_matrix = vectorized
+
+
+if __name__ == "__main__":
+    main()
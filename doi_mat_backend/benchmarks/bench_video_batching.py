@@ -0,0 +1,54 @@
+# benchmarks/bench_video_batching.py
+"""
+Đo thời gian phân tích video với số frame mỗi lần forward khác nhau (--batch-sizes).
+Với mọi batch size, frame của batch sau được giải mã song song khi model đang chạy.
+Cột `tracks` là số đối tượng tracker tìm được, phải giống nhau giữa các batch size.
+
+Chạy từ thư mục doi_mat_backend:
+    python -m benchmarks.bench_video_batching --weights fasterrcnn_mobilenet_weights.pth --video app/video_test/4.mp4
+"""
+import argparse
+import time
+
+import torch
+
+import app.video_processor as video_processor
+from app.services import ObjectDetectionService
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="fasterrcnn_mobilenet_weights.pth")
+    parser.add_argument("--video", default="app/video_test/4.mp4")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--samples-per-second", type=float, default=1.0)
+    args = parser.parse_args()
+
+    service = ObjectDetectionService(model_path=args.weights, use_half=False)
+    print(f"video={args.video} torch_threads={torch.get_num_threads()}")
+    print(f"{'batch':>6} {'total_s':>8} {'frames':>7} {'forwards':>9} {'ms/frame':>9} {'tracks':>7}")
+
+    # Đếm số track bằng cách bọc ObjectTracker.update
+    tracked = {}
+    original_update = video_processor.ObjectTracker.update
+
+    def counting_update(self, detections, frame_number):
+        result = original_update(self, detections, frame_number)
+        tracked["ids"] = self.next_object_id
+        return result
+
+    video_processor.ObjectTracker.update = counting_update
+    for batch_size in args.batch_sizes:
+        stats = {}
+        started_at = time.perf_counter()
+        video_processor.process_video_for_quiz(
+            args.video, service.engine, service.VOC_CLASSES, stats=stats,
+            samples_per_second=args.samples_per_second, batch_size=batch_size
+        )
+        total = time.perf_counter() - started_at
+        print(f"{batch_size:>6} {total:>8.2f} {stats['frames']:>7} {stats['batches']:>9} "
+              f"{1000 * total / max(1, stats['frames']):>9.1f} {tracked.get('ids', 0):>7}")
+
+
+if __name__ == "__main__":
+    main()
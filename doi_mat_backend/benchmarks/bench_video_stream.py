@@ -0,0 +1,90 @@
+# benchmarks/bench_video_stream.py
+"""
+So sánh time-to-first-inference khi phân tích video đang được upload:
+- spooled: ghi toàn bộ upload ra file tạm rồi mới giải mã (cách cũ).
+- streaming: đưa dữ liệu vào decoder qua FIFO ngay khi nhận được (FifoVideoFeed).
+Upload được giả lập bằng cách ghi từng chunk với tốc độ --rate-mbps.
+
+Chạy từ thư mục doi_mat_backend:
+    python -m benchmarks.bench_video_stream --weights fasterrcnn_mobilenet_weights.pth --video app/video_test/1.mp4
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+
+from app.services import ObjectDetectionService
+from app.video_processor import process_video_for_quiz
+from app.video_stream import FifoVideoFeed, is_streamable_video
+
+CHUNK_SIZE = 64 * 1024
+
+
+def simulated_upload(data, rate_mbps):
+    """Sinh các chunk với tốc độ giới hạn, giống upload qua mạng."""
+    delay = CHUNK_SIZE / (rate_mbps * 1024 * 1024)
+    for offset in range(0, len(data), CHUNK_SIZE):
+        time.sleep(delay)
+        yield data[offset:offset + CHUNK_SIZE]
+
+
+def run_spooled(data, rate_mbps, service, directory):
+    started_at = time.monotonic()
+    path = os.path.join(directory, "upload.mp4")
+    with open(path, "wb") as f:
+        for chunk in simulated_upload(data, rate_mbps):
+            f.write(chunk)
+    peak_disk = os.path.getsize(path)
+    stats = {}
+    process_video_for_quiz(path, service.engine, service.VOC_CLASSES, stats=stats)
+    os.remove(path)
+    return stats, started_at, time.monotonic() - started_at, peak_disk
+
+
+def run_streaming(data, rate_mbps, service, directory):
+    started_at = time.monotonic()
+    feed = FifoVideoFeed(directory)
+
+    def upload():
+        for chunk in simulated_upload(data, rate_mbps):
+            if not feed.write(chunk):
+                break
+        feed.cleanup()
+
+    writer = threading.Thread(target=upload)
+    writer.start()
+    stats = {}
+    try:
+        process_video_for_quiz(feed.path, service.engine, service.VOC_CLASSES, stats=stats)
+    finally:
+        feed.abort()
+        writer.join()
+        feed.cleanup()
+    return stats, started_at, time.monotonic() - started_at, 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="fasterrcnn_mobilenet_weights.pth")
+    parser.add_argument("--video", default="app/video_test/1.mp4")
+    parser.add_argument("--rate-mbps", type=float, default=2.0, help="tốc độ upload giả lập (MB/s)")
+    args = parser.parse_args()
+
+    data = open(args.video, "rb").read()
+    if not is_streamable_video(data[:1024 * 1024]):
+        print("⚠️ Video không phải MP4 faststart: chế độ streaming sẽ không mở được, hãy dùng video khác.")
+        return
+    service = ObjectDetectionService(model_path=args.weights, use_half=False)
+    print(f"video={args.video} size={len(data) / 1e6:.1f}MB upload={args.rate_mbps}MB/s "
+          f"→ {len(data) / (args.rate_mbps * 1024 * 1024):.1f}s")
+    print(f"{'mode':>10} {'first_infer_s':>14} {'total_s':>8} {'frames':>7} {'temp_disk_mb':>13}")
+    with tempfile.TemporaryDirectory() as directory:
+        for name, run in (("spooled", run_spooled), ("streaming", run_streaming)):
+            stats, started_at, total, disk = run(data, args.rate_mbps, service, directory)
+            first = stats.get("first_inference_at", float("nan")) - started_at
+            print(f"{name:>10} {first:>14.2f} {total:>8.2f} {stats['frames']:>7} {disk / 1e6:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+# benchmarks/bench_response_encoding.py
+"""
+So sánh response JSON (build_response) và nhị phân (build_binary_response) của UDP server:
+thời gian mã hoá mỗi frame và số byte gửi đi, theo số object phát hiện được.
+Kiểm tra luôn sai số sau khi giải mã nhị phân (box làm tròn pixel, score lượng tử hoá 1/255).
+
+Chạy từ thư mục doi_mat_backend_udp:
+    python -m benchmarks.bench_response_encoding --objects 0 1 5 20 50
+"""
+import argparse
+import timeit
+
+import numpy as np
+
+from udp_server import build_binary_response, build_response, decode_binary_response
+
+
+def make_detections(count, seed=0):
+    rng = np.random.default_rng(seed)
+    detections = []
+    for _ in range(count):
+        x1, y1 = rng.uniform(0, 1200, size=2)
+        w, h = rng.uniform(20, 400, size=2)
+        detections.append({
+            "label": int(rng.integers(1, 21)),
+            "score": float(rng.uniform(0.5, 1.0)),
+            "box": [float(x1), float(y1), float(x1 + w), float(y1 + h)],
+        })
+    return detections
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--objects", type=int, nargs="+", default=[0, 1, 5, 20, 50])
+    parser.add_argument("--repeat", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(f"{'objects':>8} {'json_us':>8} {'json_B':>7} {'bin_us':>7} {'bin_B':>6} {'max_box_err':>12} {'max_score_err':>14}")
+    for count in args.objects:
+        detections = make_detections(count)
+        json_us = 1e6 * timeit.timeit(lambda: build_response(detections), number=args.repeat) / args.repeat
+        bin_us = 1e6 * timeit.timeit(lambda: build_binary_response(detections, 1), number=args.repeat) / args.repeat
+        json_bytes = len(build_response(detections))
+        payload = build_binary_response(detections, 1)
+        decoded = decode_binary_response(payload)["detections"]
+        box_err = max((np.abs(np.subtract(d["box"], det["box"])).max() for d, det in zip(decoded, detections)), default=0)
+        score_err = max((abs(d["score"] - det["score"]) for d, det in zip(decoded, detections)), default=0)
+        print(f"{count:>8} {json_us:>8.1f} {json_bytes:>7} {bin_us:>7.1f} {len(payload):>6} "
+              f"{box_err:>12.2f} {score_err:>14.4f}")
+
+
+if __name__ == "__main__":
+    main()
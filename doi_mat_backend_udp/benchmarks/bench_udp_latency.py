@@ -0,0 +1,92 @@
+# benchmarks/bench_udp_latency.py
+"""
+Đo độ trễ và độ công bằng của UDP server với nhiều phone giả lập: mỗi giá trị của --fps là 1 phone
+gửi cùng 1 ảnh JPEG với tốc độ đó trong --seconds giây; server chạy trong cùng process trên cổng --port.
+Độ trễ đo ở server: từ lúc nhận frame tới lúc gửi response (frame bị thay thế không tính).
+`reply_gap_ms`: khoảng cách trung bình giữa 2 response mà mỗi client nhận được.
+--fragment: gửi mỗi frame thành nhiều datagram theo giao thức chia mảnh (như app Flutter).
+--detect-every k: chỉ chạy model mỗi k frame của 1 client, các frame khác trả về track dự đoán.
+
+Chạy từ thư mục doi_mat_backend_udp:
+    python -m benchmarks.bench_udp_latency --weights fasterrcnn_mobilenet_weights.pth --fps 30 5 5
+"""
+import argparse
+import asyncio
+import socket
+import time
+
+import numpy as np
+
+import udp_server
+
+
+async def run_client(jpeg, port, fps, seconds, fragment=False):
+    """Gửi frame đều đặn, ghi lại thời điểm nhận từng response."""
+    loop = asyncio.get_running_loop()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setblocking(False)
+    sock.bind(("127.0.0.1", 0))
+    sent = 0
+    replies = []
+
+    async def receive():
+        while True:
+            await loop.sock_recv(sock, 65536)
+            replies.append(time.monotonic())
+
+    receiver = asyncio.create_task(receive())
+    seq = 0
+    for frame_id in range(int(fps * seconds)):
+        if fragment:
+            for datagram in udp_server.encode_fragments(jpeg, frame_id, seq):
+                sock.sendto(datagram, ("127.0.0.1", port))
+                seq += 1
+        else:
+            sock.sendto(jpeg, ("127.0.0.1", port))
+        sent += 1
+        await asyncio.sleep(1 / fps)
+    await asyncio.sleep(2)
+    receiver.cancel()
+    sock.close()
+    return sent, replies
+
+
+async def main_async(args):
+    model = udp_server.load_model(args.weights)
+    stats = {}
+    server = asyncio.create_task(udp_server.serve_udp(model, "127.0.0.1", args.port, stats_interval=args.seconds,
+                                                      stats=stats, max_fps=args.max_fps,
+                                                      detect_every=args.detect_every))
+    await asyncio.sleep(0.5)
+    jpeg = open(args.image, "rb").read()
+    results = await asyncio.gather(*[run_client(jpeg, args.port, fps, args.seconds, args.fragment) for fps in args.fps])
+    server.cancel()
+    await asyncio.gather(server, return_exceptions=True)
+    print(f"{'fps':>5} {'sent':>6} {'replies':>8} {'reply_gap_ms':>13} {'drop_rate':>10} {'lat_avg_ms':>11} {'lat_max_ms':>11}")
+    for fps, (sent, replies), client in zip(args.fps, results, stats["clients"].values()):
+        gap = 1000 * np.diff(replies).mean() if len(replies) > 1 else float("nan")
+        print(f"{fps:>5.0f} {sent:>6} {len(replies):>8} {gap:>13.0f} {client['drop_rate']:>10.0%} "
+              f"{client['latency_ms_avg']:>11.0f} {client['latency_ms_max']:>11.0f}")
+    sent = stats["sent"]
+    print(f"server: received={stats['frames']['received']} dropped={stats['frames']['dropped']} "
+          f"inferred={stats['inferred']} reused={stats['reused']} propagated={stats['propagated']} "
+          f"latency_avg_ms={stats['latency_ms_total'] / max(1, sent):.0f} "
+          f"latency_max_ms={stats['latency_ms_max']:.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--weights", default="fasterrcnn_mobilenet_weights.pth")
+    parser.add_argument("--image", default="../doi_mat_backend/app/img_test/3.jpg")
+    parser.add_argument("--fps", type=float, nargs="+", default=[30], help="tốc độ gửi của từng phone")
+    parser.add_argument("--max-fps", type=float, default=0, help="giới hạn frame/giây mỗi client ở server")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--port", type=int, default=9998)
+    parser.add_argument("--fragment", action="store_true")
+    parser.add_argument("--detect-every", type=int, default=1, help="chạy model mỗi k frame (cần tracking)")
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+# tests/test_frame_reassembler.py
+"""
+FrameReassembler: mảnh trễ bị bỏ, client đặt lại bộ đếm frame_id vẫn được nhận.
+Chạy từ thư mục doi_mat_backend_udp:
+    python -m pytest -q tests
+"""
+from udp_server import FrameReassembler, encode_fragments
+
+
+def send(reassembler, frame, frame_id, seq, now):
+    """Gửi mọi mảnh của 1 frame, trả về frame đã ghép (None nếu bị bỏ)."""
+    result = None
+    for datagram in encode_fragments(frame, frame_id, seq=seq, payload_size=100):
+        result = reassembler.add(datagram, now) or result
+    return result
+
+
+def test_late_fragment_of_older_frame_is_dropped():
+    reassembler = FrameReassembler()
+    assert send(reassembler, b"a" * 250, 10, seq=0, now=0.0) == b"a" * 250
+    assert send(reassembler, b"b" * 250, 9, seq=3, now=0.01) is None
+    assert reassembler.stats["resets"] == 0
+
+
+def test_counter_reset_after_long_run_starts_new_stream():
+    """Client gửi tới frame 5000 rồi khởi động lại từ 0 ngay (cùng địa chỉ) → lùi > reset_gap."""
+    reassembler = FrameReassembler()
+    for frame_id in range(4990, 5001):
+        assert send(reassembler, b"x" * 250, frame_id, seq=3 * frame_id, now=frame_id / 30) is not None
+    now = 5000 / 30 + 0.01
+    for frame_id in range(3):
+        assert send(reassembler, bytes([frame_id]) * 250, frame_id, seq=3 * frame_id, now=now) == bytes([frame_id]) * 250
+    assert reassembler.last_frame_id == 2
+    assert reassembler.stats["resets"] == 1
+    assert reassembler.stats["reordered"] == 0
+
+
+def test_counter_reset_after_pause_starts_new_stream():
+    """Bộ đếm chỉ lùi vài frame nhưng client đã im lặng lâu hơn timeout → cũng là luồng mới."""
+    reassembler = FrameReassembler(timeout=0.5)
+    for frame_id in range(20):
+        send(reassembler, b"x" * 250, frame_id, seq=3 * frame_id, now=frame_id / 30)
+    assert send(reassembler, b"y" * 250, 0, seq=0, now=3.0) == b"y" * 250
+    assert reassembler.stats["resets"] == 1
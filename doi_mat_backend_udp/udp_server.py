@@ -1,141 +1,637 @@
+import asyncio
+import os
 import socket
+import struct
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import io
-import torch
+import numpy as np
 import json  # Thêm import này
-from torchvision import transforms
-from torchvision.models.detection import fasterrcnn_mobilenet_v3_large_fpn
-from torchvision.models.detection.faster_rcnn import FastRCNNPredictor
 from PIL import Image
 
-# Danh sách các lớp trong bộ VOC
-VOC_CLASSES = [
-    '__background__', 'aeroplane', 'bicycle', 'bird', 'boat', 'bottle', 
-    'bus', 'car', 'cat', 'chair', 'cow', 'diningtable', 'dog', 'horse',
-    'motorbike', 'person', 'pottedplant', 'sheep', 'sofa', 'train', 'tvmonitor'
-]
+# Dùng chung InferenceEngine và ObjectTracker với backend HTTP qua package doi_mat_core (../doi_mat_core)
+from doi_mat_core.inference import InferenceEngine, VOC_CLASSES
+from doi_mat_core.tracking import ObjectTracker  # scipy tuỳ chọn (ghép cặp hungarian)
+
+# Buffer nhận của socket (kernel) và số kết quả chờ gửi tối đa
+RECV_BUFFER_BYTES = int(os.getenv("UDP_RECV_BUFFER_BYTES", str(4 * 1024 * 1024)))
+SEND_QUEUE_SIZE = int(os.getenv("UDP_SEND_QUEUE_SIZE", "64"))
+# Giới hạn mỗi client: số frame/giây được nhận (0 = không giới hạn), số client tối đa (0 = không giới hạn)
+CLIENT_MAX_FPS = float(os.getenv("UDP_CLIENT_MAX_FPS", "0"))
+MAX_CLIENTS = int(os.getenv("UDP_MAX_CLIENTS", "0"))
+# Client không gửi gì trong khoảng này (giây) thì bị xoá session
+CLIENT_IDLE_TIMEOUT = float(os.getenv("UDP_CLIENT_IDLE_TIMEOUT", "60"))
+# Ghép frame bị chia nhỏ: thời gian chờ đủ mảnh (giây), số frame dở dang tối đa mỗi client, kích thước frame tối đa
+FRAGMENT_TIMEOUT_SECONDS = float(os.getenv("UDP_FRAGMENT_TIMEOUT", "0.5"))
+MAX_PARTIAL_FRAMES = int(os.getenv("UDP_MAX_PARTIAL_FRAMES", "4"))
+MAX_FRAME_BYTES = int(os.getenv("UDP_MAX_FRAME_BYTES", str(8 * 1024 * 1024)))
+# Dùng lại kết quả khi cảnh gần như không đổi: ngưỡng chênh lệch trung bình của thumbnail xám
+# (0-255, 0 = tắt) và thời gian tối đa (giây) được dùng lại trước khi bắt buộc chạy model
+REUSE_THRESHOLD = float(os.getenv("UDP_REUSE_THRESHOLD", "3.0"))
+REUSE_MAX_AGE_SECONDS = float(os.getenv("UDP_REUSE_MAX_AGE", "2.0"))
+# Tracking mỗi client: bật/tắt, mô hình chuyển động ("none" / "kalman"; mặc định none — kalman chưa được đo
+# trên luồng UDP, xem doi_mat_backend/benchmarks/bench_motion.py), chạy model mỗi k frame
+# (các frame ở giữa trả về vị trí track dự đoán, với none là box thấy lần cuối), ngưỡng của ObjectTracker tính theo frame
+TRACKING_ENABLED = os.getenv("UDP_TRACKING", "1") == "1"
+TRACKER_MOTION = os.getenv("UDP_TRACKER_MOTION", "none")
+DETECT_EVERY = int(os.getenv("UDP_DETECT_EVERY", "1"))
+TRACKER_MAX_DISAPPEARED = int(os.getenv("UDP_TRACKER_MAX_DISAPPEARED", "10"))
+TRACKER_MAX_LOST_AGE = int(os.getenv("UDP_TRACKER_MAX_LOST_AGE", "50"))
+# Lượng tử hoá cho CPU: "none" | "dynamic" (INT8 cho các lớp Linear, xem doi_mat_core/inference.py)
+QUANTIZE = os.getenv("UDP_QUANTIZE", "none")
+# Kích thước frame đưa vào model: "realtime" (320 px, nhanh) | "accuracy" (800 px); không áp dụng cho model TorchScript
+INPUT_PROFILE = os.getenv("UDP_INPUT_PROFILE", "realtime")
+# NMS sau model: "class_agnostic" | "per_class" | "none" (xem doi_mat_core/postprocess.py)
+NMS_MODE = os.getenv("UDP_NMS_MODE", "class_agnostic")
+# Chạy thử model trước khi mở socket để frame đầu tiên không bị chậm
+WARMUP = os.getenv("UDP_WARMUP", "1") == "1"
+# Chu kỳ in thống kê (giây)
+STATS_INTERVAL_SECONDS = float(os.getenv("UDP_STATS_INTERVAL", "10"))
+
 
 # ================================================================
 # 🔹 1️⃣ HÀM KHỞI TẠO MODEL (load trọng số)
 # ================================================================
-def load_model(weights_path: str):
+def load_model(weights_path: str, quantize: str = QUANTIZE, warmup: bool = WARMUP, input_profile: str = INPUT_PROFILE,
+               nms_mode: str = NMS_MODE):
+    """
+    InferenceEngine dùng chung với backend HTTP: cùng device/FP16/INT8, tiền xử lý, ngưỡng + NMS.
+    `weights_path` có thể là .pth hoặc file TorchScript (doi_mat_backend/app/export_model.py, load nhanh hơn).
+    """
     print("🔄 Đang khởi tạo mô hình Faster R-CNN...")
-
-    # ⚠️ Đổi pretrained → weights=None để tránh cảnh báo
-    model = fasterrcnn_mobilenet_v3_large_fpn(weights=None)
-
-    # ⚙️ Đặt đúng số lớp bạn đã huấn luyện
-    num_classes = 21  # ← Sửa số này theo model của bạn
-    in_features = model.roi_heads.box_predictor.cls_score.in_features
-    model.roi_heads.box_predictor = FastRCNNPredictor(in_features, num_classes)
-
-    # 🧠 Load trọng số
-    model.load_state_dict(torch.load(weights_path, map_location="cpu"))
-    model.eval()
-
+    engine = InferenceEngine(weights_path, use_half=True, quantize=quantize, input_profile=input_profile,
+                             nms_mode=nms_mode)
+    if warmup:
+        engine.warm_up()
     print(f"✅ Model đã load trọng số từ: {weights_path}\n")
-    return model
+    return engine
 
 
 # ================================================================
 # 🔹 2️⃣ HÀM DỰ ĐOÁN TRÊN FRAME JPEG BYTES
 # ================================================================
-def predict_frame(model, jpeg_bytes: bytes, threshold=0.5):
-    image = Image.open(io.BytesIO(jpeg_bytes)).convert("RGB")
+def predict_frame(engine, jpeg_bytes: bytes, threshold=0.5):
+    """
+    Detections của 1 frame: list {"label": chỉ số VOC_CLASSES, "score", "box"}. Lỗi → ném exception.
+    Frame được thu nhỏ ngay lúc giải mã JPEG theo UDP_INPUT_PROFILE, box trả về theo toạ độ frame gốc.
+    """
+    tensor, scale = engine.decode(jpeg_bytes)
+    return engine.predict_tensors([tensor], threshold, [scale])[0]
+
+
+# ================================================================
+# 🔹 3️⃣ TẠO RESPONSE GỬI VỀ CLIENT
+# ================================================================
+def build_response(detections):
+    # Chuyển đổi label từ số sang chuỗi
+    response_detections = []
+    for det in detections:
+        label_index = det['label']
+        label_name = VOC_CLASSES[label_index] if label_index < len(VOC_CLASSES) else "unknown"
 
-    transform = transforms.Compose([
-        transforms.ToTensor(),
-    ])
-    tensor = transform(image).unsqueeze(0)
+        response_detection = {
+            "label": label_name,
+            "score": det['score'],
+            "box": det['box']
+        }
+        if 'track_id' in det:
+            response_detection["track_id"] = det['track_id']
+        response_detections.append(response_detection)
 
-    with torch.no_grad():
-        preds = model(tensor)[0]
+    # Tạo response JSON
+    response = {
+        "object_count": len(detections),
+        "detections": response_detections
+    }
+    return json.dumps(response).encode('utf-8')
 
-    boxes = preds["boxes"]
-    scores = preds["scores"]
-    labels = preds["labels"]
 
-    detected = []
-    for box, score, label in zip(boxes, scores, labels):
-        if score >= threshold:
-            detected.append({
-                "label": int(label),
-                "score": float(score),
-                "box": [float(x) for x in box.tolist()]
-            })
-    return detected
+# Response nhị phân (client bật FLAG_BINARY_RESPONSE trong header frame gửi lên):
+#   header: version (uint8, = 1) | flags (uint8) | frame_id (uint32) | số object (uint16)
+#   mỗi object 10 byte: label (uint8, chỉ số VOC_CLASSES) | score (uint8, score * 255)
+#                       | x1, y1, x2, y2 (uint16, pixel làm tròn)
+#   flags có RESPONSE_FLAG_TRACK_IDS → mỗi object thêm track_id (uint32) ở cuối (14 byte)
+# Big-endian. JSON luôn bắt đầu bằng '{' nên client phân biệt được 2 định dạng qua byte đầu.
+RESPONSE_VERSION_BINARY = 1
+RESPONSE_HEADER = struct.Struct(">BBIH")
+RESPONSE_FLAG_TRACK_IDS = 0x01
+DETECTION_RECORD = np.dtype([("label", "u1"), ("score", "u1"), ("box", ">u2", (4,))])
+TRACKED_DETECTION_RECORD = np.dtype(DETECTION_RECORD.descr + [("track_id", ">u4")])
+
+
+def build_binary_response(detections, frame_id: int = 0, track_ids: bool = False):
+    flags = RESPONSE_FLAG_TRACK_IDS if track_ids else 0
+    records = np.empty(len(detections), dtype=TRACKED_DETECTION_RECORD if track_ids else DETECTION_RECORD)
+    if detections:
+        records["label"] = [det['label'] for det in detections]
+        records["score"] = np.rint(np.array([det['score'] for det in detections]) * 255)
+        records["box"] = np.clip(np.rint(np.array([det['box'] for det in detections])), 0, 65535)
+        if track_ids:
+            records["track_id"] = [det.get('track_id', 0) & 0xFFFFFFFF for det in detections]
+    header = RESPONSE_HEADER.pack(RESPONSE_VERSION_BINARY, flags, frame_id & 0xFFFFFFFF, len(detections))
+    return header + records.tobytes()
+
+
+def decode_binary_response(payload: bytes):
+    """Giải mã response nhị phân về dạng giống JSON (dùng cho benchmark / kiểm thử)."""
+    version, flags, frame_id, count = RESPONSE_HEADER.unpack_from(payload)
+    if version != RESPONSE_VERSION_BINARY:
+        raise ValueError(f"Không hỗ trợ response version {version}")
+    tracked = bool(flags & RESPONSE_FLAG_TRACK_IDS)
+    records = np.frombuffer(payload, dtype=TRACKED_DETECTION_RECORD if tracked else DETECTION_RECORD,
+                            count=count, offset=RESPONSE_HEADER.size)
+    detections = [
+        {"label": VOC_CLASSES[label] if label < len(VOC_CLASSES) else "unknown",
+         "score": score / 255, "box": box.astype(float).tolist()}
+        for label, score, box in zip(records["label"].tolist(), records["score"].tolist(), records["box"])
+    ]
+    if tracked:
+        for det, track_id in zip(detections, records["track_id"].tolist()):
+            det["track_id"] = track_id
+    return {"frame_id": frame_id, "object_count": count, "detections": detections}
 
 
 # ================================================================
-# 🔹 3️⃣ HÀM CHẠY SERVER UDP NHẬN FRAME TỪ FLUTTER
+# 🔹 4️⃣ SERVER UDP DẠNG PIPELINE: NHẬN → SUY LUẬN → GỬI CHẠY SONG SONG
 # ================================================================
-def start_udp_server(model, host="0.0.0.0", port=9999):
-    BUFFER_SIZE = 65536
-    server = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    server.bind((host, port))
+# Giao thức chia frame thành nhiều datagram. Mỗi datagram = header + 1 mảnh dữ liệu JPEG:
+#   magic "DF" | version (uint8) | flags (uint8) | seq (uint32, tăng theo từng datagram của client)
+#   | frame_id (uint32) | chunk_index (uint16) | chunk_count (uint16) | frame_size (uint32) | offset (uint32)
+# Datagram không bắt đầu bằng magic được coi là 1 frame JPEG trọn vẹn (client cũ).
+FRAGMENT_MAGIC = b"DF"
+FRAGMENT_VERSION = 1
+FRAGMENT_HEADER = struct.Struct(">2sBBIIHHII")
+FRAGMENT_PAYLOAD_SIZE = 1400 - FRAGMENT_HEADER.size  # vừa 1 gói Wi-Fi, tránh phân mảnh IP
+FLAG_BINARY_RESPONSE = 0x01  # flags: client muốn nhận response nhị phân thay vì JSON
+
+
+def encode_fragments(frame: bytes, frame_id: int, seq: int = 0, payload_size: int = FRAGMENT_PAYLOAD_SIZE,
+                     flags: int = 0):
+    """Chia 1 frame thành các datagram theo giao thức trên (giống phía Flutter)."""
+    chunk_count = max(1, -(-len(frame) // payload_size))
+    datagrams = []
+    for index in range(chunk_count):
+        offset = index * payload_size
+        header = FRAGMENT_HEADER.pack(FRAGMENT_MAGIC, FRAGMENT_VERSION, flags, (seq + index) & 0xFFFFFFFF,
+                                      frame_id & 0xFFFFFFFF, index, chunk_count, len(frame), offset)
+        datagrams.append(header + frame[offset:offset + payload_size])
+    return datagrams
+
+
+class FrameReassembler:
+    """
+    ✅ Ghép các mảnh của 1 frame vào bytearray cấp phát sẵn đúng kích thước (frame_size trong header):
+    mỗi mảnh được chép thẳng vào vị trí offset qua memoryview, không nối bytes theo từng mảnh.
+    - Frame mới hoàn tất → bỏ các frame cũ hơn còn dở dang ("latest frame wins").
+    - Frame dở dang quá `timeout` giây hoặc vượt `max_partial` frame bị bỏ (đếm 'incomplete').
+    - `seq` dùng để đếm datagram bị mất / đến sai thứ tự.
+    - frame_id lùi quá `reset_gap` frame, hoặc lùi sau khi client im lặng quá `timeout` giây → client đã đặt lại
+      bộ đếm (khởi động lại app, NAT dùng lại địa chỉ): bắt đầu luồng mới thay vì bỏ mọi frame (đếm 'resets').
+    """
+
+    def __init__(self, timeout: float = 0.5, max_partial: int = 4, max_frame_bytes: int = 8 * 1024 * 1024,
+                 reset_gap: int = 64):
+        self.timeout = timeout
+        self.max_partial = max_partial
+        self.max_frame_bytes = max_frame_bytes
+        self.reset_gap = reset_gap
+        self._partial = {}  # frame_id -> [buffer, memoryview, bitmap, số mảnh còn thiếu, thời điểm mảnh đầu]
+        self._last_seq = None
+        self._last_completed = None
+        self._last_completed_at = 0.0
+        self.last_frame_id = 0  # frame_id / flags của frame vừa ghép xong
+        self.last_flags = 0
+        self.stats = {"fragments": 0, "completed": 0, "incomplete": 0, "invalid": 0, "lost": 0, "reordered": 0,
+                      "resets": 0}
+
+    def add(self, datagram: bytes, now: float):
+        """Nhận 1 datagram; trả về frame (bytearray) khi đã đủ mảnh, ngược lại None."""
+        self.stats["fragments"] += 1
+        if len(datagram) < FRAGMENT_HEADER.size:
+            self.stats["invalid"] += 1
+            return None
+        _, version, flags, seq, frame_id, index, count, frame_size, offset = FRAGMENT_HEADER.unpack_from(datagram)
+        payload = memoryview(datagram)[FRAGMENT_HEADER.size:]
+        if (version != FRAGMENT_VERSION or index >= count or frame_size > self.max_frame_bytes
+                or offset + len(payload) > frame_size):
+            self.stats["invalid"] += 1
+            return None
+        stale = self._last_completed is not None and not self._newer(frame_id, self._last_completed)
+        if stale and self._stream_restarted(frame_id, now):
+            self._restart_stream()
+            stale = False
+        self._track_seq(seq)
+        self._expire(now)
+        if stale:
+            return None  # Mảnh trễ của frame đã xong hoặc đã bị thay thế
+
+        entry = self._partial.get(frame_id)
+        if entry is None:
+            if len(self._partial) >= self.max_partial:
+                oldest = min(self._partial, key=lambda fid: self._partial[fid][4])
+                del self._partial[oldest]
+                self.stats["incomplete"] += 1
+            buffer = bytearray(frame_size)
+            entry = self._partial[frame_id] = [buffer, memoryview(buffer), bytearray(count), count, now]
+        buffer, view, bitmap, _, _ = entry
+        if len(bitmap) != count or len(buffer) != frame_size:
+            self.stats["invalid"] += 1
+            return None
+        if bitmap[index]:
+            return None  # Mảnh trùng
+        view[offset:offset + len(payload)] = payload
+        bitmap[index] = 1
+        entry[3] -= 1
+        if entry[3] > 0:
+            return None
+
+        del self._partial[frame_id]
+        view.release()
+        self._last_completed = frame_id
+        self._last_completed_at = now
+        self.last_frame_id = frame_id
+        self.last_flags = flags
+        for fid in [fid for fid in self._partial if not self._newer(fid, frame_id)]:
+            del self._partial[fid]
+            self.stats["incomplete"] += 1
+        self.stats["completed"] += 1
+        return buffer
+
+    @staticmethod
+    def _newer(a, b):
+        """a mới hơn b (so sánh có xét quay vòng uint32)."""
+        return 0 < ((a - b) & 0xFFFFFFFF) < 0x80000000
+
+    def _stream_restarted(self, frame_id, now):
+        """frame_id cũ hơn frame vừa xong: lùi xa (> reset_gap) hoặc sau khoảng im lặng → luồng mới, không phải mảnh trễ."""
+        backward = (self._last_completed - frame_id) & 0xFFFFFFFF
+        return backward > self.reset_gap or (backward > 0 and now - self._last_completed_at > self.timeout)
+
+    def _restart_stream(self):
+        self.stats["incomplete"] += len(self._partial)
+        self.stats["resets"] += 1
+        self._partial.clear()
+        self._last_completed = None
+        self._last_seq = None
+
+    def _track_seq(self, seq):
+        if self._last_seq is not None:
+            gap = (seq - self._last_seq) & 0xFFFFFFFF
+            if gap == 0 or gap >= 0x80000000:
+                # Datagram đến muộn: lúc trước đã bị tính là mất
+                self.stats["reordered"] += 1
+                self.stats["lost"] = max(0, self.stats["lost"] - 1)
+                return
+            self.stats["lost"] += gap - 1
+        self._last_seq = seq
+
+    def _expire(self, now):
+        for fid in [fid for fid, entry in self._partial.items() if now - entry[4] > self.timeout]:
+            del self._partial[fid]
+            self.stats["incomplete"] += 1
+
+
+def make_tracker():
+    if not TRACKING_ENABLED:
+        return None
+    return ObjectTracker(max_disappeared=TRACKER_MAX_DISAPPEARED, iou_threshold=0.4,
+                         max_lost_age=TRACKER_MAX_LOST_AGE, motion=TRACKER_MOTION)
+
+
+class ClientSession:
+    """
+    Trạng thái của 1 client (theo addr): frame đang chờ ("latest frame wins"),
+    giới hạn tốc độ dạng token bucket và thống kê riêng của client đó.
+    """
+
+    def __init__(self, addr, max_fps: float = 0):
+        self.addr = addr
+        self.max_fps = max_fps
+        # (data, thời điểm nhận, frame_id, trả response nhị phân?) — định dạng response đi theo từng frame:
+        # client cũ (không có header) → JSON, kể cả khi cùng addr trước đó gửi frame có FLAG_BINARY_RESPONSE
+        self.pending = None
+        # Frame gần nhất đã chạy model (để dùng lại kết quả khi cảnh không đổi)
+        self.last_thumbnail = None
+        self.last_detections = None
+        self.last_inferred_at = 0.0
+        # Tracker riêng của client: id track ổn định giữa các frame
+        self.tracker = make_tracker()
+        self.frame_count = 0
+        self.frames_since_detect = 0
+        self.last_tracked = {}  # {track_id: detection} của lần chạy model gần nhất
+        self.last_seen = time.monotonic()
+        self.reassembler = FrameReassembler(FRAGMENT_TIMEOUT_SECONDS, MAX_PARTIAL_FRAMES, MAX_FRAME_BYTES)
+        self._tokens = max(1.0, max_fps)
+        self._refilled_at = self.last_seen
+        self.stats = {
+            "received": 0, "inferred": 0, "reused": 0, "propagated": 0, "sent": 0,
+            "dropped_superseded": 0, "dropped_rate_limited": 0,
+            "latency_ms_total": 0.0, "latency_ms_max": 0.0,
+        }
+
+    def allow(self, now) -> bool:
+        """Token bucket: tối đa max_fps frame/giây (burst 1 giây), max_fps = 0 → không giới hạn."""
+        if self.max_fps <= 0:
+            return True
+        self._tokens = min(max(1.0, self.max_fps), self._tokens + (now - self._refilled_at) * self.max_fps)
+        self._refilled_at = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def record_sent(self, latency_ms):
+        self.stats["sent"] += 1
+        self.stats["latency_ms_total"] += latency_ms
+        self.stats["latency_ms_max"] = max(self.stats["latency_ms_max"], latency_ms)
+
+    def summary(self):
+        stats = self.stats
+        dropped = stats["dropped_superseded"] + stats["dropped_rate_limited"]
+        processed = stats["inferred"] + stats["reused"] + stats["propagated"]
+        return {
+            **stats,
+            "fragments": self.reassembler.stats,
+            "latency_ms_avg": stats["latency_ms_total"] / stats["sent"] if stats["sent"] else 0.0,
+            "drop_rate": dropped / stats["received"] if stats["received"] else 0.0,
+            "reuse_rate": stats["reused"] / processed if processed else 0.0,
+        }
+
+
+class ClientScheduler:
+    """
+    ✅ Chia lượt suy luận công bằng giữa các client (round-robin):
+    - Mỗi client giữ tối đa 1 frame chờ, frame mới thay frame cũ → độ trễ không tăng dù gửi nhanh.
+    - Client vào hàng đợi khi có frame chờ và về cuối hàng sau mỗi lượt, nên 1 phone gửi 30 fps
+      không chiếm lượt của các phone khác.
+    - Giới hạn tốc độ mỗi client (`max_fps`), số client (`max_clients`); client im lặng quá
+      `idle_timeout` giây bị xoá.
+    """
+
+    def __init__(self, max_fps: float = 0, max_clients: int = 0, idle_timeout: float = 60):
+        self.max_fps = max_fps
+        self.max_clients = max_clients
+        self.idle_timeout = idle_timeout
+        self.sessions = {}
+        self._ready = deque()  # addr của các client có frame chờ, theo thứ tự tới lượt
+        self._event = asyncio.Event()
+        self.stats = {"received": 0, "dropped": 0, "rejected_clients": 0, "expired_clients": 0}
+
+    def put(self, addr, data):
+        now = time.monotonic()
+        session = self.sessions.get(addr)
+        if session is None:
+            if self.max_clients and len(self.sessions) >= self.max_clients:
+                self.stats["rejected_clients"] += 1
+                return
+            session = self.sessions[addr] = ClientSession(addr, self.max_fps)
+        session.last_seen = now
+        frame_id = 0
+        binary_response = False
+        if data[:2] == FRAGMENT_MAGIC:
+            data = session.reassembler.add(data, now)
+            if data is None:
+                return  # Chưa đủ mảnh
+            frame_id = session.reassembler.last_frame_id
+            binary_response = bool(session.reassembler.last_flags & FLAG_BINARY_RESPONSE)
+        self.stats["received"] += 1
+        session.stats["received"] += 1
+        if not session.allow(now):
+            session.stats["dropped_rate_limited"] += 1
+            self.stats["dropped"] += 1
+            return
+        if session.pending is not None:
+            session.stats["dropped_superseded"] += 1
+            self.stats["dropped"] += 1
+        else:
+            self._ready.append(addr)
+        session.pending = (data, now, frame_id, binary_response)
+        self._event.set()
+
+    async def get(self):
+        """Frame của client tới lượt: (session, data, thời điểm nhận, frame_id, trả response nhị phân?)."""
+        while not self._ready:
+            self._event.clear()
+            await self._event.wait()
+        session = self.sessions[self._ready.popleft()]
+        data, received_at, frame_id, binary_response = session.pending
+        session.pending = None
+        return session, data, received_at, frame_id, binary_response
+
+    def expire_idle(self):
+        now = time.monotonic()
+        for addr, session in list(self.sessions.items()):
+            if session.pending is None and now - session.last_seen > self.idle_timeout:
+                del self.sessions[addr]
+                self.stats["expired_clients"] += 1
+
+    def summary(self):
+        return {f"{addr[0]}:{addr[1]}": session.summary() for addr, session in self.sessions.items()}
+
+
+class SceneChangeDetector:
+    """
+    ✅ Bỏ qua suy luận khi phone hướng vào cảnh tĩnh: so sánh thumbnail xám `size`x`size`
+    của frame mới với frame gần nhất đã chạy model của cùng client. Nếu chênh lệch trung bình
+    < `threshold` và kết quả cũ chưa quá `max_age` giây → trả lại detections cũ.
+    Thumbnail được giải mã ở độ phân giải thấp (JPEG draft) nên chỉ tốn ~1-2 ms.
+    """
+
+    def __init__(self, threshold: float = 3.0, max_age: float = 2.0, size: int = 32):
+        self.threshold = threshold
+        self.max_age = max_age
+        self.size = size
+
+    def thumbnail(self, jpeg_bytes):
+        image = Image.open(io.BytesIO(jpeg_bytes))
+        image.draft("L", (2 * self.size, 2 * self.size))
+        image = image.convert("L").resize((self.size, self.size), Image.BILINEAR)
+        return np.asarray(image, dtype=np.float32)
+
+    def can_reuse(self, session, thumbnail, now) -> bool:
+        if self.threshold <= 0 or session.last_thumbnail is None:
+            return False
+        if now - session.last_inferred_at > self.max_age:
+            return False
+        return float(np.abs(thumbnail - session.last_thumbnail).mean()) < self.threshold
+
+
+def detect_with_reuse(model, session, jpeg_bytes, change_detector):
+    """Chạy trong thread suy luận: dùng lại kết quả nếu cảnh không đổi, ngược lại predict_frame."""
+    if change_detector is None or change_detector.threshold <= 0:
+        return predict_frame(model, jpeg_bytes), False
+    now = time.monotonic()
+    thumbnail = change_detector.thumbnail(jpeg_bytes)
+    if change_detector.can_reuse(session, thumbnail, now):
+        return session.last_detections, True
+    detections = predict_frame(model, jpeg_bytes)
+    session.last_thumbnail, session.last_detections, session.last_inferred_at = thumbnail, detections, now
+    return detections, False
+
+
+def assign_track_ids(session, detections):
+    """Đưa detections vào tracker của client, gắn "track_id" vào từng detection."""
+    tracker = session.tracker
+    tracker.update([(np.asarray(det['box'], dtype=np.float32), det['label'], det['score']) for det in detections],
+                   session.frame_count)
+    for det, track_id in zip(detections, tracker.detection_ids):
+        det['track_id'] = track_id
+    session.last_tracked = {det['track_id']: det for det in detections}
+
+
+def propagate_tracks(session):
+    """Không chạy model: trả về các track vừa thấy ở lần suy luận trước với box dự đoán tại frame hiện tại."""
+    track_ids, boxes = session.tracker.predict(session.frame_count)
+    return [
+        {**session.last_tracked[track_id], "box": [float(x) for x in box]}
+        for track_id, box in zip(track_ids.tolist(), boxes) if track_id in session.last_tracked
+    ]
+
+
+def process_frame(model, session, jpeg_bytes, change_detector=None, detect_every=1):
+    """
+    Chạy trong thread suy luận. Trả về (detections, nguồn kết quả):
+    - "propagated": có tracking và chưa tới lượt chạy model (mỗi `detect_every` frame 1 lần) → box dự đoán;
+    - "reused": cảnh không đổi → kết quả lần trước (xem detect_with_reuse);
+    - "inferred": chạy model, gán track id nếu có tracker.
+    """
+    session.frame_count += 1
+    if session.tracker is not None and session.last_tracked and session.frames_since_detect + 1 < detect_every:
+        session.frames_since_detect += 1
+        return propagate_tracks(session), "propagated"
+    session.frames_since_detect = 0
+    detections, reused = detect_with_reuse(model, session, jpeg_bytes, change_detector)
+    if reused:
+        return detections, "reused"
+    if session.tracker is not None:
+        assign_track_ids(session, detections)
+    return detections, "inferred"
+
+
+class UdpFrameProtocol(asyncio.DatagramProtocol):
+    """Nhận datagram trên event loop, chỉ giao cho scheduler (không chặn khi model đang chạy)."""
+
+    def __init__(self, scheduler: ClientScheduler):
+        self.scheduler = scheduler
+
+    def datagram_received(self, data, addr):
+        self.scheduler.put(addr, data)
+
+    def error_received(self, exc):
+        print(f"⚠️ Lỗi socket: {exc}")
+
+
+async def inference_worker(model, scheduler, send_queue, executor, stats, change_detector=None, detect_every=1):
+    """Lấy frame của client tới lượt, chạy model ở thread riêng, đưa kết quả sang sender."""
+    loop = asyncio.get_running_loop()
+    while True:
+        session, data, received_at, frame_id, binary_response = await scheduler.get()
+        try:
+            detections, source = await loop.run_in_executor(
+                executor, process_frame, model, session, data, change_detector, detect_every
+            )
+        except Exception as e:
+            print(f"⚠️ Lỗi khi predict: {e}")
+            stats["errors"] += 1
+            continue
+        stats[source] += 1
+        session.stats[source] += 1
+        if source == "inferred":
+            print(f"🎯 {session.addr}: {len(detections)} object, trễ {1000 * (time.monotonic() - received_at):.0f} ms")
+        if send_queue.full():
+            # Sender chậm (hiếm với UDP) → bỏ kết quả cũ nhất, giữ kết quả mới
+            send_queue.get_nowait()
+            stats["send_dropped"] += 1
+        send_queue.put_nowait((session, detections, received_at, frame_id, binary_response))
+
+
+async def sender(transport, send_queue, stats):
+    """Mã hoá và gửi kết quả về client, tách khỏi vòng suy luận."""
+    while True:
+        session, detections, received_at, frame_id, binary_response = await send_queue.get()
+        try:
+            if binary_response:
+                payload = build_binary_response(detections, frame_id, track_ids=session.tracker is not None)
+            else:
+                payload = build_response(detections)
+            transport.sendto(payload, session.addr)
+        except Exception as e:
+            print(f"⚠️ Lỗi khi gửi kết quả tới {session.addr}: {e}")
+            continue
+        latency_ms = 1000 * (time.monotonic() - received_at)
+        session.record_sent(latency_ms)
+        stats["sent"] += 1
+        stats["latency_ms_total"] += latency_ms
+        stats["latency_ms_max"] = max(stats["latency_ms_max"], latency_ms)
+
+
+def print_stats(scheduler, stats):
+    sent = stats["sent"]
+    avg_latency = stats["latency_ms_total"] / sent if sent else 0.0
+    print(f"📊 [{datetime.now().strftime('%H:%M:%S')}] client={len(scheduler.sessions)} "
+          f"nhận={scheduler.stats['received']} bỏ={scheduler.stats['dropped']} "
+          f"suy luận={stats['inferred']} dùng lại={stats['reused']} dự đoán={stats['propagated']} gửi={sent} trễ TB={avg_latency:.0f} ms")
+    for name, client in stats["clients"].items():
+        print(f"   👤 {name}: nhận={client['received']} suy luận={client['inferred']} "
+              f"dùng lại={client['reuse_rate']:.0%} dự đoán={client['propagated']} "
+              f"bỏ={client['drop_rate']:.0%} trễ TB={client['latency_ms_avg']:.0f} ms "
+              f"max={client['latency_ms_max']:.0f} ms frame thiếu mảnh={client['fragments']['incomplete']}")
+
+
+async def serve_udp(model, host="0.0.0.0", port=9999, stats_interval=STATS_INTERVAL_SECONDS, stats=None,
+                    max_fps=CLIENT_MAX_FPS, max_clients=MAX_CLIENTS, reuse_threshold=REUSE_THRESHOLD,
+                    reuse_max_age=REUSE_MAX_AGE_SECONDS, detect_every=DETECT_EVERY):
+    """
+    Chạy server tới khi bị huỷ. `stats` (tuỳ chọn): dict được cập nhật với số frame
+    nhận/bỏ/suy luận/gửi, độ trễ nhận → gửi (ms) và thống kê từng client ("clients").
+    """
+    loop = asyncio.get_running_loop()
+    scheduler = ClientScheduler(max_fps=max_fps, max_clients=max_clients, idle_timeout=CLIENT_IDLE_TIMEOUT)
+    transport, _ = await loop.create_datagram_endpoint(
+        lambda: UdpFrameProtocol(scheduler), local_addr=(host, port)
+    )
+    # Buffer nhận lớn hơn để không mất datagram khi event loop bận trong chốc lát
+    transport.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECV_BUFFER_BYTES)
+    if stats is None: stats = {}
+    stats.update({"inferred": 0, "reused": 0, "propagated": 0, "errors": 0, "sent": 0, "send_dropped": 0, "latency_ms_total": 0.0, "latency_ms_max": 0.0})
+    stats["frames"] = scheduler.stats
+    stats["clients"] = {}
+    send_queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="udp-infer")
 
     print(f"🚀 UDP Server đang chạy trên {host}:{port}")
     print("⏳ Đang chờ nhận dữ liệu từ Flutter...\n")
-
+    tasks = [
+        asyncio.create_task(inference_worker(model, scheduler, send_queue, executor, stats,
+                                             SceneChangeDetector(reuse_threshold, reuse_max_age), detect_every)),
+        asyncio.create_task(sender(transport, send_queue, stats)),
+    ]
     try:
         while True:
-            data, addr = server.recvfrom(BUFFER_SIZE)
-            timestamp = datetime.now().strftime("%H:%M:%S")
-
-            print(f"[{timestamp}] 📩 Nhận {len(data)} bytes từ {addr}")
-            print("📦 Data mẫu:", data[:20])
-
-            # --- Thực hiện dự đoán ---
-            try:
-                detections = predict_frame(model, data)
-                print(f"🎯 Số object phát hiện: {len(detections)}")
-
-                for i, det in enumerate(detections[:5]):  # Giới hạn in 5 kết quả đầu
-                    print(
-                        f"  #{i+1}: Label={det['label']}, "
-                        f"Score={det['score']:.2f}, "
-                        f"Box={det['box']}"
-                    )
-                
-                # === THÊM ĐOẠN CODE GỬI KẾT QUẢ VỀ CHO CLIENT ===
-                # Chuyển đổi label từ số sang chuỗi
-                response_detections = []
-                for det in detections:
-                    label_index = det['label']
-                    label_name = VOC_CLASSES[label_index] if label_index < len(VOC_CLASSES) else "unknown"
-                    
-                    response_detections.append({
-                        "label": label_name,
-                        "score": det['score'],
-                        "box": det['box']
-                    })
-                
-                # Tạo response JSON
-                response = {
-                    "object_count": len(detections),
-                    "detections": response_detections
-                }
-                
-                # Chuyển đổi thành JSON và gửi về cho client
-                response_json = json.dumps(response).encode('utf-8')
-                server.sendto(response_json, addr)
-                print(f"📤 Đã gửi kết quả về cho {addr}")
-                # === KẾT THÚC ĐOẠN CODE THÊM ===
-                
-            except Exception as e:
-                print(f"⚠️ Lỗi khi predict: {e}")
-
-            print("-" * 70)
+            await asyncio.sleep(stats_interval)
+            stats["clients"] = scheduler.summary()
+            print_stats(scheduler, stats)
+            scheduler.expire_idle()
+    finally:
+        stats["clients"] = scheduler.summary()
+        for task in tasks:
+            task.cancel()
+        transport.close()
+        executor.shutdown(wait=False, cancel_futures=True)
+        print("🔒 Socket đã đóng.")
+
 
+def start_udp_server(model, host="0.0.0.0", port=9999):
+    try:
+        asyncio.run(serve_udp(model, host, port))
     except KeyboardInterrupt:
         print("\n🛑 Dừng server.")
-    finally:
-        server.close()
-        print("🔒 Socket đã đóng.")
 
 
 # ================================================================
-# 🔹 4️⃣ MAIN ENTRY
+# 🔹 5️⃣ MAIN ENTRY
 # ================================================================
 if __name__ == "__main__":
     # ✅ Thay đường dẫn bằng trọng số bạn đã huấn luyện
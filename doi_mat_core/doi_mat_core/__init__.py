@@ -0,0 +1,9 @@
+# doi_mat_core/__init__.py
+"""
+Phần lõi dùng chung giữa backend HTTP (doi_mat_backend) và server UDP (doi_mat_backend_udp):
+- inference: InferenceEngine (Faster R-CNN MobileNetV3, profile kích thước input, quantize, TorchScript).
+- postprocess: lọc confidence + NMS theo batch → Detections dạng cột.
+- tracking: ObjectTracker (ghép detection giữa các frame, Kalman tuỳ chọn).
+
+Cài cho cả 2 backend: pip install -e ../doi_mat_core
+"""
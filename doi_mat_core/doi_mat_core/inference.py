@@ -0,0 +1,348 @@
+# doi_mat_core/inference.py
+import copy
+import io
+import json
+import time
+import warnings
+import zipfile
+
+import torch
+from PIL import Image
+from torchvision.models.detection import fasterrcnn_mobilenet_v3_large_fpn
+from torchvision.models.detection.faster_rcnn import FastRCNNPredictor
+from torchvision.models.detection.transform import GeneralizedRCNNTransform
+from torchvision.io import ImageReadMode, decode_jpeg
+from torchvision.transforms import ToTensor
+
+from doi_mat_core.postprocess import NMS_MODES, postprocess_batch
+
+VOC_CLASSES = [
+    '__background__', 'aeroplane', 'bicycle', 'bird', 'boat', 'bottle',
+    'bus', 'car', 'cat', 'chair', 'cow', 'diningtable', 'dog', 'horse',
+    'motorbike', 'person', 'pottedplant', 'sheep', 'sofa', 'train', 'tvmonitor'
+]
+QUANTIZE_MODES = ("none", "dynamic")
+# Kích thước đầu vào model (min_size, max_size) theo chế độ:
+# "accuracy" = mặc định của fasterrcnn_mobilenet_v3_large_fpn, "realtime" = như bản *_320_fpn
+INPUT_SIZES = {"accuracy": (800, 1333), "realtime": (320, 640)}
+# File phụ trong artifact TorchScript ghi (min_size, max_size) của transform lúc export
+TORCHSCRIPT_INPUT_SIZE_FILE = "input_size.json"
+
+
+def build_model(num_classes: int = len(VOC_CLASSES)):
+    """Faster R-CNN MobileNetV3 với head `num_classes` lớp (chưa có trọng số)."""
+    model = fasterrcnn_mobilenet_v3_large_fpn(weights=None)
+    in_features = model.roi_heads.box_predictor.cls_score.in_features
+    model.roi_heads.box_predictor = FastRCNNPredictor(in_features, num_classes)
+    return model
+
+
+def quantize_dynamic_linear(model):
+    """
+    ✅ Lượng tử hoá động INT8 cho các lớp Linear (box head fc6/fc7 + predictor, ~74% trọng số của model):
+    trọng số lưu INT8, activation được lượng tử hoá lúc chạy → nhỏ hơn ~4 lần, nhân ma trận nhanh hơn trên CPU.
+    Backbone MobileNetV3 / FPN (Conv) giữ FP32.
+    `inplace=True`: chỉ thay các lớp Linear, không deepcopy cả model → trọng số Conv/FPN vẫn là tensor gốc
+    (vd. shared memory giữa các replica); riêng trọng số INT8 của Linear là bản riêng của từng process.
+    """
+    with warnings.catch_warnings():
+        # torch mới cảnh báo deprecated cho API quantized tensor, kết quả vẫn đúng
+        warnings.simplefilter("ignore")
+        return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+
+
+class Uint8RCNNTransform(GeneralizedRCNNTransform):
+    """
+    ✅ Transform của Faster R-CNN nhận thẳng ảnh uint8 (C, H, W): chuyển float + chia 255 + normalize
+    gộp thành 1 phép (x - 255·mean) / (255·std) → chỉ 1 lần cấp phát float cho mỗi ảnh,
+    thay vì ToTensor (float/255) rồi normalize (thêm 1 bản float nữa). Ảnh float vẫn xử lý như cũ.
+    """
+
+    def __init__(self, *args, dtype=torch.float32, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.dtype = dtype
+
+    def normalize(self, image):
+        if image.is_floating_point():
+            return super().normalize(image)
+        mean = torch.as_tensor(self.image_mean, dtype=self.dtype, device=image.device) * 255
+        std = torch.as_tensor(self.image_std, dtype=self.dtype, device=image.device) * 255
+        # decode_jpeg trả về layout HWC (non-contiguous) → chuyển float thẳng sang layout CHW liền mạch
+        image = image.to(self.dtype, memory_format=torch.contiguous_format)
+        return image.sub_(mean[:, None, None]).div_(std[:, None, None])
+
+
+def with_input_size(model, min_size: int, max_size: int, dtype=torch.float32):
+    """
+    Model dùng chung backbone/RPN/head (cùng trọng số, không tốn thêm bộ nhớ) với `model`
+    nhưng resize ảnh vào theo (min_size, max_size) khác → mỗi chế độ 1 view, an toàn khi nhiều thread cùng chạy.
+    Transform của view là Uint8RCNNTransform (nhận được ảnh uint8), cùng chế độ train/eval với `model`.
+    """
+    transform = model.transform
+    view = copy.copy(model)
+    view._modules = dict(model._modules)
+    view.transform = Uint8RCNNTransform(min_size, max_size, transform.image_mean, transform.image_std,
+                                        size_divisible=transform.size_divisible, dtype=dtype)
+    # Transform mới tạo ở chế độ train → postprocess không đưa box về kích thước ảnh vào; theo chế độ của model
+    view.transform.train(model.training)
+    return view
+
+
+def is_torchscript_file(path: str) -> bool:
+    """File TorchScript (torch.jit.save) có thư mục code/ trong archive zip, state_dict (torch.save) thì không."""
+    try:
+        with zipfile.ZipFile(path) as archive:
+            return any("/code/" in name for name in archive.namelist())
+    except (OSError, zipfile.BadZipFile):
+        return False
+
+
+def export_torchscript(model, output_path: str):
+    """
+    ✅ Script + freeze model (đã eval) rồi lưu thành 1 file TorchScript:
+    lúc chạy chỉ cần torch.jit.load, không dựng lại kiến trúc bằng Python và không unpickle state_dict.
+    Kích thước đầu vào của transform được ghi kèm (TORCHSCRIPT_INPUT_SIZE_FILE) vì sau freeze không đọc lại được.
+    """
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        scripted = torch.jit.freeze(torch.jit.script(model.eval()))
+    input_size = [model.transform.min_size[0], model.transform.max_size]
+    scripted.save(output_path, _extra_files={TORCHSCRIPT_INPUT_SIZE_FILE: json.dumps(input_size)})
+    return scripted
+
+
+def _read_only_uint8(data: bytes):
+    """
+    torch.frombuffer trên bytes (read-only) → tensor uint8 1 chiều, không copy. Tensor chỉ để đọc
+    (decode_jpeg / view rồi .to(device)), nên chỉ bỏ cảnh báo "buffer is not writable" ở đúng lời gọi này.
+    """
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore", message="The given buffer is not writable")
+        return torch.frombuffer(data, dtype=torch.uint8)
+
+
+class InferenceEngine:
+    """
+    ✅ Lõi suy luận dùng chung cho backend HTTP (app/services.py, phân tích video)
+    và server UDP (udp_server.py): cùng 1 cách load model, chọn device/FP16,
+    tiền xử lý, forward theo batch, lọc ngưỡng + NMS.
+    Tối ưu thêm vào đây (batching, cache, lượng tử hoá...) thì cả 2 server cùng được hưởng.
+
+    Kết quả mỗi ảnh: list {"box": [x1, y1, x2, y2], "label": chỉ số trong VOC_CLASSES, "score": float},
+    box theo toạ độ ảnh gốc.
+
+    `input_profile`: chế độ kích thước đầu vào mặc định (INPUT_SIZES, vd. "accuracy" cho /predict,
+    "realtime" cho UDP); từng lời gọi có thể chọn chế độ khác qua `profile`.
+    Ảnh JPEG lớn được thu nhỏ ngay lúc giải mã (xem decode).
+    """
+
+    def __init__(self, model_path: str = None, use_half: bool = True, state_dict=None, device=None,
+                 nms_iou_threshold: float = 0.5, quantize: str = "none", input_profile: str = "accuracy",
+                 input_sizes=None, nms_mode: str = "class_agnostic"):
+        """
+        Nếu truyền `state_dict` (vd. tensor trong shared memory) thì dùng trực tiếp thay vì đọc file.
+        `use_half`: FP16 để giảm RAM, chỉ bật khi chạy trên GPU.
+        `quantize`: "dynamic" → INT8 cho các lớp Linear (chỉ trên CPU), xem quantize_dynamic_linear.
+        `model_path` là file TorchScript (app/export_model.py) → load bằng torch.jit.load (khởi động nhanh);
+        lượng tử hoá và kích thước đầu vào khi đó đã được chọn lúc export: `input_profile` / `profile` không có
+        tác dụng, decode thu nhỏ ảnh theo kích thước ghi trong artifact (artifact cũ không ghi → không thu nhỏ).
+        `input_sizes`: {chế độ: (min_size, max_size)}, mặc định INPUT_SIZES.
+        `nms_mode`: NMS thêm sau output của model (NMS_MODES, xem doi_mat_core/postprocess.py).
+        """
+        if quantize not in QUANTIZE_MODES:
+            raise ValueError(f"Chế độ lượng tử hoá không hợp lệ: {quantize}")
+        if nms_mode not in NMS_MODES:
+            raise ValueError(f"Chế độ NMS không hợp lệ: {nms_mode}")
+        self.device = torch.device(device) if device else torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.use_half = use_half and (self.device.type == "cuda")
+        self.dtype = torch.float16 if self.use_half else torch.float32
+        self.nms_iou_threshold = nms_iou_threshold
+        self.nms_mode = nms_mode
+        if quantize != "none" and self.device.type != "cpu":
+            print("⚠️ Lượng tử hoá INT8 chỉ hỗ trợ CPU → bỏ qua")
+            quantize = "none"
+        self.scripted = bool(model_path) and state_dict is None and is_torchscript_file(model_path)
+        if self.scripted and quantize != "none":
+            print("⚠️ Model TorchScript: lượng tử hoá được chọn lúc export → bỏ qua quantize")
+            quantize = "none"
+        self.quantize = quantize
+        self.input_sizes = dict(input_sizes or INPUT_SIZES)
+        if input_profile not in self.input_sizes:
+            raise ValueError(f"Chế độ kích thước đầu vào không hợp lệ: {input_profile}")
+        self.input_profile = input_profile
+        self.classes = VOC_CLASSES
+        self.model = self._load_model(model_path, state_dict)
+        if self.scripted:
+            # Transform đã được đóng băng trong file TorchScript → mọi profile dùng chung model và kích thước lúc export
+            self._models = {profile: self.model for profile in self.input_sizes}
+            self.input_sizes = {profile: self._scripted_input_size for profile in self.input_sizes}
+        else:
+            self._models = {profile: with_input_size(self.model, *size, dtype=self.dtype)
+                            for profile, size in self.input_sizes.items()}
+        self._to_tensor = ToTensor()
+
+    def _load_model(self, model_path: str, state_dict=None):
+        """✅ Load model vào GPU/CPU và chuyển sang FP16 nếu có thể"""
+        if self.scripted:
+            extra_files = {TORCHSCRIPT_INPUT_SIZE_FILE: ""}
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")  # torch mới cảnh báo torch.jit deprecated
+                model = torch.jit.load(model_path, map_location=self.device, _extra_files=extra_files)
+            input_size = extra_files[TORCHSCRIPT_INPUT_SIZE_FILE]
+            self._scripted_input_size = tuple(json.loads(input_size)) if input_size else None
+        elif state_dict is None:
+            model = build_model(len(self.classes))
+            model.load_state_dict(torch.load(model_path, map_location=self.device))
+        else:
+            # Dựng model trên device "meta" (không cấp phát bộ nhớ cho trọng số),
+            # rồi assign=True để tham số trỏ thẳng vào tensor truyền vào, không copy
+            with torch.device("meta"), warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                model = build_model(len(self.classes))
+            model.load_state_dict(state_dict, assign=True)
+        model.to(self.device)
+
+        # ✅ Chuyển sang FP16 nếu có GPU (giảm RAM ~40-50%)
+        if self.use_half:
+            model = model.half()
+
+        model.eval()
+        if self.quantize == "dynamic":
+            model = quantize_dynamic_linear(model)
+        print(f"✅ Model loaded on {self.device} | FP16 = {self.use_half} | quantize = {self.quantize} "
+              f"| TorchScript = {self.scripted}")
+        return model
+
+    def to_tensor(self, image):
+        """Ảnh PIL hoặc mảng RGB (H, W, 3) uint8 → tensor (C, H, W) trên đúng device/dtype của model."""
+        return self._to_tensor(image).to(self.device, self.dtype)
+
+    def preprocess(self, image_bytes: bytes):
+        """Bytes ảnh (JPEG/PNG...) → tensor đủ độ phân giải. Ảnh lỗi → ném exception."""
+        return self.to_tensor(Image.open(io.BytesIO(image_bytes)).convert("RGB"))
+
+    def target_size(self, width: int, height: int, profile: str = None):
+        """
+        (width, height) mà model sẽ resize ảnh tới theo `profile`, None nếu ảnh không lớn hơn
+        (hoặc model TorchScript không ghi kích thước đầu vào → để transform trong model tự resize).
+        """
+        input_size = self.input_sizes[profile or self.input_profile]
+        if input_size is None:
+            return None
+        min_size, max_size = input_size
+        scale = min(min_size / min(width, height), max_size / max(width, height))
+        if scale >= 1:
+            return None
+        return max(1, round(width * scale)), max(1, round(height * scale))
+
+    def decode(self, image_bytes: bytes, profile: str = None):
+        """
+        ✅ Bytes ảnh → tensor uint8 (C, H, W) không lớn hơn kích thước model sẽ resize tới theo `profile`
+        (chuyển float + normalize nằm trong transform của model, xem Uint8RCNNTransform):
+        - JPEG không cần thu nhỏ: decode_jpeg đọc thẳng từ buffer (torch.frombuffer, không copy) → 1 bản uint8.
+        - Ảnh lớn: PIL giải mã thẳng ở 1/2, 1/4 hoặc 1/8 độ phân giải (draft) rồi thu nhỏ nốt,
+          nên ảnh 12 MP không phải giải mã đủ kích thước.
+        Trả về (tensor, scale) với scale = (sx, sy) để đưa box về toạ độ ảnh gốc.
+        """
+        image = Image.open(io.BytesIO(image_bytes))  # chỉ đọc header
+        width, height = image.size
+        target = self.target_size(width, height, profile)
+        if target is None and image.format == "JPEG":
+            tensor = decode_jpeg(_read_only_uint8(image_bytes), mode=ImageReadMode.RGB)
+            return tensor.to(self.device), (1.0, 1.0)
+        if target is not None:
+            image.draft("RGB", target)
+        image = image.convert("RGB")
+        if target is not None and image.size != target:
+            image = image.resize(target, Image.BILINEAR)
+        # tobytes = bản copy duy nhất, frombuffer + permute chỉ là view
+        tensor = _read_only_uint8(image.tobytes()).view(image.height, image.width, 3).permute(2, 0, 1)
+        return tensor.to(self.device), (width / image.width, height / image.height)
+
+    def postprocess_batch(self, outputs, confidence_threshold=0.5, scales=None):
+        """
+        Output của model cho cả batch → list Detections dạng cột (doi_mat_core/postprocess.py): lọc confidence,
+        NMS theo `nms_mode`, nhân box với `scales` (sx, sy) — 1 lần chuyển về CPU cho cả batch.
+        """
+        return postprocess_batch(outputs, confidence_threshold, self.nms_iou_threshold, self.nms_mode, scales)
+
+    def postprocess(self, output, confidence_threshold: float, scale=None):
+        """Output của model cho 1 ảnh → danh sách {"box", "label", "score"}."""
+        return self.postprocess_batch([output], confidence_threshold, [scale])[0].to_dicts()
+
+    @torch.no_grad()
+    def forward(self, tensors, profile: str = None):
+        """
+        1 lần forward cho cả list tensor (mỗi ảnh có thể khác kích thước), trả về output thô của model
+        (box theo toạ độ của tensor đưa vào). `profile`: kích thước đầu vào, mặc định input_profile.
+        """
+        model = self._models[profile or self.input_profile]
+        images = []
+        for tensor in tensors:
+            if not tensor.is_floating_point():
+                # Buffer pinned (FrameBufferPool) → copy không chặn; bên gọi giữ buffer tới khi có kết quả
+                tensor = tensor.to(self.device, non_blocking=True)
+                if self.scripted:
+                    # Transform trong file TorchScript chỉ nhận float [0, 1]
+                    tensor = tensor.to(self.dtype).div_(255)
+            else:
+                tensor = tensor.to(self.device, self.dtype)
+            images.append(tensor)
+        outputs = model(images)
+        # Model TorchScript luôn trả về (losses, detections)
+        return outputs[1] if self.scripted else outputs
+
+    def warm_up(self, height: int = 480, width: int = 640, runs: int = 2):
+        """
+        Chạy thử vài lần với ảnh giả để request đầu tiên không phải trả chi phí khởi tạo
+        (cấp phát bộ nhớ, chọn kernel, TorchScript profiling ở 2 lần chạy đầu).
+        """
+        started_at = time.perf_counter()
+        image = torch.zeros(3, height, width)
+        for _ in range(max(1, runs)):
+            self.forward([image])
+        print(f"🔥 Warm-up model xong sau {time.perf_counter() - started_at:.2f}s")
+
+    def predict_tensors(self, tensors, confidence_threshold=0.5, scales=None, profile: str = None):
+        """
+        Forward + postprocess cho cả list tensor.
+        `confidence_threshold` là 1 số hoặc danh sách ngưỡng cho từng ảnh. Lỗi model → ném exception.
+        `scales`: (sx, sy) của từng ảnh từ decode, để trả box theo toạ độ ảnh gốc.
+        """
+        if not tensors:
+            return []
+        outputs = self.forward(tensors, profile)
+        return [detections.to_dicts() for detections in self.postprocess_batch(outputs, confidence_threshold, scales)]
+
+    def predict_batch(self, images_bytes, confidence_threshold=0.5, profile: str = None):
+        """
+        Dự đoán nhiều ảnh (bytes) trong 1 lần forward, ảnh được thu nhỏ khi giải mã theo `profile`.
+        Ảnh lỗi (không đọc được) hoặc lỗi khi chạy model → None tại vị trí tương ứng.
+        """
+        if isinstance(confidence_threshold, (int, float)):
+            thresholds = [confidence_threshold] * len(images_bytes)
+        else:
+            thresholds = list(confidence_threshold)
+
+        results = [None] * len(images_bytes)
+        images, scales, positions = [], [], []
+        for i, image_bytes in enumerate(images_bytes):
+            try:
+                image, scale = self.decode(image_bytes, profile)
+                images.append(image)
+                scales.append(scale)
+                positions.append(i)
+            except Exception as e:
+                print(f"❌ Prediction error: {e}")
+
+        if not images:
+            return results
+
+        try:
+            outputs = self.predict_tensors(images, [thresholds[i] for i in positions], scales, profile)
+            for i, output in zip(positions, outputs):
+                results[i] = output
+        except Exception as e:
+            print(f"❌ Prediction error: {e}")
+        return results
+
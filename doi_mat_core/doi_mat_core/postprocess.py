@@ -0,0 +1,88 @@
+# doi_mat_core/postprocess.py
+"""
+Hậu xử lý output Faster R-CNN dùng chung cho /predict, phân tích video và server UDP:
+lọc confidence → NMS → nhân box về toạ độ ảnh gốc, tất cả bằng phép toán tensor trên device của model,
+rồi chuyển về CPU đúng 1 lần cho cả batch. Kết quả dạng cột (Detections).
+"""
+import numpy as np
+import torch
+from torchvision.ops import batched_nms, nms
+
+# Chế độ NMS thêm sau NMS theo lớp có sẵn trong model:
+# - "class_agnostic": box trùng nhau giữa các lớp khác nhau chỉ giữ box score cao nhất (hành vi cũ).
+# - "per_class": batched_nms, chỉ loại box trùng cùng lớp (ngưỡng IoU của mình thay vì của model).
+# - "none": giữ nguyên output của model.
+NMS_MODES = ("class_agnostic", "per_class", "none")
+
+
+class Detections:
+    """
+    ✅ Detections của 1 ảnh dạng cột: `boxes` (N, 4) float32, `labels` (N,) int64, `scores` (N,) float32 (NumPy).
+    Không tạo dict cho từng box; cần JSON thì gọi to_dicts() (mỗi cột 1 lần tolist()).
+    """
+
+    __slots__ = ("boxes", "labels", "scores")
+
+    def __init__(self, boxes, labels, scores):
+        self.boxes = boxes
+        self.labels = labels
+        self.scores = scores
+
+    def __len__(self):
+        return len(self.scores)
+
+    def to_dicts(self, class_names=None):
+        """Danh sách {"box", "label", "score"}; `class_names` → label là tên lớp thay vì chỉ số."""
+        labels = self.labels.tolist()
+        if class_names is not None:
+            labels = [class_names[label] for label in labels]
+        return [{"box": box, "label": label, "score": score}
+                for box, label, score in zip(self.boxes.tolist(), labels, self.scores.tolist())]
+
+
+def filter_detections(output, confidence_threshold: float, iou_threshold: float = 0.5,
+                      nms_mode: str = "class_agnostic"):
+    """Output của model cho 1 ảnh → (boxes, scores, labels) tensor sau lọc confidence + NMS, vẫn trên device."""
+    boxes, scores, labels = output['boxes'], output['scores'], output['labels']
+    keep = scores >= confidence_threshold
+    boxes, scores, labels = boxes[keep].float(), scores[keep].float(), labels[keep]
+    if nms_mode == "class_agnostic":
+        keep = nms(boxes, scores, iou_threshold)
+    elif nms_mode == "per_class":
+        keep = batched_nms(boxes, scores, labels, iou_threshold)
+    else:
+        return boxes, scores, labels
+    return boxes[keep], scores[keep], labels[keep]
+
+
+def postprocess_batch(outputs, confidence_thresholds, iou_threshold: float = 0.5, nms_mode: str = "class_agnostic",
+                      scales=None):
+    """
+    Output của model cho cả batch → list Detections, 1 phần tử mỗi ảnh.
+    `confidence_thresholds`: 1 số hoặc danh sách ngưỡng cho từng ảnh; `scales`: (sx, sy) hoặc None cho từng ảnh.
+    Box, score, label của mọi ảnh được ghép thành 1 tensor (N, 6) → 1 lần chuyển về CPU cho cả batch.
+    """
+    if nms_mode not in NMS_MODES:
+        raise ValueError(f"Chế độ NMS không hợp lệ: {nms_mode}")
+    if isinstance(confidence_thresholds, (int, float)):
+        confidence_thresholds = [confidence_thresholds] * len(outputs)
+    if scales is None:
+        scales = [None] * len(outputs)
+    if not outputs:
+        return []
+
+    columns, counts = [], []
+    for output, threshold, scale in zip(outputs, confidence_thresholds, scales):
+        boxes, scores, labels = filter_detections(output, threshold, iou_threshold, nms_mode)
+        if scale is not None and tuple(scale) != (1.0, 1.0):
+            boxes = boxes * boxes.new_tensor([scale[0], scale[1], scale[0], scale[1]])
+        # label < 2^24 nên lưu chung cột float32 không mất chính xác
+        columns.append(torch.cat([boxes, scores[:, None], labels[:, None].float()], dim=1))
+        counts.append(len(scores))
+
+    packed = torch.cat(columns).cpu().numpy()
+    results = []
+    for rows in np.split(packed, np.cumsum(counts)[:-1]):
+        results.append(Detections(np.ascontiguousarray(rows[:, :4]), rows[:, 5].astype(np.int64),
+                                  np.ascontiguousarray(rows[:, 4])))
+    return results
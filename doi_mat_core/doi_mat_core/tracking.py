@@ -0,0 +1,483 @@
+# doi_mat_core/tracking.py
+"""
+ObjectTracker (ghép detection giữa các frame, nhận diện lại track đã mất, Kalman tuỳ chọn) dùng chung
+cho phân tích video của backend HTTP và tracking theo client của server UDP. Chỉ cần NumPy (SciPy tuỳ chọn).
+"""
+from collections import defaultdict
+from collections.abc import Mapping
+import heapq
+import itertools
+
+import numpy as np
+
+try:
+    from scipy.optimize import linear_sum_assignment  # Tuỳ chọn: ghép cặp Hungarian
+except ImportError:
+    linear_sum_assignment = None
+
+ASSIGNMENT_MODES = ("greedy", "hungarian")
+MOTION_MODELS = ("none", "kalman")
+
+
+def iou_matrix(boxes_a, boxes_b):
+    """IoU giữa mọi cặp box (N, 4) x (M, 4) → ma trận (N, M), tính bằng NumPy broadcasting."""
+    a = np.asarray(boxes_a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(boxes_b, dtype=np.float64).reshape(-1, 4)
+    inter_w = np.clip(np.minimum(a[:, None, 2], b[None, :, 2]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(a[:, None, 3], b[None, :, 3]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = inter_w * inter_h
+    area_a = (a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])
+    area_b = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    union = area_a[:, None] + area_b[None, :] - inter
+    # Giống _calculate_iou: không giao nhau → 0 (tránh chia cho 0 với box suy biến)
+    return np.divide(inter, union, out=np.zeros_like(inter), where=inter > 0)
+
+class LostTrackIndex:
+    """
+    ✅ Chỉ mục cho các track đã mất dấu (lost_objects), để nhận diện lại mà không duyệt hết:
+    - Lưới không gian theo nhãn: ô `cell_size` px, chỉ xét 3x3 ô quanh tâm detection
+      (cell_size ≥ khoảng cách ghép tối đa nên không bỏ sót ứng viên).
+    - Heap hết hạn theo `lost_frame`: xoá track quá tuổi mà không dựng lại dict mỗi frame.
+    Entry cũ trong heap (track đã được nhận lại / mất dấu lần nữa) bị bỏ qua khi pop.
+    """
+
+    def __init__(self, cell_size=100.0):
+        self.cell_size = cell_size
+        self._cells = defaultdict(dict)  # (label, cx, cy) -> {object_id: (seq, tâm x, tâm y, rộng)}
+        self._where = {}                 # object_id -> (ô, seq)
+        self._expiry = []                # heap (lost_frame, seq, object_id)
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return len(self._where)
+
+    def _cell(self, label, cx, cy):
+        return (label, int(cx // self.cell_size), int(cy // self.cell_size))
+
+    def add(self, object_id, label, box, lost_frame):
+        self.remove(object_id)
+        cx, cy = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+        cell = self._cell(label, cx, cy)
+        seq = next(self._seq)
+        self._cells[cell][object_id] = (seq, cx, cy, box[2] - box[0])
+        self._where[object_id] = (cell, seq)
+        heapq.heappush(self._expiry, (lost_frame, seq, object_id))
+
+    def remove(self, object_id):
+        entry = self._where.pop(object_id, None)
+        if entry is None:
+            return
+        cell, _ = entry
+        bucket = self._cells[cell]
+        del bucket[object_id]
+        if not bucket:
+            del self._cells[cell]
+
+    def expire(self, frame_count, max_age):
+        """Xoá và trả về id các track có frame_count - lost_frame > max_age."""
+        expired = []
+        while self._expiry and frame_count - self._expiry[0][0] > max_age:
+            _, seq, object_id = heapq.heappop(self._expiry)
+            entry = self._where.get(object_id)
+            if entry is not None and entry[1] == seq:
+                self.remove(object_id)
+                expired.append(object_id)
+        return expired
+
+    def nearest(self, box, label, max_dist=100, min_size_similarity=0.5):
+        """
+        Track cùng nhãn gần nhất (khoảng cách tâm < max_dist, độ giống chiều rộng > min_size_similarity).
+        Hoà khoảng cách → track mất dấu sớm hơn, giống thứ tự duyệt dict trước đây.
+        """
+        det_cx, det_cy = (box[0] + box[2]) / 2, (box[1] + box[3]) / 2
+        det_w = box[2] - box[0]
+        _, gx, gy = self._cell(label, det_cx, det_cy)
+        best = None
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                bucket = self._cells.get((label, gx + dx, gy + dy))
+                if not bucket:
+                    continue
+                for object_id, (seq, cx, cy, w) in bucket.items():
+                    dist = np.sqrt((det_cx - cx) ** 2 + (det_cy - cy) ** 2)
+                    size_similarity = 1 - abs(det_w - w) / (det_w + w + 1e-6)
+                    if dist < max_dist and size_similarity > min_size_similarity:
+                        if best is None or (dist, seq) < best[:2]:
+                            best = (dist, seq, object_id)
+        return None if best is None else best[2]
+
+
+TRACK_FREE, TRACK_ACTIVE, TRACK_LOST, TRACK_EXPIRED = 0, 1, 2, 3
+
+
+class TrackStore:
+    """
+    ✅ Lưu toàn bộ track dạng structure-of-arrays: mỗi thuộc tính là 1 mảng NumPy cấp phát trước,
+    tăng gấp đôi khi đầy, id track = chỉ số hàng. Không tạo dict / copy box cho từng track mỗi frame.
+    `order` là thứ tự (tăng dần) lần cuối track chuyển trạng thái, giữ đúng thứ tự duyệt
+    như các dict objects / lost_objects trước đây.
+    """
+
+    def __init__(self, capacity=64):
+        self.size = 0
+        self.boxes = np.zeros((capacity, 4), dtype=np.float32)
+        self.labels = np.zeros(capacity, dtype=np.int64)
+        self.first_seen = np.zeros(capacity, dtype=np.int64)
+        self.last_seen = np.zeros(capacity, dtype=np.int64)
+        self.lost_frame = np.zeros(capacity, dtype=np.int64)
+        self.disappeared = np.zeros(capacity, dtype=np.int64)
+        self.state = np.zeros(capacity, dtype=np.uint8)
+        self.order = np.zeros(capacity, dtype=np.int64)
+        self._order_seq = 0
+
+    def _grow(self):
+        capacity = 2 * len(self.state)
+        for name in ("boxes", "labels", "first_seen", "last_seen", "lost_frame", "disappeared", "state", "order"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.size] = old[:self.size]
+            setattr(self, name, new)
+
+    def add(self, box, label, frame_count):
+        if self.size == len(self.state):
+            self._grow()
+        track_id = self.size
+        self.size += 1
+        self.boxes[track_id] = box
+        self.labels[track_id] = label
+        self.first_seen[track_id] = frame_count
+        self.disappeared[track_id] = 0
+        self.set_state(track_id, TRACK_ACTIVE, frame_count)
+        return track_id
+
+    def set_state(self, track_id, state, frame_count):
+        self.state[track_id] = state
+        self.order[track_id] = self._order_seq
+        self._order_seq += 1
+        if state == TRACK_ACTIVE:
+            self.last_seen[track_id] = frame_count
+        elif state == TRACK_LOST:
+            self.lost_frame[track_id] = frame_count
+
+    def ids(self, state):
+        """Id các track ở trạng thái `state`, theo thứ tự chuyển trạng thái."""
+        ids = np.flatnonzero(self.state[:self.size] == state)
+        return ids[np.argsort(self.order[ids], kind="stable")]
+
+    def record(self, track_id):
+        """Dict của 1 track, cùng dạng với dict trong objects / lost_objects trước đây."""
+        box = self.boxes[track_id].copy()
+        data = {
+            'box': box, 'label': int(self.labels[track_id]),
+            'first_seen': int(self.first_seen[track_id]), 'last_seen': int(self.last_seen[track_id])
+        }
+        if self.state[track_id] == TRACK_LOST:
+            data.update({
+                'last_box': box, 'last_pos': ((box[0] + box[2]) / 2, (box[1] + box[3]) / 2),
+                'lost_frame': int(self.lost_frame[track_id])
+            })
+        return data
+
+
+class TrackView(Mapping):
+    """View chỉ đọc {id: dict} của các track ở 1 trạng thái, thay cho dict objects / lost_objects."""
+
+    def __init__(self, store, state):
+        self._store = store
+        self._state = state
+
+    def __getitem__(self, track_id):
+        if not (0 <= track_id < self._store.size) or self._store.state[track_id] != self._state:
+            raise KeyError(track_id)
+        return self._store.record(track_id)
+
+    def __iter__(self):
+        return (int(track_id) for track_id in self._store.ids(self._state))
+
+    def __len__(self):
+        return int(np.count_nonzero(self._store.state[:self._store.size] == self._state))
+
+
+class ConstantVelocityKalman:
+    """
+    ✅ Bộ lọc Kalman vận tốc không đổi cho mọi track (kiểu SORT/DeepSORT), tính vectorized.
+    Trạng thái mỗi track: [cx, cy, w, h, vx, vy, vw, vh], vận tốc tính theo px/frame.
+    Giữa 2 frame được lấy mẫu cách nhau dt frame, track được dự đoán trước khi ghép cặp.
+    Nhiễu quá trình tăng theo dt (gia tốc nhiễu trắng: phương sai vị trí ~dt³, vận tốc ~dt) → lấy mẫu càng thưa
+    thì vùng gate Mahalanobis càng rộng, vật đổi hướng/tốc độ giữa 2 lần lấy mẫu vẫn nằm trong gate.
+    """
+
+    # Độ lệch chuẩn nhiễu mỗi frame theo kích thước box (giá trị của DeepSORT, dt = 1)
+    STD_POSITION = 1.0 / 20
+    STD_VELOCITY = 1.0 / 160
+    # Ngưỡng chi-square 95% với 2 bậc tự do (vị trí tâm)
+    GATE_CHI2 = 5.9915
+
+    def __init__(self, capacity=64):
+        self.mean = np.zeros((capacity, 8))
+        self.cov = np.zeros((capacity, 8, 8))
+        self.frame = np.zeros(capacity, dtype=np.int64)
+
+    def _ensure(self, track_id):
+        if track_id < len(self.frame):
+            return
+        capacity = max(2 * len(self.frame), track_id + 1)
+        for name in ("mean", "cov", "frame"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+    @staticmethod
+    def _measure(boxes):
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        w = np.maximum(boxes[:, 2] - boxes[:, 0], 1.0); h = np.maximum(boxes[:, 3] - boxes[:, 1], 1.0)
+        return np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2, w, h], axis=1)
+
+    @staticmethod
+    def _scale(measurements):
+        """Thang đo nhiễu theo [w, h, w, h] của từng track."""
+        wh = measurements[:, 2:4]
+        return np.concatenate([wh, wh], axis=1)
+
+    def initiate(self, track_id, box, frame_count):
+        self._ensure(track_id)
+        z = self._measure(box)
+        scale = self._scale(z)[0]
+        self.mean[track_id] = np.concatenate([z[0], np.zeros(4)])
+        std = np.concatenate([2 * self.STD_POSITION * scale, 10 * self.STD_VELOCITY * scale])
+        self.cov[track_id] = np.diag(std ** 2)
+        self.frame[track_id] = frame_count
+
+    def predict(self, track_ids, frame_count):
+        """Đưa trạng thái các track tới frame_count, trả về box dự đoán (N, 4) dạng x1y1x2y2."""
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        dt = (frame_count - self.frame[track_ids]).astype(np.float64)
+        mean = self.mean[track_ids]; cov = self.cov[track_ids]
+        transition = np.tile(np.eye(8), (len(track_ids), 1, 1))
+        transition[:, np.arange(4), np.arange(4) + 4] = dt[:, None]
+        scale = self._scale(mean[:, :4])
+        position_var = (self.STD_POSITION * scale) ** 2
+        velocity_var = (self.STD_VELOCITY * scale) ** 2
+        dt = dt[:, None]
+        mean = np.einsum("nij,nj->ni", transition, mean)
+        cov = transition @ cov @ transition.transpose(0, 2, 1)
+        # Nhiễu tích luỹ qua dt frame: vị trí đi ngẫu nhiên + gia tốc nhiễu trắng (vận tốc đổi dần từng frame)
+        position, velocity = np.arange(4), np.arange(4) + 4
+        cov[:, position, position] += position_var * dt + velocity_var * dt ** 3 / 3
+        cov[:, velocity, velocity] += velocity_var * dt
+        cov[:, position, velocity] += velocity_var * dt ** 2 / 2
+        cov[:, velocity, position] += velocity_var * dt ** 2 / 2
+        self.mean[track_ids] = mean; self.cov[track_ids] = cov; self.frame[track_ids] = frame_count
+        cx, cy = mean[:, 0], mean[:, 1]
+        w, h = np.maximum(mean[:, 2], 1.0), np.maximum(mean[:, 3], 1.0)
+        return np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+
+    def update(self, track_ids, boxes):
+        """Cập nhật các track (đã predict tới frame hiện tại) bằng box đo được."""
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        if len(track_ids) == 0:
+            return
+        z = self._measure(boxes)
+        mean = self.mean[track_ids]; cov = self.cov[track_ids]
+        noise = (self.STD_POSITION * self._scale(mean[:, :4])) ** 2
+        innovation_cov = cov[:, :4, :4].copy()
+        innovation_cov[:, np.arange(4), np.arange(4)] += noise
+        # K = P Hᵀ S⁻¹ (S đối xứng nên giải S Kᵀ = H P)
+        gain = np.linalg.solve(innovation_cov, cov[:, :4, :]).transpose(0, 2, 1)
+        mean = mean + np.einsum("nij,nj->ni", gain, z - mean[:, :4])
+        cov = cov - gain @ cov[:, :4, :]
+        self.mean[track_ids] = mean; self.cov[track_ids] = cov
+
+    def gating_distance(self, track_ids, boxes):
+        """
+        Khoảng cách Mahalanobis² giữa tâm dự đoán của track và tâm box → ma trận (N, M),
+        theo hiệp phương sai innovation (dự đoán tới frame hiện tại + nhiễu đo).
+        """
+        track_ids = np.asarray(track_ids, dtype=np.int64)
+        centers = self._measure(boxes)[:, :2]
+        mean = self.mean[track_ids, :2]
+        noise = (self.STD_POSITION * self._scale(self.mean[track_ids, :4])[:, :2]) ** 2
+        cov = self.cov[track_ids][:, :2, :2] + noise[:, :, None] * np.eye(2) + np.eye(2) * 1e-6
+        diff = centers[None, :, :] - mean[:, None, :]
+        return np.einsum("nmi,nij,nmj->nm", diff, np.linalg.inv(cov), diff)
+
+
+# --- DÁN TOÀN BỘ LỚP OBJECT TRACKER CỦA BẠN VÀO ĐÂY ---
+class ObjectTracker:
+    """
+    `assignment`: cách ghép track cũ với detection mới theo IoU.
+    - "greedy": duyệt track theo IoU lớn nhất giảm dần, mỗi track lấy detection tốt nhất (mặc định).
+    - "hungarian": ghép cặp tối ưu tổng IoU (cần scipy, không có thì quay về greedy).
+    `motion`: "none" (ghép theo box cuối cùng) hoặc "kalman": ghép theo IoU với box dự đoán
+    (ConstantVelocityKalman), track/detection còn lại ghép theo IoU với box thấy lần cuối (như "none", khi vật
+    đổi hướng làm dự đoán trượt), rồi theo khoảng cách Mahalanobis cho cặp cùng nhãn còn lại.
+    Hiệu quả theo tốc độ vật / mật độ lấy mẫu: xem benchmarks/bench_motion.py của doi_mat_backend.
+    Dữ liệu track nằm trong `store` (TrackStore); `objects` / `lost_objects` là view dạng dict.
+    Sau mỗi update, `detection_ids[i]` là id track được gán cho detection thứ i của frame đó.
+    """
+    def __init__(self, max_disappeared=10, iou_threshold=0.5, max_lost_age=50, assignment="greedy", motion="none"):
+        if assignment not in ASSIGNMENT_MODES:
+            raise ValueError(f"Cách ghép cặp không hợp lệ: {assignment}")
+        if motion not in MOTION_MODELS:
+            raise ValueError(f"Mô hình chuyển động không hợp lệ: {motion}")
+        if assignment == "hungarian" and linear_sum_assignment is None:
+            print("⚠️ Chưa cài scipy → dùng ghép cặp greedy")
+            assignment = "greedy"
+        self.assignment = assignment
+        self.store = TrackStore()
+        self.objects = TrackView(self.store, TRACK_ACTIVE)
+        self.lost_objects = TrackView(self.store, TRACK_LOST)
+        self.lost_index = LostTrackIndex(cell_size=100.0)
+        self.motion = ConstantVelocityKalman() if motion == "kalman" else None
+        self.max_disappeared = max_disappeared
+        self.max_lost_age = max_lost_age
+        self.iou_threshold = iou_threshold
+        self.detection_ids = []
+
+    @property
+    def next_object_id(self):
+        return self.store.size
+
+    def _calculate_iou(self, boxA, boxB):
+        xA = max(boxA[0], boxB[0]); yA = max(boxA[1], boxB[1])
+        xB = min(boxA[2], boxB[2]); yB = min(boxA[3], boxB[3])
+        inter_area = max(0, xB - xA) * max(0, yB - yA)
+        if inter_area == 0: return 0
+        boxA_area = (boxA[2] - boxA[0]) * (boxA[3] - boxA[1])
+        boxB_area = (boxB[2] - boxB[0]) * (boxB[3] - boxB[1])
+        return inter_area / float(boxA_area + boxB_area - inter_area)
+
+    def _assign(self, ious):
+        """Các cặp (track, detection) được ghép, chỉ giữ cặp có IoU > iou_threshold."""
+        if self.assignment == "hungarian":
+            rows, cols = linear_sum_assignment(ious, maximize=True)
+            return [(row, col) for row, col in zip(rows, cols) if ious[row, col] > self.iou_threshold]
+
+        rows = ious.max(axis=1).argsort()[::-1]
+        cols = ious.argmax(axis=1)[rows]
+        used_rows = set(); used_cols = set(); pairs = []
+        for (row, col) in zip(rows, cols):
+            if row in used_rows or col in used_cols:
+                continue
+            if ious[row, col] > self.iou_threshold:
+                pairs.append((row, col))
+                used_rows.add(row); used_cols.add(col)
+        return pairs
+
+    def _assign_remaining(self, ious, pairs):
+        """Ghép theo `ious` chỉ trên các hàng/cột chưa có trong `pairs`, trả về cặp theo chỉ số gốc."""
+        rows = np.setdiff1d(np.arange(ious.shape[0]), [row for row, _ in pairs])
+        cols = np.setdiff1d(np.arange(ious.shape[1]), [col for _, col in pairs])
+        if len(rows) == 0 or len(cols) == 0:
+            return []
+        return [(rows[i], cols[j]) for i, j in self._assign(ious[np.ix_(rows, cols)])]
+
+    def _assign_by_motion(self, track_ids, det_boxes, det_labels, rows, cols):
+        """Ghép thêm các track/detection chưa ghép (cùng nhãn) theo khoảng cách Mahalanobis nhỏ nhất."""
+        rows = sorted(rows); cols = sorted(cols)
+        if not rows or not cols:
+            return []
+        distances = self.motion.gating_distance(track_ids[rows], det_boxes[cols])
+        same_label = self.store.labels[track_ids[rows]][:, None] == np.asarray(det_labels)[cols][None, :]
+        distances[~same_label | (distances > self.motion.GATE_CHI2)] = np.inf
+        pairs = []; used_i = set(); used_j = set()
+        for flat in np.argsort(distances, axis=None):
+            i, j = np.unravel_index(flat, distances.shape)
+            if not np.isfinite(distances[i, j]):
+                break
+            if i in used_i or j in used_j:
+                continue
+            pairs.append((rows[i], cols[j]))
+            used_i.add(i); used_j.add(j)
+        return pairs
+
+    def register(self, box, label, frame_count):
+        track_id = self.store.add(box, label, frame_count)
+        if self.motion is not None:
+            self.motion.initiate(track_id, box, frame_count)
+        return track_id
+
+    def deregister(self, object_id, frame_count):
+        store = self.store
+        store.set_state(object_id, TRACK_LOST, frame_count)
+        self.lost_index.add(object_id, int(store.labels[object_id]), store.boxes[object_id], frame_count)
+
+    def _age_unmatched(self, object_ids, frame_count):
+        """Tăng bộ đếm mất dấu; track vượt max_disappeared chuyển sang lost."""
+        store = self.store
+        for object_id in object_ids:
+            store.disappeared[object_id] += 1
+            if store.disappeared[object_id] > self.max_disappeared:
+                self.deregister(object_id, frame_count)
+
+    def predict(self, frame_count):
+        """Id và box dự đoán tại frame_count của các track đang active (không cần detection mới)."""
+        track_ids = self.store.ids(TRACK_ACTIVE)
+        if self.motion is not None and len(track_ids):
+            return track_ids, self.motion.predict(track_ids, frame_count)
+        return track_ids, self.store.boxes[track_ids].copy()
+
+    def update(self, detections, frame_count):
+        store = self.store
+        self.detection_ids = [None] * len(detections)
+        if len(detections) == 0:
+            self._age_unmatched(store.ids(TRACK_ACTIVE), frame_count)
+            return self.objects
+
+        current_object_ids = store.ids(TRACK_ACTIVE)
+        if len(current_object_ids) == 0:
+            for col, (box, label, _) in enumerate(detections):
+                self.detection_ids[col] = self.register(box, label, frame_count)
+        else:
+            det_boxes = np.asarray([det_box for det_box, _, _ in detections], dtype=np.float32).reshape(-1, 4)
+            if self.motion is not None:
+                track_boxes = self.motion.predict(current_object_ids, frame_count)
+            else:
+                track_boxes = store.boxes[current_object_ids]
+            ious = iou_matrix(track_boxes, det_boxes)
+            used_row_idxs = set(); used_col_idxs = set()
+
+            pairs = self._assign(ious)
+            if self.motion is not None:
+                # Dự đoán trượt (vật đổi hướng/tốc độ giữa 2 lần lấy mẫu) → thử lại với box thấy lần cuối
+                pairs += self._assign_remaining(iou_matrix(store.boxes[current_object_ids], det_boxes), pairs)
+                det_labels = [label for _, label, _ in detections]
+                pairs += self._assign_by_motion(
+                    current_object_ids, det_boxes, det_labels,
+                    set(range(ious.shape[0])).difference(row for row, _ in pairs),
+                    set(range(ious.shape[1])).difference(col for _, col in pairs)
+                )
+                self.motion.update(current_object_ids[[row for row, _ in pairs]], det_boxes[[col for _, col in pairs]])
+            for (row, col) in pairs:
+                object_id = current_object_ids[row]
+                store.boxes[object_id] = det_boxes[col]
+                store.labels[object_id] = detections[col][1]
+                store.last_seen[object_id] = frame_count
+                store.disappeared[object_id] = 0
+                self.detection_ids[col] = int(object_id)
+                used_row_idxs.add(row); used_col_idxs.add(col)
+            
+            unused_row_idxs = set(range(0, ious.shape[0])).difference(used_row_idxs)
+            self._age_unmatched([current_object_ids[row] for row in unused_row_idxs], frame_count)
+
+            unused_col_idxs = set(range(0, ious.shape[1])).difference(used_col_idxs)
+            if unused_col_idxs:
+                for lost_id in self.lost_index.expire(frame_count, self.max_lost_age):
+                    store.set_state(lost_id, TRACK_EXPIRED, frame_count)
+                for col in unused_col_idxs:
+                    det_box, det_label, _ = detections[col]
+                    best_match_id = self.lost_index.nearest(det_box, det_label)
+                    if best_match_id is not None:
+                        # Nhận lại track cũ: giữ first_seen, cập nhật box/nhãn
+                        store.boxes[best_match_id] = det_boxes[col]
+                        store.labels[best_match_id] = det_label
+                        store.disappeared[best_match_id] = 0
+                        store.set_state(best_match_id, TRACK_ACTIVE, frame_count)
+                        self.lost_index.remove(best_match_id)
+                        if self.motion is not None:
+                            self.motion.initiate(best_match_id, det_box, frame_count)
+                        self.detection_ids[col] = int(best_match_id)
+                    else:
+                        self.detection_ids[col] = self.register(det_box, det_label, frame_count)
+        return self.objects
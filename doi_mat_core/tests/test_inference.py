@@ -0,0 +1,32 @@
+# tests/test_inference.py
+"""
+Kiểm tra view theo kích thước đầu vào (with_input_size) cho kết quả giống model gốc (không cần trọng số thật).
+Chạy từ thư mục doi_mat_core:
+    python -m pytest -q tests
+"""
+import pytest
+import torch
+
+from doi_mat_core.inference import INPUT_SIZES, build_model, with_input_size
+
+
+@pytest.fixture(scope="module")
+def model():
+    torch.manual_seed(0)
+    model = build_model().eval()
+    model.roi_heads.score_thresh = 0.0  # trọng số ngẫu nhiên → score thấp, giữ lại để có box mà so sánh
+    return model
+
+
+@pytest.mark.parametrize("height, width", [(369, 665), (1080, 1920)])
+def test_view_boxes_match_baseline(model, height, width):
+    """Ảnh nhỏ hơn hoặc lớn hơn kích thước đầu vào: box của view ở toạ độ ảnh gốc, giống model gốc."""
+    image = torch.randint(0, 256, (3, height, width), dtype=torch.uint8)
+    view = with_input_size(model, *INPUT_SIZES["accuracy"])
+    assert not view.transform.training
+    with torch.no_grad():
+        expected = model([image.float() / 255])[0]
+        actual = view([image])[0]
+    assert len(expected["boxes"]) > 0
+    torch.testing.assert_close(actual["boxes"], expected["boxes"], atol=1e-2, rtol=0)
+    assert actual["boxes"][:, 2].max() <= width and actual["boxes"][:, 3].max() <= height
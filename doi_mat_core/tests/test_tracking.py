@@ -0,0 +1,33 @@
+# tests/test_tracking.py
+"""ObjectTracker với mô hình chuyển động: vật đổi hướng giữa 2 lần lấy mẫu vẫn giữ 1 track."""
+import numpy as np
+import pytest
+
+from doi_mat_core.tracking import ObjectTracker
+
+
+def bouncing_box(frame, speed=8.0, turn_at=60):
+    """Box 100x100 đi sang phải `speed` px/frame, tới frame `turn_at` thì quay ngược lại."""
+    x = speed * frame if frame <= turn_at else speed * (2 * turn_at - frame)
+    return np.array([x, 100.0, x + 100.0, 200.0], dtype=np.float32)
+
+
+@pytest.mark.parametrize("motion", ["none", "kalman"])
+def test_direction_change_keeps_one_track(motion):
+    """Lấy mẫu 10 lần/giây (mỗi 3 frame ở 30 fps): lúc quay đầu dự đoán trượt, vẫn ghép theo box thấy lần cuối."""
+    tracker = ObjectTracker(max_disappeared=20, iou_threshold=0.4, max_lost_age=50, motion=motion)
+    for frame in range(2, 120, 3):
+        tracker.update([(bouncing_box(frame), 15, 0.9)], frame + 1)
+    assert tracker.next_object_id == 1
+
+
+def test_kalman_follows_fast_object_between_sparse_samples():
+    """Lấy mẫu mỗi 30 frame, vật đi 240 px giữa 2 lần (không chồng box): kalman giữ 1 track, none thì không."""
+    counts = {}
+    for motion in ("none", "kalman"):
+        tracker = ObjectTracker(max_disappeared=20, iou_threshold=0.4, max_lost_age=50, motion=motion)
+        for frame in range(29, 600, 30):
+            tracker.update([(bouncing_box(frame, turn_at=10 ** 6), 15, 0.9)], frame + 1)
+        counts[motion] = tracker.next_object_id
+    assert counts["kalman"] == 1
+    assert counts["none"] > 1
@@ -47,11 +47,16 @@ class ApiService {
   }
 
   // --- HÀM MỚI CHO VIDEO ---
-  /// Gửi video lên server để phân tích và tạo câu hỏi quiz
-  Future<Map<String, dynamic>> analyzeVideo(File videoFile) async {
+  /// Gửi video lên server để phân tích và tạo câu hỏi quiz.
+  /// Server xử lý video ở background: POST trả về job id, sau đó poll tiến độ
+  /// tới khi xong nên không cần giữ 1 request HTTP mở suốt quá trình phân tích.
+  Future<Map<String, dynamic>> analyzeVideo(
+    File videoFile, {
+    void Function(double progress)? onProgress,
+  }) async {
     var request = http.MultipartRequest(
       'POST',
-      Uri.parse('$_baseUrl/analyze_video'), // Endpoint mới cho video
+      Uri.parse('$_baseUrl/jobs/analyze_video'),
     );
 
     // Thêm file video vào request. Tên field 'file' phải khớp với server.
@@ -60,24 +65,49 @@ class ApiService {
     );
 
     try {
-      // Gửi request và đặt timeout dài hơn cho video (ví dụ: 5 phút)
       var streamedResponse = await request.send().timeout(
-        const Duration(minutes: 5),
+        const Duration(minutes: 2),
       );
-
       var responseBody = await streamedResponse.stream.bytesToString();
 
-      if (streamedResponse.statusCode == 200) {
-        // Server trả về JSON chứa danh sách các câu hỏi
-        return json.decode(responseBody);
-      } else {
+      if (streamedResponse.statusCode != 202) {
         throw Exception(
           'Failed to analyze video. Status code: ${streamedResponse.statusCode}',
         );
       }
+      String jobId = json.decode(responseBody)['job_id'];
+      return await _waitForVideoJob(jobId, onProgress);
     } catch (e) {
       // Bắt lỗi timeout hoặc các lỗi mạng khác
       throw Exception('Failed to analyze video: $e');
     }
   }
+
+  /// Poll GET /jobs/{id} tới khi job xong, trả về kết quả quiz.
+  Future<Map<String, dynamic>> _waitForVideoJob(
+    String jobId,
+    void Function(double progress)? onProgress,
+  ) async {
+    final deadline = DateTime.now().add(const Duration(minutes: 10));
+    while (DateTime.now().isBefore(deadline)) {
+      var res = await http
+          .get(Uri.parse('$_baseUrl/jobs/$jobId'))
+          .timeout(const Duration(seconds: 30));
+      if (res.statusCode != 200) {
+        throw Exception('Failed to get video job: ${res.statusCode}');
+      }
+
+      Map<String, dynamic> job = json.decode(res.body);
+      onProgress?.call((job['progress'] as num).toDouble());
+      if (job['status'] == 'done') {
+        // Kết quả có dạng giống /analyze_video: {"questions": [...]}
+        return job['result'];
+      }
+      if (job['status'] == 'failed') {
+        throw Exception(job['error'] ?? 'Video job failed');
+      }
+      await Future.delayed(const Duration(seconds: 1));
+    }
+    throw Exception('Video job timed out');
+  }
 }
@@ -1,6 +1,7 @@
 import 'dart:io';
 import 'dart:convert';
 import 'dart:async';
+import 'dart:math';
 import 'dart:typed_data';
 
 /// Dịch vụ API để giao tiếp với máy chủ nhận dạng vật thể qua giao thức UDP.
@@ -9,8 +10,37 @@ class ApiUdpService {
   static const String _serverHost = "192.168.1.70"; // THAY IP NÀY
   static const int _serverPort = 9999;
 
-  // Giới hạn kích thước gói UDP để tránh lỗi "Message too long"
-  static const int _maxPacketSize = 60000;
+  // Giao thức chia frame thành nhiều gói UDP (khớp với FRAGMENT_HEADER trong udp_server.py):
+  // "DF" | version | flags | seq (u32) | frame_id (u32) | chunk_index (u16) | chunk_count (u16)
+  // | frame_size (u32) | offset (u32), big-endian
+  static const int _fragmentVersion = 1;
+  static const int _fragmentHeaderSize = 24;
+  // Mỗi gói vừa 1 MTU Wi-Fi để tránh phân mảnh IP
+  static const int _fragmentPayloadSize = 1400 - _fragmentHeaderSize;
+
+  // flags: bit 0 = yêu cầu server trả response nhị phân thay vì JSON
+  static const int _flagBinaryResponse = 0x01;
+  // Response nhị phân: version (u8 = 1) | flags (u8) | frame_id (u32) | count (u16)
+  // rồi mỗi object 10 byte: label (u8) | score (u8, /255) | x1, y1, x2, y2 (u16)
+  // flags bit 0 = server có tracking → mỗi object thêm track_id (u32), 14 byte
+  static const int _responseVersionBinary = 1;
+  static const int _responseFlagTrackIds = 0x01;
+  static const int _responseHeaderSize = 8;
+  static const int _detectionRecordSize = 10;
+  static const int _trackedDetectionRecordSize = 14;
+  static const List<String> _vocClasses = [
+    '__background__', 'aeroplane', 'bicycle', 'bird', 'boat', 'bottle',
+    'bus', 'car', 'cat', 'chair', 'cow', 'diningtable', 'dog', 'horse',
+    'motorbike', 'person', 'pottedplant', 'sheep', 'sofa', 'train', 'tvmonitor',
+  ];
+
+  /// Nhận kết quả dạng nhị phân (nhỏ hơn, mã hoá nhanh hơn JSON) hay JSON.
+  final bool binaryResponses;
+
+  ApiUdpService({this.binaryResponses = true});
+
+  int _frameId = 0;
+  int _sequence = 0;
 
   RawDatagramSocket? _socket;
   StreamController<Map<String, dynamic>>? _responseController;
@@ -35,19 +65,24 @@ class ApiUdpService {
           if (event == RawSocketEvent.read && !_isDisposed) {
             final datagram = _socket!.receive();
             if (datagram != null) {
-              final response = String.fromCharCodes(datagram.data);
-              print("📨 [RAW SERVER RESPONSE] JSON nhận được:");
-              print(response);
-              print("=" * 50);
-
               try {
-                final jsonData = json.decode(response);
+                final Map<String, dynamic> result;
+                if (datagram.data.isNotEmpty &&
+                    datagram.data[0] == _responseVersionBinary) {
+                  result = _decodeBinaryResponse(datagram.data);
+                } else {
+                  final response = utf8.decode(datagram.data);
+                  print("📨 [RAW SERVER RESPONSE] JSON nhận được:");
+                  print(response);
+                  print("=" * 50);
+                  result = json.decode(response);
+                }
                 if (_responseController != null &&
                     !_responseController!.isClosed) {
-                  _responseController!.add(jsonData);
+                  _responseController!.add(result);
                 }
               } catch (e) {
-                print("❌ Lỗi parse JSON: $e");
+                print("❌ Lỗi đọc response: $e");
               }
             }
           }
@@ -79,19 +114,43 @@ class ApiUdpService {
     }
 
     try {
-      Uint8List bytesToSend = jpegBytes;
-      if (jpegBytes.length > _maxPacketSize) {
-        print(
-          "⚠️ Frame quá lớn (${jpegBytes.length} bytes), giảm chất lượng...",
-        );
-        bytesToSend = await _reduceImageQuality(jpegBytes);
+      final chunkCount = max(
+        1,
+        (jpegBytes.length + _fragmentPayloadSize - 1) ~/ _fragmentPayloadSize,
+      );
+      if (chunkCount > 0xFFFF) {
+        print("⚠️ Frame quá lớn (${jpegBytes.length} bytes), bỏ qua");
+        return;
       }
 
-      _socket!.send(bytesToSend, InternetAddress(_serverHost), _serverPort);
+      // Chia frame thành nhiều gói, server ghép lại theo frame_id / offset
+      final address = InternetAddress(_serverHost);
+      _frameId = (_frameId + 1) & 0xFFFFFFFF;
+      for (int index = 0; index < chunkCount; index++) {
+        final offset = index * _fragmentPayloadSize;
+        final end = min(offset + _fragmentPayloadSize, jpegBytes.length);
+        final packet = Uint8List(_fragmentHeaderSize + end - offset);
+        final header = ByteData.view(packet.buffer);
+        packet[0] = 0x44; // 'D'
+        packet[1] = 0x46; // 'F'
+        header.setUint8(2, _fragmentVersion);
+        header.setUint8(3, binaryResponses ? _flagBinaryResponse : 0);
+        header.setUint32(4, _sequence);
+        header.setUint32(8, _frameId);
+        header.setUint16(12, index);
+        header.setUint16(14, chunkCount);
+        header.setUint32(16, jpegBytes.length);
+        header.setUint32(20, offset);
+        packet.setRange(_fragmentHeaderSize, packet.length, jpegBytes, offset);
+        _socket!.send(packet, address, _serverPort);
+        _sequence = (_sequence + 1) & 0xFFFFFFFF;
+      }
 
       // Chỉ in log mỗi 20 frame để giảm spam log
       if (DateTime.now().millisecond % 500 < 20) {
-        print("📸 Frame (${bytesToSend.length} bytes) đã gửi tới server");
+        print(
+          "📸 Frame (${jpegBytes.length} bytes, $chunkCount gói) đã gửi tới server",
+        );
       }
     } catch (e) {
       print("❌ Lỗi khi gửi frame UDP: $e");
@@ -99,17 +158,33 @@ class ApiUdpService {
   }
 
   // ===================================================================
-  // 🔹 GIẢM CHẤT LƯỢNG ẢNH NẾU QUÁ LỚN
+  // 🔹 GIẢI MÃ RESPONSE NHỊ PHÂN (cùng dạng Map với JSON)
   // ===================================================================
-  Future<Uint8List> _reduceImageQuality(Uint8List originalBytes) async {
-    try {
-      double scale = _maxPacketSize / originalBytes.length;
-      int newLength = (originalBytes.length * scale * 0.9).floor();
-      return Uint8List.fromList(originalBytes.sublist(0, newLength));
-    } catch (e) {
-      print("❌ Lỗi khi giảm chất lượng ảnh: $e");
-      return originalBytes;
+  Map<String, dynamic> _decodeBinaryResponse(Uint8List data) {
+    final view = ByteData.sublistView(data);
+    final tracked = (view.getUint8(1) & _responseFlagTrackIds) != 0;
+    final recordSize =
+        tracked ? _trackedDetectionRecordSize : _detectionRecordSize;
+    final count = view.getUint16(6);
+    final detections = <Map<String, dynamic>>[];
+    for (int i = 0; i < count; i++) {
+      final offset = _responseHeaderSize + i * recordSize;
+      final label = view.getUint8(offset);
+      detections.add({
+        "label": label < _vocClasses.length ? _vocClasses[label] : "unknown",
+        "score": view.getUint8(offset + 1) / 255.0,
+        "box": [
+          for (int k = 0; k < 4; k++)
+            view.getUint16(offset + 2 + 2 * k).toDouble(),
+        ],
+        if (tracked) "track_id": view.getUint32(offset + 10),
+      });
     }
+    return {
+      "frame_id": view.getUint32(2),
+      "object_count": count,
+      "detections": detections,
+    };
   }
 
   // ===================================================================